@@ -1,3 +1,14 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import OutboxEmail
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'dedupe_key')
+    exclude = ('mime',)
+    readonly_fields = ('last_error',)
+
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
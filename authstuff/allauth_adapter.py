@@ -10,3 +10,10 @@ class CustomAccountAdapter(DefaultAccountAdapter):
     def get_email_confirmation_url(self, request, emailconfirmation):
         # TODO: Set this properly if going into production
         return f'http://localhost:3000/confirm-email?token={emailconfirmation.key}'
+
+    def send_mail(self, template_prefix, email, context):
+        msg = self.render_mail(template_prefix, email, context)
+        # Confirmations are sent again on every login attempt, the outbox only sends one in a while (see mail.py)
+        if template_prefix.startswith('account/email/email_confirmation'):
+            msg.dedupe_key = f'email_confirmation:{email.lower()}'
+        msg.send()
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AuthstuffConfig(AppConfig):
     name = 'authstuff'
+
+    def ready(self):
+        from . import signals  # noqa: F401
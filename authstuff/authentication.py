@@ -0,0 +1,164 @@
+"""
+Token authentication which remembers the tokens it has seen, so authenticated requests don't query the Token
+and User tables every time.
+
+Tokens are kept in an in-process LRU cache for settings.AUTH_TOKEN_CACHE_TTL seconds, at most
+settings.AUTH_TOKEN_CACHE_SIZE of them. With settings.AUTH_TOKEN_SHARED_CACHE naming one of settings.CACHES,
+the tokens are kept there instead, so every process finds them without a query.
+
+The signals in authstuff.signals evict a token when it's deleted (on logout, and with its user) and a user's tokens
+when the user is saved (a password change, being deactivated) or deleted. An eviction only reaches the cache of the
+process it happens in, so with several processes configure the shared cache: a process' own cache would keep
+accepting a revoked token until it expires.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Per object caches of has_perm, which mustn't outlive a request
+_PERMISSION_CACHES = ('_perm_cache', '_user_perm_cache', '_group_perm_cache')
+
+
+class TokenCache:
+    def __init__(self, size=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL, shared=None):
+        self.size = size
+        self.ttl = ttl
+        # The alias of the shared cache in settings.CACHES, used instead of `entries` when set
+        self.shared = shared
+        # token key: (expiry, user, token), least recently used first
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _shared_cache(self):
+        return caches[self.shared] if self.shared else None
+
+    @staticmethod
+    def _shared_key(key):
+        # Tokens are credentials, the shared cache only sees their hash
+        return 'authtoken:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        """The (user, token) of a token key, copies the request can change freely, or None when it isn't cached."""
+        shared = self._shared_cache()
+        if shared is not None:
+            found = shared.get(self._shared_key(key))
+            with self.lock:
+                if found is None:
+                    self.misses += 1
+                    return None
+                self.shared_hits += 1
+            return _copies(*found)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return _copies(entry[1], entry[2])
+            self.misses += 1
+            return None
+
+    def put(self, key, user, token):
+        user, token = _copies(user, token)
+        token._state.fields_cache.pop('user', None)
+        shared = self._shared_cache()
+        if shared is not None:
+            shared.set(self._shared_key(key), (user, token), self.ttl)
+            return
+        with self.lock:
+            self._store(key, user, token)
+
+    def _store(self, key, user, token):
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, user, token)
+        self.user_keys.setdefault(user.pk, set()).add(key)
+        while len(self.entries) > self.size:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, user, _ = self.entries.pop(key)
+        keys = self.user_keys.get(user.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[user.pk]
+
+    def invalidate(self, keys):
+        """Forget the tokens with these keys."""
+        keys = list(keys)
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self._drop(key)
+        shared = self._shared_cache()
+        if shared is not None and keys:
+            shared.delete_many([self._shared_key(key) for key in keys])
+
+    def invalidate_user(self, user_id, keys=()):
+        """Forget the tokens of a user: the ones cached in this process, and `keys` (from the Token table)."""
+        with self.lock:
+            keys = set(keys) | self.user_keys.get(user_id, set())
+        self.invalidate(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+def _copies(user, token):
+    user, token = copy.copy(user), copy.copy(token)
+    for name in _PERMISSION_CACHES:
+        user.__dict__.pop(name, None)
+    token.user = user
+    return user, token
+
+
+token_cache = TokenCache(
+    size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', AUTH_TOKEN_CACHE_SIZE),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', AUTH_TOKEN_CACHE_TTL),
+    shared=getattr(settings, 'AUTH_TOKEN_SHARED_CACHE', None),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """DRF's TokenAuthentication, answering from `token_cache` when it can."""
+
+    def authenticate_credentials(self, key):
+        found = token_cache.get(key)
+        if found is not None:
+            return found
+        user, token = super().authenticate_credentials(key)
+        token_cache.put(key, user, token)
+        return user, token
@@ -0,0 +1,227 @@
+"""
+The e-mail outbox: requests queue their e-mails in the OutboxEmail table, and the send_outbox command sends them,
+so a slow mail server never holds a request up.
+
+settings.EMAIL_BACKEND is OutboxEmailBackend, which every e-mail goes through (allauth's confirmations, password
+resets, Django's send_mail), and settings.OUTBOX_EMAIL_BACKEND is the backend the worker really sends them with.
+The worker sends a batch at a time over one connection. Failed messages are retried with exponential backoff up to
+OUTBOX_MAX_ATTEMPTS times, then dead: kept with their last error until they are requeued. Permanent failures
+(5xx answers, every recipient refused) are dead straight away.
+
+Messages with a `dedupe_key` attribute are only queued once: while one with the same key is due, the newer one
+replaces it. When one is already taken by a worker (or waiting for a retry), or was sent less than
+OUTBOX_DEDUPE_WINDOW ago, the newer one is dropped. The confirmation
+e-mails sent again on every login attempt are deduplicated by address like that (see allauth_adapter).
+"""
+import email
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import EmailMessage, MIMEMixin
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+OUTBOX_BATCH_SIZE = 50
+# How long a worker has to send the batch it took before another worker can take the same messages
+OUTBOX_LEASE = timedelta(minutes=10)
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Queues the messages in the outbox instead of sending them."""
+
+    def send_messages(self, email_messages):
+        return sum(enqueue(message) is not None for message in email_messages)
+
+
+def enqueue(message):
+    """Queue an EmailMessage, returns its OutboxEmail or None when it was dropped as a duplicate."""
+    recipients = message.recipients()
+    if not recipients:
+        return None
+    now = timezone.now()
+    fields = {
+        'from_email': message.from_email or settings.DEFAULT_FROM_EMAIL,
+        'recipients': recipients,
+        'subject': str(message.subject)[:256],
+        'mime': message.message().as_bytes(),
+        'next_attempt_at': now,
+    }
+    key = getattr(message, 'dedupe_key', '')
+    if not key:
+        return OutboxEmail.objects.create(**fields)
+
+    if OutboxEmail.objects.filter(dedupe_key=key, status=OutboxEmail.Status.SENT,
+                                  sent_at__gt=now - settings.OUTBOX_DEDUPE_WINDOW).exists():
+        return None
+    # At most one message per key is pending, the newest one
+    for _ in range(2):
+        pending = OutboxEmail.objects.filter(dedupe_key=key, status=OutboxEmail.Status.PENDING).first()
+        if pending is not None:
+            # Only while it's due, a leased message is being sent as it was and must stay as it was
+            if not OutboxEmail.objects.filter(pk=pending.pk, status=OutboxEmail.Status.PENDING,
+                                              next_attempt_at__lte=now).update(**fields):
+                return None
+            for name, value in fields.items():
+                setattr(pending, name, value)
+            return pending
+        try:
+            with transaction.atomic():
+                return OutboxEmail.objects.create(dedupe_key=key, **fields)
+        except IntegrityError:
+            # Queued by another request in the meantime
+            continue
+    return None
+
+
+class _StoredMIME(MIMEMixin, email.message.Message):
+    pass
+
+
+class StoredEmailMessage(EmailMessage):
+    """An outbox message as the e-mail backends take it: its MIME message ready made."""
+
+    def __init__(self, outbox_email):
+        super().__init__(from_email=outbox_email.from_email)
+        self.outbox_email = outbox_email
+        self.stored_recipients = outbox_email.recipients
+
+    def recipients(self):
+        return self.stored_recipients
+
+    def message(self):
+        return email.message_from_bytes(bytes(self.outbox_email.mime), _class=_StoredMIME)
+
+
+class OutboxResult:
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        # The connection failure the run stopped on, if it did
+        self.error = None
+        self.start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self):
+        return self.sent / self.seconds if self.seconds else 0.0
+
+
+def claim_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """Take up to `batch_size` due messages, leased to this worker for OUTBOX_LEASE."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            status=OutboxEmail.Status.PENDING, next_attempt_at__lte=now).order_by('next_attempt_at', 'pk')[:batch_size])
+        OutboxEmail.objects.filter(pk__in=[message.pk for message in batch]).update(next_attempt_at=now + OUTBOX_LEASE)
+    return batch
+
+
+def send_outbox(connection=None, batch_size=OUTBOX_BATCH_SIZE, max_batches=None, on_batch=None):
+    """
+    Send the due messages, `batch_size` at a time, over `connection` (a new connection of OUTBOX_EMAIL_BACKEND by
+    default). `on_batch` is called with the result after every batch. Returns an OutboxResult.
+    When the connection fails, the message being sent counts it as a failed attempt and the run stops there:
+    the rest of the batch is put back untouched until the first retry, so an outage doesn't kill every message.
+    The error is left in the result's `error`.
+    """
+    if connection is None:
+        connection = get_connection(settings.OUTBOX_EMAIL_BACKEND)
+    result = OutboxResult()
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            batches += 1
+            try:
+                # Opened here, the backends close the connections they open themselves after every send
+                connection.open()
+            except Exception as error:
+                result.error = error
+                _put_back(batch)
+                break
+            broken = None
+            for i, message in enumerate(batch):
+                try:
+                    if not connection.send_messages([StoredEmailMessage(message)]):
+                        raise smtplib.SMTPException('The backend didn\'t send the message.')
+                except Exception as error:
+                    _failed(message, error, result)
+                    if not is_message_error(error):
+                        result.error = error
+                        broken = batch[i + 1:]
+                        break
+                else:
+                    # Right away, so a worker dying later in the batch can't send it again once the lease is over
+                    OutboxEmail.objects.filter(pk=message.pk).update(
+                        status=OutboxEmail.Status.SENT, sent_at=timezone.now(), last_error='')
+                    result.sent += 1
+            if on_batch is not None:
+                on_batch(result)
+            if broken is not None:
+                _put_back(broken)
+                break
+    finally:
+        _close(connection)
+    return result
+
+
+def _put_back(messages):
+    OutboxEmail.objects.filter(pk__in=[message.pk for message in messages]).update(
+        next_attempt_at=timezone.now() + timedelta(seconds=settings.OUTBOX_RETRY_DELAY))
+
+
+def is_message_error(error):
+    """Whether a sending error is about the message itself, the connection is still good for the others."""
+    if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError)):
+        return False
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException))
+
+
+def is_permanent_error(error):
+    """Whether sending the message again can't help."""
+    if not is_message_error(error):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _failed(message, error, result):
+    message.attempts += 1
+    message.last_error = f'{type(error).__name__}: {error}'
+    if is_permanent_error(error) or message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        message.status = OutboxEmail.Status.DEAD
+        result.dead += 1
+    else:
+        message.next_attempt_at = timezone.now() + timedelta(
+            seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1))
+        result.retried += 1
+    message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def requeue_dead():
+    """
+    Give the dead messages another round of attempts, returns how many there were. Deduplicated messages stay dead,
+    they are queued again when they are asked for again.
+    """
+    return OutboxEmail.objects.filter(status=OutboxEmail.Status.DEAD, dedupe_key='').update(
+        status=OutboxEmail.Status.PENDING, attempts=0, next_attempt_at=timezone.now())
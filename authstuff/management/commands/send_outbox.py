@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from authstuff.mail import OUTBOX_BATCH_SIZE, requeue_dead, send_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the e-mails waiting in the outbox with OUTBOX_EMAIL_BACKEND, retrying the ones which failed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE,
+                            help=f'How many e-mails to take from the outbox at a time (default {OUTBOX_BATCH_SIZE}).')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after this many batches instead of sending every due e-mail.')
+        parser.add_argument('--poll', type=float,
+                            help='Keep running, looking for new and retried e-mails every this many seconds.')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Give the e-mails which failed too many times another round of attempts first.')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write(f'Requeued {requeue_dead()} dead e-mails.')
+        while True:
+            result = send_outbox(batch_size=options['batch_size'], max_batches=options['max_batches'])
+            if result.sent or result.retried or result.dead or options['poll'] is None:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Sent {result.sent} e-mails, {result.retried} to retry, {result.dead} dead, '
+                    f'{result.rate:.1f} e-mails/s.'))
+            if result.error is not None:
+                self.stderr.write(f'Stopped early, the connection to the mail server failed: {result.error}')
+            if options['poll'] is None:
+                return
+            time.sleep(options['poll'])
@@ -0,0 +1,39 @@
+from django.db import models
+from django.db.models import Q
+
+
+class OutboxEmail(models.Model):
+    """
+    An e-mail waiting to be sent by the send_outbox command, or sent, or given up on (see authstuff.mail).
+    `mime` is the whole message as it will go out, `dedupe_key` groups the messages only worth sending once in a while.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        DEAD = 'dead', 'Dead'
+
+    class Meta:
+        indexes = [
+            # The due messages, for the worker
+            models.Index(fields=['status', 'next_attempt_at'], name='outboxemail_due_idx'),
+            models.Index(fields=['dedupe_key', 'status'], name='outboxemail_dedupe_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=Q(status='pending') & ~Q(dedupe_key=''),
+                                    name='unique_pending_outbox_email')
+        ]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    dedupe_key = models.CharField(max_length=256, blank=True)
+    from_email = models.CharField(max_length=256)
+    recipients = models.JSONField()
+    subject = models.CharField(max_length=256, blank=True)
+    mime = models.BinaryField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.recipients)} ({self.status})'
@@ -0,0 +1,132 @@
+"""
+Snapshots of the users' permissions, loaded in one query and kept across requests, so checking whether somebody
+is a matcher or a moderator doesn't load their user and group permissions on every request.
+
+Snapshots are kept in this process for settings.AUTH_PERMISSION_CACHE_TTL seconds, at most
+settings.AUTH_PERMISSION_CACHE_SIZE of them. With settings.AUTH_PERMISSION_SHARED_CACHE naming one of
+settings.CACHES, they are kept there instead, so every process sees the same snapshots.
+
+The signals in authstuff.signals drop them when a user's groups or permissions, or a group's permissions, change.
+That only reaches the cache of the process it happens in, so with several processes and no shared cache, the others
+go on with the old permissions for up to the TTL: a user taken out of the moderators stays one until then.
+A shared cache can't list its keys, so dropping every snapshot there moves on a generation number the snapshots
+are stored with instead.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.db.models import Q
+
+AUTH_PERMISSION_CACHE_SIZE = 10000
+AUTH_PERMISSION_CACHE_TTL = 300
+
+GENERATION_KEY = 'authperms:generation'
+
+
+class PermissionCache:
+    def __init__(self, size=AUTH_PERMISSION_CACHE_SIZE, ttl=AUTH_PERMISSION_CACHE_TTL, shared=None):
+        self.size = size
+        self.ttl = ttl
+        # The alias of the shared cache in settings.CACHES, used instead of `entries` when set
+        self.shared = shared
+        # user id: (expiry, frozenset of 'app_label.codename'), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _shared_cache(self):
+        return caches[self.shared] if self.shared else None
+
+    @staticmethod
+    def _shared_key(user_id):
+        return f'authperms:user:{user_id}'
+
+    def get(self, user):
+        """The permissions `user` has directly or through their groups, like ModelBackend.get_all_permissions."""
+        shared = self._shared_cache()
+        if shared is not None:
+            # The snapshot and the generation it has to be from in one round trip
+            found = shared.get_many([GENERATION_KEY, self._shared_key(user.pk)])
+            generation = found.get(GENERATION_KEY, 0)
+            entry = found.get(self._shared_key(user.pk))
+            with self.lock:
+                if entry is not None and entry[0] == generation:
+                    self.shared_hits += 1
+                    return entry[1]
+                self.misses += 1
+            permissions = self._load(user)
+            shared.set(self._shared_key(user.pk), (generation, permissions), self.ttl)
+            return permissions
+
+        with self.lock:
+            entry = self.entries.get(user.pk)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(user.pk)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        permissions = self._load(user)
+        with self.lock:
+            self.entries[user.pk] = (time.monotonic() + self.ttl, permissions)
+            self.entries.move_to_end(user.pk)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return permissions
+
+    @staticmethod
+    def _load(user):
+        return frozenset(f'{app_label}.{codename}' for app_label, codename in Permission.objects.filter(
+            Q(user=user) | Q(group__user=user)).values_list('content_type__app_label', 'codename').distinct())
+
+    def invalidate(self, user_ids):
+        user_ids = list(user_ids)
+        with self.lock:
+            for user_id in user_ids:
+                self.entries.pop(user_id, None)
+        shared = self._shared_cache()
+        if shared is not None and user_ids:
+            shared.delete_many([self._shared_key(user_id) for user_id in user_ids])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        shared = self._shared_cache()
+        if shared is not None:
+            try:
+                shared.incr(GENERATION_KEY)
+            except ValueError:
+                # Not there yet (or evicted), the snapshots stored without one are from generation 0
+                shared.add(GENERATION_KEY, 1, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {'size': len(self.entries), 'hits': self.hits, 'shared_hits': self.shared_hits,
+                    'misses': self.misses,
+                    'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0}
+
+
+permission_cache = PermissionCache(
+    size=getattr(settings, 'AUTH_PERMISSION_CACHE_SIZE', AUTH_PERMISSION_CACHE_SIZE),
+    ttl=getattr(settings, 'AUTH_PERMISSION_CACHE_TTL', AUTH_PERMISSION_CACHE_TTL),
+    shared=getattr(settings, 'AUTH_PERMISSION_SHARED_CACHE', None),
+)
+
+
+def has_perm(user, perm):
+    """user.has_perm(perm) from the user's snapshot. The rest of the request's has_perm calls use it too."""
+    if not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    permissions = permission_cache.get(user)
+    # Where ModelBackend looks for the permissions it already loaded
+    user._perm_cache = set(permissions)
+    return perm in permissions
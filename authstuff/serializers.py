@@ -2,28 +2,31 @@ from rest_framework import serializers, exceptions
 from rest_framework.authtoken.models import Token
 
 from dj_rest_auth.serializers import LoginSerializer as DRALoginSerializer
+from dj_rest_auth.serializers import PasswordChangeSerializer as DRAPasswordChangeSerializer
+from dj_rest_auth.serializers import PasswordResetConfirmSerializer as DRAPasswordResetConfirmSerializer
 from dj_rest_auth.registration.serializers import RegisterSerializer as DRARegisterSerializer
 
 from allauth.account.utils import _has_verified_for_login, send_email_confirmation
 
 from django.contrib.auth.models import User
 
+from .permissions import has_perm
+
 # from matching.serializers import MatchingEntrySerializer
 
 
-# TODO: Make it so that when you change your password your tokens are changed
 class UserDetailsSerializer(serializers.ModelSerializer):
     # matching_entry = MatchingEntrySerializer(allow_null=True)
 
     is_matcher = serializers.SerializerMethodField()
 
     def get_is_matcher(self, user):
-        return user.has_perm('matching.is_matcher')
+        return has_perm(user, 'matching.is_matcher')
 
     is_moderator = serializers.SerializerMethodField()
 
     def get_is_moderator(self, user):
-        return user.has_perm('matching.is_moderator')
+        return has_perm(user, 'matching.is_moderator')
 
     class Meta:
         model = User
@@ -68,6 +71,25 @@ class RegisterSerializer(DRARegisterSerializer):
         }
 
 
+def rotate_token(user):
+    """Delete the user's tokens, so the ones handed out with the old password stop working, and make a new one."""
+    Token.objects.filter(user=user).delete()
+    return Token.objects.create(user=user)
+
+
+class PasswordChangeSerializer(DRAPasswordChangeSerializer):
+    def save(self):
+        super().save()
+        self.token = rotate_token(self.user)
+
+
+class PasswordResetConfirmSerializer(DRAPasswordResetConfirmSerializer):
+    def save(self):
+        result = super().save()
+        self.token = rotate_token(self.user)
+        return result
+
+
 class UserDeleteSerializer(serializers.Serializer):
     old_password = serializers.CharField(max_length=128)
 
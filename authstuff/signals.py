@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .permissions import permission_cache
+
+
+def _invalidate(function, *args):
+    # Now, and once more after the commit, in case a request cached the old rows in between
+    function(*args)
+    transaction.on_commit(lambda: function(*args))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    _invalidate(token_cache.invalidate, [instance.key])
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    # A deleted user's tokens went first and were invalidated one by one. The shared cache only knows the tokens'
+    # hashes, so their keys come from the Token table, without it this process' own cache knows them
+    keys = ()
+    if kwargs['signal'] is post_save and token_cache.shared:
+        keys = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+    _invalidate(token_cache.invalidate_user, instance.pk, keys)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    _invalidate(permission_cache.invalidate, [instance.pk])
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _invalidate(permission_cache.invalidate, [instance.pk])
+    elif pk_set is None:
+        # A group or permission was taken from everybody, who isn't known any more
+        _invalidate(permission_cache.clear)
+    else:
+        _invalidate(permission_cache.invalidate, list(pk_set))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate(permission_cache.clear)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def permissions_deleted(sender, **kwargs):
+    _invalidate(permission_cache.clear)
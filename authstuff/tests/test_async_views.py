@@ -0,0 +1,67 @@
+import asyncio
+import threading
+from types import ModuleType
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.urls import path
+from rest_framework.authtoken.models import Token
+
+from parallel_peaks_back import async_views
+
+from ..authentication import token_cache
+from ..permissions import permission_cache
+from ..views import UserDetailsView
+
+
+class ThreadNotingView(UserDetailsView):
+    # The names of the threads the requests were answered on
+    threads = []
+
+    def get(self, request, *args, **kwargs):
+        ThreadNotingView.threads.append(threading.current_thread().name)
+        return super().get(request, *args, **kwargs)
+
+
+def urlconf():
+    # The views are made async when the urls are, so with the setting on
+    urls = ModuleType('async_view_urls')
+    urls.urlpatterns = [path('user', ThreadNotingView.as_view())]
+    return urls
+
+
+# The pool threads query the database, so the test data has to be committed
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        token_cache.clear()
+        permission_cache.clear()
+        ThreadNotingView.threads = []
+        self.user = User.objects.create(username='someone', email='someone@example.com')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_sync_without_setting(self):
+        with override_settings(ASYNC_VIEWS=False):
+            self.assertFalse(asyncio.iscoroutinefunction(ThreadNotingView.as_view()))
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertTrue(asyncio.iscoroutinefunction(ThreadNotingView.as_view()))
+
+    def test_answered_on_pool(self):
+        with override_settings(ASYNC_VIEWS=True):
+            urls = urlconf()
+
+        async def get_many():
+            # Django 3.2's AsyncClient sends its extra arguments as the request's headers, not as META
+            return await asyncio.gather(*(AsyncClient().get('/user', authorization=f'Token {self.token.key}')
+                                          for _ in range(4)))
+
+        with override_settings(ROOT_URLCONF=urls):
+            responses = asyncio.run(get_many())
+            anonymous = asyncio.run(AsyncClient().get('/user'))
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['username'], 'someone')
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(len(ThreadNotingView.threads), 4)
+        self.assertTrue(all(name.startswith('async-view') for name in ThreadNotingView.threads))
+        self.assertEqual(async_views.get_executor()._max_workers, settings.ASYNC_VIEW_THREADS)
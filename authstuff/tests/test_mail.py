@@ -0,0 +1,105 @@
+import smtplib
+from datetime import timedelta
+
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..mail import OUTBOX_LEASE, claim_batch, enqueue, send_outbox
+from ..models import OutboxEmail
+
+
+def message(subject='Hello', to='someone@example.com', dedupe_key=''):
+    message = EmailMessage(subject, 'Body', 'from@example.com', [to])
+    if dedupe_key:
+        message.dedupe_key = dedupe_key
+    return message
+
+
+class FakeConnection:
+    """Sends by remembering, failing on the subjects in `fail` with the error given for them."""
+
+    def __init__(self, fail=None):
+        self.fail = fail or {}
+        self.sent = []
+        # The statuses of the messages sent before, when each message was sent
+        self.seen = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for message in messages:
+            subject = message.outbox_email.subject
+            self.seen.append(dict(OutboxEmail.objects.filter(subject__in=self.sent).values_list('subject', 'status')))
+            if subject in self.fail:
+                raise self.fail[subject]
+            self.sent.append(subject)
+        return len(messages)
+
+
+@override_settings(OUTBOX_RETRY_DELAY=60, OUTBOX_MAX_ATTEMPTS=3, OUTBOX_DEDUPE_WINDOW=timedelta(minutes=3))
+class OutboxTests(TestCase):
+    def test_dedupe_replaces_due_message(self):
+        first = enqueue(message('First', dedupe_key='confirm:someone'))
+        second = enqueue(message('Second', dedupe_key='confirm:someone'))
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(list(OutboxEmail.objects.values_list('subject', flat=True)), ['Second'])
+
+    def test_dedupe_leaves_leased_message(self):
+        enqueue(message('First', dedupe_key='confirm:someone'))
+        self.assertEqual(len(claim_batch()), 1)
+        lease = OutboxEmail.objects.get().next_attempt_at
+        self.assertIsNone(enqueue(message('Second', dedupe_key='confirm:someone')))
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.subject, queued.next_attempt_at), ('First', lease))
+
+    def test_dedupe_drops_recently_sent(self):
+        enqueue(message('First', dedupe_key='confirm:someone'))
+        send_outbox(connection=FakeConnection())
+        self.assertIsNone(enqueue(message('Second', dedupe_key='confirm:someone')))
+        OutboxEmail.objects.update(sent_at=timezone.now() - timedelta(minutes=5))
+        self.assertIsNotNone(enqueue(message('Third', dedupe_key='confirm:someone')))
+
+    def test_without_key_every_message_queued(self):
+        enqueue(message())
+        enqueue(message())
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+
+    def test_lease_expiry(self):
+        enqueue(message())
+        self.assertEqual(len(claim_batch()), 1)
+        # Another worker can't take it while the first one holds the lease
+        self.assertEqual(claim_batch(), [])
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(claim_batch()), 1)
+        self.assertGreater(OutboxEmail.objects.get().next_attempt_at, timezone.now() + OUTBOX_LEASE / 2)
+
+    def test_marked_sent_as_sent(self):
+        for subject in ('One', 'Two', 'Three'):
+            enqueue(message(subject))
+        connection = FakeConnection()
+        result = send_outbox(connection=connection)
+        self.assertEqual(result.sent, 3)
+        self.assertEqual(connection.seen, [{}, {'One': 'sent'}, {'One': 'sent', 'Two': 'sent'}])
+
+    def test_broken_connection_puts_rest_back(self):
+        for subject in ('One', 'Two', 'Three'):
+            enqueue(message(subject))
+        result = send_outbox(connection=FakeConnection(fail={'Two': smtplib.SMTPServerDisconnected('gone')}))
+        self.assertEqual((result.sent, result.retried), (1, 1))
+        self.assertIsInstance(result.error, smtplib.SMTPServerDisconnected)
+        statuses = dict(OutboxEmail.objects.values_list('subject', 'status'))
+        self.assertEqual(statuses, {'One': 'sent', 'Two': 'pending', 'Three': 'pending'})
+        self.assertEqual(OutboxEmail.objects.get(subject='Three').attempts, 0)
+        self.assertEqual(claim_batch(), [])
+
+    def test_permanent_failure_dead(self):
+        enqueue(message('One'))
+        error = smtplib.SMTPRecipientsRefused({'someone@example.com': (550, b'No such user')})
+        result = send_outbox(connection=FakeConnection(fail={'One': error}))
+        self.assertEqual(result.dead, 1)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.Status.DEAD)
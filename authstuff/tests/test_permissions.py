@@ -0,0 +1,112 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from ..permissions import PermissionCache, has_perm, permission_cache
+
+SHARED_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'permissions'}}
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        permission_cache.clear()
+        self.user = User.objects.create(username='someone')
+        self.matcher = Permission.objects.get(codename='is_matcher')
+        self.moderator = Permission.objects.get(codename='is_moderator')
+        self.matchers = Group.objects.create(name='Matchers')
+        self.matchers.permissions.add(self.matcher)
+
+    def has_perm(self, perm):
+        # A user loaded again, as by the next request
+        return has_perm(User.objects.get(pk=self.user.pk), perm)
+
+    def test_query_count(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(has_perm(self.user, 'matching.is_matcher'))
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(has_perm(user, 'matching.is_matcher'))
+            self.assertFalse(has_perm(user, 'matching.is_moderator'))
+            # The rest of the request's permission checks use the snapshot too
+            self.assertFalse(user.has_perm('matching.is_moderator'))
+
+    def test_inactive_and_superuser_without_query(self):
+        superuser = User.objects.create(username='admin', is_superuser=True)
+        inactive = User.objects.create(username='gone', is_active=False)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_perm(superuser, 'matching.is_moderator'))
+            self.assertFalse(has_perm(inactive, 'matching.is_matcher'))
+
+    def test_user_groups_changed(self):
+        self.assertFalse(self.has_perm('matching.is_matcher'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.matchers)
+        self.assertTrue(self.has_perm('matching.is_matcher'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.matchers.user_set.remove(self.user)
+        self.assertFalse(self.has_perm('matching.is_matcher'))
+
+    def test_user_permissions_changed(self):
+        self.assertFalse(self.has_perm('matching.is_moderator'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(self.moderator)
+        self.assertTrue(self.has_perm('matching.is_moderator'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.moderator.user_set.clear()
+        self.assertFalse(self.has_perm('matching.is_moderator'))
+
+    def test_group_permissions_changed(self):
+        self.user.groups.add(self.matchers)
+        self.assertFalse(self.has_perm('matching.is_moderator'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.matchers.permissions.add(self.moderator)
+        self.assertTrue(self.has_perm('matching.is_moderator'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.matchers.delete()
+        self.assertFalse(self.has_perm('matching.is_matcher'))
+        self.assertFalse(self.has_perm('matching.is_moderator'))
+
+    def test_expiry_and_size(self):
+        cache = PermissionCache(size=1, ttl=0)
+        self.assertEqual(cache.get(self.user), frozenset())
+        cache.get(self.user)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        cache = PermissionCache(size=1)
+        other = User.objects.create(username='other')
+        cache.get(self.user)
+        cache.get(other)
+        self.assertEqual(list(cache.entries), [other.pk])
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SharedPermissionCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create(username='someone')
+        self.user.user_permissions.add(Permission.objects.get(codename='is_matcher'))
+        # Two processes' caches sharing one cache
+        self.here, self.there = PermissionCache(shared='default'), PermissionCache(shared='default')
+
+    def test_shared(self):
+        self.assertEqual(self.here.get(self.user), frozenset({'matching.is_matcher'}))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.there.get(self.user), frozenset({'matching.is_matcher'}))
+        self.assertEqual(self.there.stats()['shared_hits'], 1)
+        self.assertEqual(len(self.here.entries), 0)
+
+    def test_invalidated_in_another_process(self):
+        self.here.get(self.user)
+        self.user.user_permissions.clear()
+        self.there.invalidate([self.user.pk])
+        self.assertEqual(self.here.get(self.user), frozenset())
+
+    def test_cleared_in_another_process(self):
+        self.here.get(self.user)
+        self.user.user_permissions.clear()
+        self.there.clear()
+        self.assertEqual(self.here.get(self.user), frozenset())
+        # Without the signals, the snapshot stays until the next clear
+        self.user.user_permissions.add(Permission.objects.get(codename='is_moderator'))
+        self.assertEqual(self.there.get(self.user), frozenset())
+        self.here.clear()
+        self.assertEqual(self.there.get(self.user), frozenset({'matching.is_moderator'}))
@@ -0,0 +1,90 @@
+from allauth.account.forms import default_token_generator
+from allauth.account.utils import user_pk_to_url_str
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ..authentication import TokenCache, token_cache
+from ..permissions import permission_cache
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+SHARED_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens'}}
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        permission_cache.clear()
+        self.user = User.objects.create_user('someone', 'someone@example.com', 'old password 123')
+        self.token = Token.objects.create(user=self.user)
+
+    def client_with(self, key):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return client
+
+    def test_token_cached(self):
+        client = self.client_with(self.token.key)
+        self.assertEqual(client.get('/api/auth/user').status_code, 200)
+        hits = token_cache.hits
+        self.assertEqual(client.get('/api/auth/user').status_code, 200)
+        self.assertEqual(token_cache.hits, hits + 1)
+
+    def test_password_change_revokes_token(self):
+        client = self.client_with(self.token.key)
+        self.assertEqual(client.get('/api/auth/user').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/auth/password/change', {
+                'old_password': 'old password 123', 'new_password1': 'new password 456',
+                'new_password2': 'new password 456'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['token'], self.token.key)
+        self.assertEqual(client.get('/api/auth/user').status_code, 401)
+        self.assertEqual(self.client_with(response.data['token']).get('/api/auth/user').status_code, 200)
+
+    def test_password_reset_rotates_token(self):
+        self.assertEqual(self.client_with(self.token.key).get('/api/auth/user').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/auth/password/reset/confirm', {
+                'uid': user_pk_to_url_str(self.user),
+                'token': default_token_generator.make_token(self.user),
+                'new_password1': 'new password 456', 'new_password2': 'new password 456'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client_with(self.token.key).get('/api/auth/user').status_code, 401)
+        self.assertTrue(Token.objects.filter(user=self.user).exclude(key=self.token.key).exists())
+
+    def test_logout_revokes_token(self):
+        client = self.client_with(self.token.key)
+        self.assertEqual(client.get('/api/auth/user').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/auth/logout')
+        self.assertEqual(client.get('/api/auth/user').status_code, 401)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SharedTokenCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create(username='someone')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_revoked_in_another_process(self):
+        # Two processes' caches sharing one cache
+        here, there = TokenCache(shared='default'), TokenCache(shared='default')
+        here.put(self.token.key, self.user, self.token)
+        self.assertEqual(there.get(self.token.key)[0].pk, self.user.pk)
+        here.get(self.token.key)
+        there.invalidate_user(self.user.pk, [self.token.key])
+        self.assertIsNone(here.get(self.token.key))
+        self.assertEqual(len(here.entries), 0)
+
+    def test_copies(self):
+        cache = TokenCache(shared='default')
+        cache.put(self.token.key, self.user, self.token)
+        user, token = cache.get(self.token.key)
+        user.username = 'changed'
+        self.assertEqual(cache.get(self.token.key)[0].username, 'someone')
+        self.assertIs(token.user, user)
@@ -1,10 +1,9 @@
 from django.urls import path, re_path
 
-from dj_rest_auth.views import (LoginView, LogoutView, PasswordChangeView,
-                                PasswordResetConfirmView, PasswordResetView)
+from dj_rest_auth.views import LoginView, LogoutView, PasswordResetConfirmView, PasswordResetView
 from dj_rest_auth.registration.views import RegisterView, VerifyEmailView
 
-from .views import UserDetailsView, CSRFView, UserDeleteView
+from .views import UserDetailsView, CSRFView, UserDeleteView, PasswordChangeView, TokenCacheStatsView
 
 from rest_framework.urlpatterns import format_suffix_patterns
 
@@ -19,6 +18,7 @@ urlpatterns = [
     path('user', UserDetailsView.as_view(), name='rest_user_details'),
     path('user/delete', UserDeleteView.as_view(), name='rest_user_delete'),
     path('password/change', PasswordChangeView.as_view(), name='rest_password_change'),
+    path('token-cache', TokenCacheStatsView.as_view(), name='token_cache_stats'),
     # Register views
     path('register', RegisterView.as_view(), name='rest_register'),
     path('verify-email', VerifyEmailView.as_view(), name='rest_verify_email'),
@@ -3,10 +3,16 @@ from rest_framework.response import Response
 
 from django.middleware.csrf import get_token
 
+from dj_rest_auth.views import PasswordChangeView as DRAPasswordChangeView
+
+from parallel_peaks_back.async_views import AsyncViewMixin
+
+from .authentication import token_cache
+from .permissions import permission_cache
 from .serializers import UserDetailsSerializer, UserDeleteSerializer
 
 
-class UserDetailsView(generics.RetrieveAPIView):
+class UserDetailsView(AsyncViewMixin, generics.RetrieveAPIView):
     serializer_class = UserDetailsSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -36,3 +42,22 @@ class UserDeleteView(views.APIView):
         serializer.is_valid(raise_exception=True)
         self.request.user.delete()
         return Response({"detail": "User deleted. (No takebacksies)."})
+
+
+class PasswordChangeView(DRAPasswordChangeView):
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({
+            'detail': 'New password has been saved.',
+            'token': serializer.token.key
+        })
+
+
+class TokenCacheStatsView(views.APIView):
+    """The hit rates of this process' token and permission caches."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(dict(token_cache.stats(), permissions=permission_cache.stats()))
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import MatchingEntry
+from django.utils import timezone
+
+from authstuff.permissions import has_perm
+from .models import MatchingEntry, MatchingSuggestion
 
 
 class MatchingEntryAdmin(admin.ModelAdmin):
@@ -9,4 +12,36 @@ class MatchingEntryAdmin(admin.ModelAdmin):
         return obj.user.username
 
 
+class MatchingSuggestionAdmin(admin.ModelAdmin):
+    list_display = ('members', 'score', 'status', 'suggested_by', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('entry_1__user', 'entry_2__user', 'entry_3__user', 'suggested_by')
+    raw_id_fields = ('entry_1', 'entry_2', 'entry_3')
+    readonly_fields = ('reviewed_by', 'reviewed_at')
+    actions = ('approve', 'reject')
+
+    def members(self, obj):
+        entries = [obj.entry_1, obj.entry_2, obj.entry_3]
+        return ', '.join(entry.user.username for entry in entries if entry is not None)
+
+    def has_moderate_permission(self, request):
+        return has_perm(request.user, 'matching.is_moderator')
+
+    def _review(self, request, queryset, status):
+        updated = queryset.update(status=status, reviewed_by=request.user, reviewed_at=timezone.now())
+        self.message_user(request, f'{updated} suggestion(s) marked as {status.label.lower()}.')
+
+    @admin.action(description='Approve selected suggestions', permissions=['moderate'])
+    def approve(self, request, queryset):
+        entry_ids = queryset.entry_ids()
+        self._review(request, queryset, MatchingSuggestion.Status.APPROVED)
+        # Matched entries leave the round, flagged so refresh_candidates --stale takes them off everybody's candidates
+        MatchingEntry.objects.filter(pk__in=entry_ids).mark_candidates_stale()
+
+    @admin.action(description='Reject selected suggestions', permissions=['moderate'])
+    def reject(self, request, queryset):
+        self._review(request, queryset, MatchingSuggestion.Status.REJECTED)
+
+
 admin.site.register(MatchingEntry, MatchingEntryAdmin)
+admin.site.register(MatchingSuggestion, MatchingSuggestionAdmin)
@@ -0,0 +1,98 @@
+import numpy as np
+
+from ..models import MatchingEntry
+from . import bitsets
+from .text_index import TEXT_FIELDS, get_text_index
+
+# Talkativity preferences are stored as small integer codes so that the scoring can compare them with array operations
+TALKING = 0
+REC_ONLY = 1
+NETWORKING = 2
+
+TALKATIVITY_CODES = {
+    MatchingEntry.TalkativityPreference.PREFERS_TALKING: TALKING,
+    MatchingEntry.TalkativityPreference.PREFERS_RECOMMENDATION_ONLY: REC_ONLY,
+    MatchingEntry.TalkativityPreference.PREFERS_NETWORKING: NETWORKING,
+}
+
+
+class EntryArrays:
+    """
+    Every entry of a round loaded into NumPy arrays, one row per entry.
+
+    Row `i` of every array belongs to the entry whose primary key is `ids[i]`.
+    `album_tags` and `match_tags` are 0/1 float32 matrices with one column per tag somebody in the round has, column
+    `c` being the Tag with the id `tag_keys[c]`. They hold the tags describing the album and the tags the person
+    wants in a match respectively.
+    They are float32 so that tag overlaps can be counted with a BLAS matrix product, counts stay exact below 2**24.
+    `text` holds the TF-IDF vectors of the entries' texts (see engine.text_index), or None to score without them.
+    """
+
+    def __init__(self, ids, talkativity, minds_talking, minds_not_talking, adventurous, person_above_adventure,
+                 triplet, album_tags, match_tags, tag_keys, text=None):
+        self.ids = ids
+        self.talkativity = talkativity
+        self.minds_talking = minds_talking
+        self.minds_not_talking = minds_not_talking
+        self.adventurous = adventurous
+        self.person_above_adventure = person_above_adventure
+        self.triplet = triplet
+        self.album_tags = album_tags
+        self.match_tags = match_tags
+        self.tag_keys = tag_keys
+        self.text = text
+
+        self.album_tag_counts = album_tags.sum(axis=1)
+        self.match_tag_counts = match_tags.sum(axis=1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_queryset(cls, queryset=None, text=True):
+        """
+        Load the entries in `queryset` (all entries by default) in a single query.
+        The tags come from the entries' tag bitsets, so building the tag matrices never touches MatchingTag.
+        With `text`, the process wide text index is brought up to date with the entries' texts from the same query,
+        in memory: saving it is up to the caller (see text_index.save_text_index).
+        """
+        if queryset is None:
+            queryset = MatchingEntry.objects.all()
+
+        rows = list(queryset.order_by('pk').values_list(
+            'pk', 'talkativity_preference', 'minds_talking', 'minds_not_talking',
+            'adventurous', 'person_above_adventure', 'triplet', 'album_tag_bits', 'match_tag_bits',
+            *(TEXT_FIELDS if text else ())
+        ))
+        n = len(rows)
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=n)
+        talkativity = np.fromiter((TALKATIVITY_CODES[row[1]] for row in rows), dtype=np.int8, count=n)
+        columns = [np.fromiter((row[col] for row in rows), dtype=np.int8, count=n) for col in range(2, 6)]
+        triplet = np.fromiter((row[6] for row in rows), dtype=bool, count=n)
+
+        text_vectors = None
+        if text:
+            index = get_text_index()
+            index.update((row[0], *row[9:]) for row in rows)
+            text_vectors = index.text_vectors(ids.tolist())
+
+        return cls.from_columns(ids, talkativity, columns, triplet, bitsets.to_words([row[7] for row in rows]),
+                                bitsets.to_words([row[8] for row in rows]), text_vectors)
+
+    @classmethod
+    def from_columns(cls, ids, talkativity, columns, triplet, album_words, match_words, text=None):
+        """
+        Build the arrays from columns already loaded: talkativity as codes, the four 0-5 answers in `columns`
+        and the tag bitsets as N x words uint64 matrices (see engine.bitsets).
+        """
+        album_rows, album_ids = bitsets.set_bits(album_words)
+        match_rows, match_ids = bitsets.set_bits(match_words)
+
+        # Only the tags somebody in the round has get a column, however high their ids
+        tag_keys = np.union1d(album_ids, match_ids)
+        album_tags = np.zeros((len(ids), len(tag_keys)), dtype=np.float32)
+        album_tags[album_rows, np.searchsorted(tag_keys, album_ids)] = 1
+        match_tags = np.zeros((len(ids), len(tag_keys)), dtype=np.float32)
+        match_tags[match_rows, np.searchsorted(tag_keys, match_ids)] = 1
+
+        return cls(ids, talkativity, *columns, triplet, album_tags, match_tags, tag_keys, text)
@@ -0,0 +1,48 @@
+"""
+Tag bitsets, bit `i` is set when the tag with id `i` is present.
+
+They are stored as little endian uint64 words, as many as the entry's highest tag id needs, so they grow with the
+vocabulary: a tag added late (a microgenre, a Last.fm tag) has a high id. Rounds never unpack them into one column
+per tag id, `set_bits` only reads the non-zero words and EntryArrays gives the tags of the round dense columns.
+"""
+import numpy as np
+
+WORD = np.dtype('<u8')
+
+
+def pack(tag_ids):
+    """The bitset (as bytes) with the bits of `tag_ids` set."""
+    tag_ids = np.asarray(list(tag_ids), dtype=np.int64)
+    if not len(tag_ids):
+        return b''
+    words = np.zeros(tag_ids.max() // 64 + 1, dtype=WORD)
+    np.bitwise_or.at(words, tag_ids // 64, np.left_shift(np.uint64(1), (tag_ids % 64).astype(np.uint64)))
+    return words.tobytes()
+
+
+def unpack(bits):
+    """The tag ids set in a bitset."""
+    return np.flatnonzero(np.unpackbits(np.frombuffer(bits, dtype=np.uint8), bitorder='little'))
+
+
+def to_words(bitsets):
+    """Stack bitsets of any length into an N x words uint64 array, padding them with zeros."""
+    n_words = max((len(bits) // WORD.itemsize for bits in bitsets), default=0)
+    words = np.zeros((len(bitsets), n_words), dtype=WORD)
+    for i, bits in enumerate(bitsets):
+        if len(bits):
+            row = np.frombuffer(bits, dtype=WORD)
+            words[i, :len(row)] = row
+    return words
+
+
+def set_bits(words):
+    """
+    The bits set in N x words uint64 bitsets as two arrays, the row and the tag id of each, unpacking only the
+    words which aren't zero.
+    """
+    rows, cols = np.nonzero(words)
+    bits = np.unpackbits(words[rows, cols].astype(WORD).view(np.uint8).reshape(-1, WORD.itemsize), axis=1,
+                         bitorder='little')
+    found, bit = np.nonzero(bits)
+    return rows[found], cols[found] * 64 + bit
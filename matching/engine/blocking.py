@@ -0,0 +1,105 @@
+"""
+Blocking, so that only the pairs of entries whose macrogenres are compatible get scored instead of all N x N.
+
+A pair is compatible when one of them recommends an album in a macrogenre the other asked for in
+`match_macrogenre`. Entries are put in blocks by their album's macrogenre, and for every macrogenre the entries
+who want it are scored against its block. Scores are symmetric, so each block also gives the scores the other
+way round, which makes the work the sum over macrogenres of (entries wanting it) x (albums in it).
+
+Somebody with too few compatible entries (fewer than `min_candidates`), or without an album macrogenre or
+macrogenre wishes, falls back to being scored against everyone.
+
+Blocking cuts the scoring down, and BlockScores only keeps the scored tiles. The round solver still needs a
+dense N x N matrix (see rounds.solve_round), so when solving a round it saves time, not memory.
+"""
+import numpy as np
+
+from ..models import Tag
+from .parallel import DEFAULT_TILE_SIZE, map_blocks
+from .scoring import parts_block
+
+DEFAULT_MIN_CANDIDATES = 50
+
+
+class Blocking:
+    """
+    The blocks of a round, as (rows, cols) pairs of index arrays into its EntryArrays: the rows of each block are
+    scored against its cols. The last block holds the fallback rows, scored against everyone.
+    """
+
+    def __init__(self, arrays, macrogenre_tags, min_candidates=DEFAULT_MIN_CANDIDATES):
+        n = len(arrays)
+        genre_cols = np.flatnonzero(np.isin(arrays.tag_keys, macrogenre_tags))
+        album = arrays.album_tags[:, genre_cols] > 0
+        wants = arrays.match_tags[:, genre_cols] > 0
+
+        self.blocks = [(np.flatnonzero(wants[:, g]), np.flatnonzero(album[:, g])) for g in range(len(genre_cols))]
+        # Compatible entries of each row, counting the mutually compatible ones twice which is fine for a threshold
+        compatible = wants.astype(np.int64) @ album.sum(axis=0) + album.astype(np.int64) @ wants.sum(axis=0)
+        self.fallback = np.flatnonzero((compatible < min_candidates) | ~album.any(axis=1) | ~wants.any(axis=1))
+        if len(self.fallback):
+            self.blocks.append((self.fallback, np.arange(n)))
+        self.blocks = [(rows, cols) for rows, cols in self.blocks if len(rows) and len(cols)]
+        self.n = n
+
+    @classmethod
+    def for_arrays(cls, arrays, min_candidates=DEFAULT_MIN_CANDIDATES):
+        macrogenre_tags = Tag.objects.filter(tagtype=Tag.TagType.MACROGENRE).values_list('pk', flat=True)
+        return cls(arrays, np.fromiter(macrogenre_tags, dtype=np.int64), min_candidates)
+
+    @property
+    def scored_pairs(self):
+        """
+        Ordered pairs of different entries scored by the blocks, like `all_pairs`. Pairs scored twice (mutually
+        compatible or in the fallback) count twice.
+        """
+        return sum(len(rows) * len(cols) - len(np.intersect1d(rows, cols)) for rows, cols in self.blocks)
+
+    @property
+    def all_pairs(self):
+        """Ordered pairs of different entries, which is what scoring everyone against everyone scores."""
+        return self.n * (self.n - 1)
+
+    @property
+    def reduction(self):
+        """How many times fewer pairs are scored than without blocking."""
+        return self.all_pairs / self.scored_pairs if self.scored_pairs else float('inf')
+
+    def tiles(self, tile_size):
+        """The blocks split into tiles of at most `tile_size` rows."""
+        for rows, cols in self.blocks:
+            for start in range(0, len(rows), tile_size):
+                yield rows[start:start + tile_size], cols
+
+
+class BlockScores:
+    """
+    The scores of the pairs in a Blocking, kept as the scored tiles: (rows, cols, scores) with `scores` the
+    len(rows) x len(cols) block. Every other pair scores 0, and only `toarray` builds the N x N matrix.
+    """
+
+    def __init__(self, n, tiles):
+        self.shape = (n, n)
+        self.tiles = tiles
+
+    @property
+    def nnz(self):
+        """How many scores are stored, pairs in several tiles count once per tile."""
+        return sum(block.size for _, _, block in self.tiles)
+
+    def toarray(self):
+        scores = np.zeros(self.shape, dtype=np.float32)
+        for rows, cols, block in self.tiles:
+            scores[np.ix_(rows, cols)] = block
+            scores[np.ix_(cols, rows)] = block.T
+        return scores
+
+
+def score_matrix(arrays, blocking, tile_size=DEFAULT_TILE_SIZE, workers=1):
+    """The scores of the pairs in `blocking` as BlockScores, `tile_size` rows at a time over `workers` processes."""
+    return BlockScores(len(arrays), map_blocks(arrays, _score_tile, blocking.tiles(tile_size), workers=workers))
+
+
+def _score_tile(arrays, rows, cols):
+    talk, fit, adventure = parts_block(arrays, rows, cols)
+    return rows, cols, talk + fit + adventure
@@ -0,0 +1,289 @@
+"""
+The table of every entry's best candidates, so the candidates of one entry can be read with one indexed lookup.
+
+`refresh_candidates` rebuilds the whole table. `update_candidates` brings it up to date after a few entries
+changed: only the lists which can have changed are recomputed, which are the changed entries' own lists,
+the lists they were on and the lists they now make it onto. Scores are symmetric, so the changed entries'
+rows of scores tell how they rank on everybody else's lists.
+
+Both load and score the whole round, so they never run in a request. Requests only flag the entries they change
+(MatchingEntry.candidates_stale, see matching.signals) and `update_stale_candidates` updates the lists of every
+flagged entry at once, from the refresh_candidates command.
+
+With `lsh_recall`, each entry is only scored against the entries a MinHashIndex (see engine.minhash) finds for it,
+and with `tag_recall` against the entries sharing the most tags with it in either direction, which a TagIndex
+(see engine.tag_index) finds with a few posting list merges. Either way the recall of that shortlist against exact
+scoring is measured on a sample of the entries first, and when it falls below `lsh_recall` (or `tag_recall`)
+everybody is scored against everyone after all. The MinHashIndex is the process wide one (see
+minhash.get_minhash_index): refreshing builds it again, updates only index the changed entries again, and both keep
+it up to date once there is one, with or without `lsh_recall`.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+
+from ..models import MatchingCandidate, MatchingEntry
+from .arrays import EntryArrays
+from .blocking import Blocking
+from .minhash import MinHashIndex, get_minhash_index, has_minhash_index, set_minhash_index
+from .parallel import DEFAULT_TILE_SIZE, map_tiles
+from .rounds import unmatched_entries
+from .scoring import parts_block
+from .tag_index import TagIndex
+
+CANDIDATES_PER_ENTRY = 20
+# How many entries the recall of a shortlist is measured on before it is used
+RECALL_SAMPLE = 200
+
+
+def top_k(arrays, rows, k=CANDIDATES_PER_ENTRY, cols=None):
+    """
+    The best `k` candidates of each entry at `rows` (an index array) among every entry, or the entries at `cols`,
+    as flat arrays ordered by row then rank: (rows, cols, scores, talk, fit, adventure).
+    Only candidates scoring above 0 are kept, ties are broken by id.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    parts = parts_block(arrays, rows, cols)
+    cols = np.arange(len(arrays)) if cols is None else np.asarray(cols, dtype=np.int64)
+    return _reduce(arrays, rows, cols, parts, k)
+
+
+def blocked_top_k(arrays, blocking, k=CANDIDATES_PER_ENTRY, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Like `top_k` for every entry, out of the pairs in `blocking` (see engine.blocking) only.
+    Each tile is reduced to the top k of its rows, and of its cols the other way round, before they are merged.
+    """
+    found = []
+    for rows, cols in blocking.tiles(tile_size):
+        parts = parts_block(arrays, rows, cols)
+        found.append(_reduce(arrays, rows, cols, parts, k))
+        found.append(_reduce(arrays, cols, rows, [part.T for part in parts], k))
+    if not found:
+        return _no_candidates()
+    rows, cols, scores, talk, fit, adventure = (np.concatenate(parts) for parts in zip(*found))
+
+    # Order by row then rank, drop the pairs found by two tiles and keep the first k of every row
+    order = np.lexsort((arrays.ids[cols], -scores, rows))
+    rows, cols = rows[order], cols[order]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    order, rows, cols = order[keep], rows[keep], cols[keep]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    keep = rank < k
+    return rows[keep], cols[keep], scores[order][keep], talk[order][keep], fit[order][keep], adventure[order][keep]
+
+
+def shortlist_cols(arrays, index, row, position=None):
+    """
+    The candidates an index (a MinHashIndex or a TagIndex) finds for the entry at `row`, as an index array into
+    `arrays`.
+    """
+    if position is None:
+        position = {pk: i for i, pk in enumerate(arrays.ids.tolist())}
+    return np.array([position[pk] for pk in index.candidates(int(arrays.ids[row])).tolist() if pk in position],
+                    dtype=np.int64)
+
+
+def shortlist_top_k(arrays, index, k=CANDIDATES_PER_ENTRY, rows=None):
+    """
+    Like `top_k` for every entry (or the entries at `rows`), out of the candidates an index finds for it only
+    (see `shortlist_cols`). Entries the index has nothing for get no candidates.
+    """
+    position = {pk: i for i, pk in enumerate(arrays.ids.tolist())}
+    found = []
+    for row in (range(len(arrays)) if rows is None else rows):
+        cols = shortlist_cols(arrays, index, row, position)
+        if len(cols):
+            found.append(top_k(arrays, [row], k, cols=cols))
+    if not found:
+        return _no_candidates()
+    return tuple(np.concatenate(parts) for parts in zip(*found))
+
+
+def shortlist_recall(arrays, index, rows, k=CANDIDATES_PER_ENTRY, sample=RECALL_SAMPLE):
+    """
+    The share of the exact top `k` candidates `shortlist_top_k` finds too, over a random `sample` of the entries
+    at `rows`.
+    """
+    rows = np.random.default_rng(0).permutation(np.asarray(rows, dtype=np.int64))[:sample]
+    if not len(rows):
+        return 1.0
+    exact = top_k(arrays, rows, k)
+    approximate = shortlist_top_k(arrays, index, k, rows)
+    relevant = set(zip(exact[0].tolist(), exact[1].tolist()))
+    if not relevant:
+        return 1.0
+    return len(relevant & set(zip(approximate[0].tolist(), approximate[1].tolist()))) / len(relevant)
+
+
+def _shortlist_index(arrays, rows, k, lsh_recall=None, tag_recall=None):
+    """
+    A MinHashIndex (with `lsh_recall`) or a TagIndex (with `tag_recall`) of `arrays` when its recall over `rows`
+    is at least that, and the recall. None and None without either.
+    """
+    if lsh_recall is not None:
+        index, min_recall = get_minhash_index(arrays), lsh_recall
+    elif tag_recall is not None:
+        index, min_recall = TagIndex.from_arrays(arrays), tag_recall
+    else:
+        return None, None
+    recall = shortlist_recall(arrays, index, rows, k)
+    return (index if recall >= min_recall else None), recall
+
+
+def _no_candidates():
+    return tuple(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64) + (np.float32,) * 4)
+
+
+def _reduce(arrays, rows, cols, parts, k):
+    """The top k of every row of a tile of parts (rows x cols) as flat arrays, see `top_k`."""
+    talk, fit, adventure = parts
+    scores = talk + fit + adventure
+    k = min(k, scores.shape[1])
+    blocks, found = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    if k > 0:
+        # Everything tied with the k-th best score is kept until the ties are broken
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1]
+        for b in range(len(rows)):
+            best = np.flatnonzero((scores[b] >= kth[b]) & (scores[b] > 0))
+            best = best[np.lexsort((arrays.ids[cols[best]], -scores[b, best]))][:k]
+            blocks.append(np.full(len(best), b))
+            found.append(best)
+    blocks = np.concatenate(blocks).astype(np.int64)
+    found = np.concatenate(found).astype(np.int64)
+    return (rows[blocks], cols[found], scores[blocks, found],
+            talk[blocks, found], fit[blocks, found], adventure[blocks, found])
+
+
+def candidate_rows(arrays, found):
+    """MatchingCandidate rows (unsaved) for the candidates found by `top_k`."""
+    rows, cols, scores, talk, fit, adventure = found
+    candidates = []
+    rank = 0
+    for i in range(len(rows)):
+        rank = rank + 1 if i and rows[i] == rows[i - 1] else 0
+        candidates.append(MatchingCandidate(
+            entry_id=int(arrays.ids[rows[i]]), candidate_id=int(arrays.ids[cols[i]]), rank=rank,
+            score=float(scores[i]), talk=float(talk[i]), fit=float(fit[i]), adventure=float(adventure[i])))
+    return candidates
+
+
+def top_candidates(arrays, rows, k=CANDIDATES_PER_ENTRY):
+    """MatchingCandidate rows (unsaved) for the best `k` candidates of each entry at `rows` (an index array)."""
+    return candidate_rows(arrays, top_k(arrays, rows, k))
+
+
+def refresh_candidates(queryset=None, k=CANDIDATES_PER_ENTRY, workers=1, tile_size=DEFAULT_TILE_SIZE,
+                       min_block_candidates=None, lsh_recall=None, tag_recall=None):
+    """
+    Rebuild every entry's candidates from scratch, `tile_size` entries at a time spread over `workers` processes.
+    With `min_block_candidates`, only the pairs in the macrogenre blocks are scored instead (see engine.blocking),
+    in this process. The incremental updates still score the changed entries against everyone.
+    With `lsh_recall` (or `tag_recall`), only the LSH (or tag overlap) candidates are scored if their recall is at
+    least that, in this process. Only one of the three can be given.
+    Returns how many candidates were saved, the Blocking used, if any, and the recall measured, if any.
+    """
+    if sum(option is not None for option in (min_block_candidates, lsh_recall, tag_recall)) > 1:
+        raise ValueError('Candidates are found with blocking, with LSH or by tag overlap, only one of them.')
+    if queryset is None:
+        queryset = unmatched_entries()
+    # Cleared before the round is read, so entries changing from now on are flagged again
+    MatchingEntry.objects.filter(candidates_stale=True).update(candidates_stale=False)
+    arrays = EntryArrays.from_queryset(queryset)
+    if lsh_recall is not None or has_minhash_index():
+        set_minhash_index(MinHashIndex.from_arrays(arrays))
+    blocking = None
+    index, recall = _shortlist_index(arrays, np.arange(len(arrays)), k, lsh_recall, tag_recall)
+    if min_block_candidates is not None:
+        blocking = Blocking.for_arrays(arrays, min_block_candidates)
+        candidates = candidate_rows(arrays, blocked_top_k(arrays, blocking, k, tile_size))
+    elif index is not None:
+        candidates = candidate_rows(arrays, shortlist_top_k(arrays, index, k))
+    else:
+        candidates = []
+        for found in map_tiles(arrays, top_k, k, workers=workers, tile_size=tile_size):
+            candidates.extend(candidate_rows(arrays, found))
+    with transaction.atomic():
+        MatchingCandidate.objects.all().delete()
+        MatchingCandidate.objects.bulk_create(candidates, batch_size=1000)
+    return len(candidates), blocking, recall
+
+
+def update_candidates(changed=(), k=CANDIDATES_PER_ENTRY, tile_size=DEFAULT_TILE_SIZE, lsh_recall=None,
+                      tag_recall=None):
+    """
+    Update the candidates after the entries with the ids in `changed` were created or changed (their fields or tags),
+    left the round or lost a candidate, scoring `tile_size` of them at a time. With `lsh_recall` (or `tag_recall`),
+    only the LSH (or tag overlap) candidates are scored if their recall over the changed entries is at least that.
+    Returns how many lists were recomputed.
+
+    Tag overlap shortlists are the entries sharing the most tags, so a changed entry can push somebody off another
+    entry's shortlist without making it onto that entry's list. That list keeps them until it is recomputed.
+    """
+    changed = set(changed)
+    arrays = EntryArrays.from_queryset(unmatched_entries())
+    index = {int(pk): i for i, pk in enumerate(arrays.ids)}
+    if lsh_recall is not None or has_minhash_index():
+        # Entries which were deleted or left the round meanwhile are dropped, the changed ones indexed again
+        lsh_index = get_minhash_index(arrays)
+        for pk in set(lsh_index.signatures).difference(index):
+            lsh_index.remove(pk)
+        for pk in changed.intersection(index):
+            lsh_index.refresh_entry(pk)
+
+    affected = {pk for pk in changed if pk in index}
+    affected.update(pk for pk in MatchingCandidate.objects.filter(candidate_id__in=changed)
+                    .values_list('entry_id', flat=True).distinct() if pk in index)
+
+    rows = np.array([index[pk] for pk in changed if pk in index], dtype=np.int64)
+    shortlist = _shortlist_index(arrays, rows, k, lsh_recall, tag_recall)[0] if len(rows) else None
+    if len(rows):
+        # Lists which aren't full yet, or whose last candidate is beaten by a changed entry
+        lists = {entry_id: (count, lowest) for entry_id, count, lowest in MatchingCandidate.objects
+                 .values_list('entry_id').annotate(Count('pk'), Min('score')).order_by()}
+        best = np.zeros(len(arrays), dtype=np.float32)
+        if isinstance(shortlist, MinHashIndex):
+            # LSH candidates are symmetric, a changed entry only makes it onto its own candidates' lists
+            for row in rows:
+                cols = shortlist_cols(arrays, shortlist, row)
+                talk, fit, adventure = parts_block(arrays, [row], cols)
+                best[cols] = np.maximum(best[cols], (talk + fit + adventure)[0])
+        else:
+            for start in range(0, len(rows), tile_size):
+                talk, fit, adventure = parts_block(arrays, rows[start:start + tile_size])
+                best = np.maximum(best, (talk + fit + adventure).max(axis=0))
+        for col in np.flatnonzero(best > 0):
+            count, lowest = lists.get(int(arrays.ids[col]), (0, 0))
+            if count < k or best[col] >= lowest:
+                affected.add(int(arrays.ids[col]))
+
+    affected_rows = np.array(sorted(index[pk] for pk in affected), dtype=np.int64)
+    if shortlist is not None:
+        candidates = candidate_rows(arrays, shortlist_top_k(arrays, shortlist, k, affected_rows))
+    else:
+        candidates = []
+        for start in range(0, len(affected_rows), tile_size):
+            candidates.extend(top_candidates(arrays, affected_rows[start:start + tile_size], k))
+    with transaction.atomic():
+        MatchingCandidate.objects.filter(entry_id__in=affected | (changed - index.keys())).delete()
+        MatchingCandidate.objects.bulk_create(candidates, batch_size=1000)
+    return len(affected)
+
+
+def update_stale_candidates(k=CANDIDATES_PER_ENTRY, tile_size=DEFAULT_TILE_SIZE, lsh_recall=None, tag_recall=None):
+    """
+    `update_candidates` for every entry flagged with candidates_stale, clearing the flags.
+    Returns how many entries were flagged and how many lists were recomputed.
+    """
+    stale = list(MatchingEntry.objects.filter(candidates_stale=True).values_list('pk', flat=True))
+    if not stale:
+        return 0, 0
+    # Cleared before the round is read, so an entry changing again meanwhile is flagged for the next run
+    MatchingEntry.objects.filter(pk__in=stale).update(candidates_stale=False)
+    try:
+        return len(stale), update_candidates(changed=stale, k=k, tile_size=tile_size, lsh_recall=lsh_recall,
+                                                  tag_recall=tag_recall)
+    except Exception:
+        MatchingEntry.objects.filter(pk__in=stale).mark_candidates_stale()
+        raise
@@ -0,0 +1,208 @@
+"""
+Approximate nearest neighbours over the entries' tag sets, with MinHash signatures and banded LSH.
+
+Each entry is described by one set of Tag ids: the tags of its album together with the tags it wants in a match,
+so two entries come out close when their albums are alike or one has what the other wants. The probability that
+two MinHash signatures agree in a position is the Jaccard index of the two sets. Signatures are cut into `bands`
+bands of `rows` positions and entries whose signatures are identical over a whole band are candidates for each
+other, which happens with probability 1 - (1 - s ** rows) ** bands for a Jaccard index of s: more bands raise the
+recall, more rows per band cut the candidates (and so the exact scoring) down.
+
+The tag sets come from the entries' tag bitsets, the copies of their MatchingTag rows.
+
+engine.candidates keeps a process wide index (see `get_minhash_index`): refresh_candidates builds it again and
+update_candidates only indexes the changed entries again, with `refresh_entry`. The refresh_candidates command
+saves it to settings.MATCHING_MINHASH_INDEX_PATH when set, see `save_minhash_index`.
+"""
+import os
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from ..models import MatchingEntry
+from . import bitsets
+from .arrays import EntryArrays
+
+# Hashes are (a * tag + b) mod PRIME, which stays within int64 for tag ids below 2 ** 31
+PRIME = (1 << 31) - 1
+DEFAULT_BANDS = 32
+DEFAULT_ROWS = 2
+# Signatures are computed for this many entries at a time to bound the entries x tags x positions temporaries
+CHUNK_SIZE = 4096
+
+_cached_index = None
+
+
+class MinHashIndex:
+    def __init__(self, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=0):
+        self.bands = bands
+        self.rows = rows
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, size=bands * rows, dtype=np.int64)
+        self.b = rng.integers(0, PRIME, size=bands * rows, dtype=np.int64)
+        # Mixes the positions of a band into one bucket key
+        self.band_mix = rng.integers(1, np.iinfo(np.int64).max, size=rows, dtype=np.int64).astype(np.uint64)
+
+        self.signatures = {}
+        self.band_keys = {}
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+        # Whether the index changed since it was loaded or saved
+        self.changed = True
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @classmethod
+    def build(cls, queryset=None, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=0):
+        """Index the entries in `queryset` (all entries by default), with one query."""
+        return cls.from_arrays(EntryArrays.from_queryset(queryset, text=False), bands, rows, seed)
+
+    @classmethod
+    def from_arrays(cls, arrays, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=0):
+        index = cls(bands, rows, seed)
+        tags = (arrays.album_tags > 0) | (arrays.match_tags > 0)
+        for start in range(0, len(arrays), CHUNK_SIZE):
+            entries, cols = np.nonzero(tags[start:start + CHUNK_SIZE])
+            index._add_all(arrays.ids[start:start + CHUNK_SIZE], entries, arrays.tag_keys[cols])
+        return index
+
+    def signature(self, tag_ids):
+        """The MinHash signature of a set of Tag ids, None for an empty set."""
+        tag_ids = np.unique(np.asarray(list(tag_ids), dtype=np.int64))
+        if not len(tag_ids):
+            return None
+        return ((self.a[None, :] * tag_ids[:, None] + self.b[None, :]) % PRIME).min(axis=0)
+
+    def _keys(self, signatures):
+        # One key per band, the positions of the band mixed together (wrapping around uint64)
+        banded = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        return (banded * self.band_mix).sum(axis=2, dtype=np.uint64)
+
+    def _add_all(self, ids, entries, tag_ids):
+        # entries[i] is the position in `ids` of the entry having tag_ids[i], sorted by entry
+        if not len(entries):
+            return
+        starts = np.flatnonzero(np.r_[True, entries[1:] != entries[:-1]])
+        hashes = (self.a[None, :] * tag_ids[:, None] + self.b[None, :]) % PRIME
+        signatures = np.minimum.reduceat(hashes, starts, axis=0)
+        for entry_id, signature, keys in zip(ids[entries[starts]].tolist(), signatures, self._keys(signatures)):
+            self._insert(entry_id, signature, keys)
+
+    def _insert(self, entry_id, signature, keys):
+        self.signatures[entry_id] = signature
+        self.band_keys[entry_id] = keys
+        for band, key in enumerate(keys.tolist()):
+            self.buckets[band][key].add(entry_id)
+
+    def remove(self, entry_id):
+        keys = self.band_keys.pop(entry_id, None)
+        if keys is None:
+            return
+        self.changed = True
+        del self.signatures[entry_id]
+        for band, key in enumerate(keys.tolist()):
+            bucket = self.buckets[band][key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self.buckets[band][key]
+
+    def update(self, entry_id, tag_ids):
+        """Index an entry again with its new tags, or for the first time. An entry without tags is removed."""
+        self.remove(entry_id)
+        signature = self.signature(tag_ids)
+        if signature is not None:
+            self._insert(entry_id, signature, self._keys(signature[None, :])[0])
+            self.changed = True
+
+    def refresh_entry(self, entry_id):
+        """Index an entry again from its tags in the database, after it changed or was deleted."""
+        row = MatchingEntry.objects.filter(pk=entry_id).values_list('album_tag_bits', 'match_tag_bits').first()
+        if row is None:
+            self.remove(entry_id)
+        else:
+            self.update(entry_id, np.union1d(bitsets.unpack(bytes(row[0])), bitsets.unpack(bytes(row[1]))))
+
+    def candidates(self, entry_id):
+        """The ids of the entries sharing a band with `entry_id`, as a sorted array."""
+        keys = self.band_keys.get(entry_id)
+        if keys is None:
+            return np.empty(0, dtype=np.int64)
+        found = set()
+        for band, key in enumerate(keys.tolist()):
+            found |= self.buckets[band][key]
+        found.discard(entry_id)
+        return np.sort(np.fromiter(found, dtype=np.int64, count=len(found)))
+
+    def estimated_similarity(self, entry_id, other_ids):
+        """The Jaccard index of `entry_id`'s tags with each of `other_ids`', estimated from the signatures."""
+        signature = self.signatures[entry_id]
+        return np.array([(self.signatures[other] == signature).mean() for other in other_ids])
+
+    def save(self, path):
+        """Save the index to a .npz file, through a temporary file of its own like TextIndex.save."""
+        ids = np.fromiter(self.signatures, dtype=np.int64, count=len(self.signatures))
+        signatures = (np.stack([self.signatures[pk] for pk in ids.tolist()]) if len(ids)
+                      else np.empty((0, self.bands * self.rows), dtype=np.int64))
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp.npz',
+                                         delete=False) as temporary:
+            try:
+                np.savez(temporary, bands=self.bands, rows=self.rows, seed=self.seed, ids=ids, signatures=signatures)
+            except BaseException:
+                temporary.close()
+                os.unlink(temporary.name)
+                raise
+        os.replace(temporary.name, path)
+        self.changed = False
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(int(data['bands']), int(data['rows']), int(data['seed']))
+            ids, signatures = data['ids'], data['signatures']
+        for entry_id, signature, keys in zip(ids.tolist(), signatures, index._keys(signatures)):
+            index._insert(entry_id, signature, keys)
+        index.changed = False
+        return index
+
+
+def _index_path():
+    return getattr(settings, 'MATCHING_MINHASH_INDEX_PATH', None)
+
+
+def has_minhash_index():
+    """Whether there is a process wide index yet, in memory or saved."""
+    path = _index_path()
+    return _cached_index is not None or bool(path and os.path.exists(path))
+
+
+def get_minhash_index(arrays=None):
+    """
+    The process wide index, loaded from settings.MATCHING_MINHASH_INDEX_PATH the first time it is needed, or built
+    from `arrays` (every entry by default) when there is no file yet.
+    """
+    global _cached_index
+    if _cached_index is None:
+        path = _index_path()
+        if path and os.path.exists(path):
+            _cached_index = MinHashIndex.load(path)
+        elif arrays is not None:
+            _cached_index = MinHashIndex.from_arrays(arrays)
+        else:
+            _cached_index = MinHashIndex.build()
+    return _cached_index
+
+
+def save_minhash_index():
+    """Save the process wide index to settings.MATCHING_MINHASH_INDEX_PATH if it changed since it was loaded."""
+    path = _index_path()
+    if _cached_index is not None and path and _cached_index.changed:
+        _cached_index.save(path)
+
+
+def set_minhash_index(index):
+    """Use `index` as the process wide index from now on, after building a new one."""
+    global _cached_index
+    _cached_index = index
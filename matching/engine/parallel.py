@@ -0,0 +1,156 @@
+"""
+Scoring and top-k extraction spread over a pool of worker processes.
+
+The entry arrays are copied once into shared memory blocks which every worker maps when it starts, so tiles are
+sent to the workers as (start, stop) row ranges and never pickle the arrays. Scoring a full matrix writes each
+tile straight into a shared output matrix, and `map_tiles` lets a function like `candidates.top_k` reduce each
+tile inside the worker, so only k items per row come back.
+
+With a single worker everything runs in the calling process, without a pool.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import django
+import numpy as np
+
+from .arrays import EntryArrays
+from .scoring import score_block
+from .text_index import TextVectors
+
+DEFAULT_TILE_SIZE = 512
+
+_ARRAY_FIELDS = ('ids', 'talkativity', 'minds_talking', 'minds_not_talking', 'adventurous',
+                 'person_above_adventure', 'triplet', 'album_tags', 'match_tags', 'tag_keys')
+
+# Set in each worker by _attach
+_worker_arrays = None
+_worker_scores = None
+_worker_blocks = []
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+class SharedBlocks:
+    """
+    NumPy arrays copied into shared memory blocks, described by `spec` ({name: (block name, shape, dtype)}) so
+    another process can map them with `attach_blocks`. The blocks are freed by `close`, or leaving the `with`.
+    """
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        self.arrays = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+            self.arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            self.arrays[name][...] = array
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_blocks(spec):
+    """Map the blocks described by a SharedBlocks' `spec`. Returns the blocks (keep them open) and the arrays."""
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        # Workers are children of the process which created the blocks and share its resource tracker,
+        # which only unlinks the blocks if that process dies without doing it
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _attach(spec):
+    global _worker_arrays, _worker_scores, _worker_blocks
+    django.setup()
+    _worker_blocks, arrays = attach_blocks(spec)
+    _worker_scores = arrays.pop('scores', None)
+    text = {name[5:]: arrays.pop(name) for name in list(arrays) if name.startswith('text_')}
+    _worker_arrays = EntryArrays(**arrays, text=TextVectors(**text) if text else None)
+
+
+def _score_tile(start, stop):
+    _worker_scores[start:stop] = score_block(_worker_arrays, slice(start, stop))
+
+
+def _map_tile(func, start, stop, args):
+    return func(_worker_arrays, np.arange(start, stop), *args)
+
+
+def _map_block(func, rows, cols, args):
+    return func(_worker_arrays, rows, cols, *args)
+
+
+def _tiles(n, tile_size):
+    return [(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+
+def _shared_inputs(arrays):
+    inputs = {name: getattr(arrays, name) for name in _ARRAY_FIELDS}
+    if arrays.text is not None:
+        inputs.update((f'text_{name}', array) for name, array in arrays.text.arrays().items())
+    return inputs
+
+
+def score_matrix(arrays, workers=None, tile_size=DEFAULT_TILE_SIZE):
+    """The full N x N score matrix like `scoring.score_matrix`, its row tiles scored by `workers` processes."""
+    workers = workers or default_workers()
+    n = len(arrays)
+    if workers == 1 or n == 0:
+        scores = np.empty((n, n), dtype=np.float32)
+        for start, stop in _tiles(n, tile_size):
+            scores[start:stop] = score_block(arrays, slice(start, stop))
+        return scores
+
+    inputs = _shared_inputs(arrays)
+    inputs['scores'] = np.empty((n, n), dtype=np.float32)
+    with SharedBlocks(inputs) as shared, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.spec,)) as pool:
+        list(pool.map(_score_tile, *zip(*_tiles(n, tile_size))))
+        return shared.arrays['scores'].copy()
+
+
+def map_tiles(arrays, func, *args, workers=None, tile_size=DEFAULT_TILE_SIZE):
+    """
+    The list of func(arrays, rows, *args) for every tile of `tile_size` rows (as index arrays), run by `workers`
+    processes. `func` is sent to the workers by name so it has to be a module level function, and it should reduce
+    its tile to something small like a top-k since its result is pickled back.
+    """
+    workers = workers or default_workers()
+    tiles = _tiles(len(arrays), tile_size)
+    if workers == 1 or not tiles:
+        return [func(arrays, np.arange(start, stop), *args) for start, stop in tiles]
+    with SharedBlocks(_shared_inputs(arrays)) as shared, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.spec,)) as pool:
+        return list(pool.map(_map_tile, [func] * len(tiles), *zip(*tiles), [args] * len(tiles)))
+
+
+def map_blocks(arrays, func, blocks, *args, workers=None):
+    """
+    The list of func(arrays, rows, cols, *args) for every (rows, cols) pair of index arrays in `blocks`, run by
+    `workers` processes like `map_tiles`. Only the index arrays are pickled to the workers.
+    """
+    workers = workers or default_workers()
+    blocks = list(blocks)
+    if workers == 1 or not blocks:
+        return [func(arrays, rows, cols, *args) for rows, cols in blocks]
+    with SharedBlocks(_shared_inputs(arrays)) as shared, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.spec,)) as pool:
+        return list(pool.map(_map_block, [func] * len(blocks), *zip(*blocks), [args] * len(blocks)))
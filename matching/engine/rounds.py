@@ -0,0 +1,201 @@
+import time
+
+import numpy as np
+from django.db import transaction
+
+from ..models import MatchingCandidate, MatchingEntry, MatchingSuggestion
+from . import parallel
+from .arrays import EntryArrays
+from .blocking import Blocking, score_matrix as blocked_score_matrix
+from .scoring import score_matrix
+from .solver import max_weight_matching
+from .text_index import get_text_index
+from .triplets import form_triplets, absorb, group_score
+
+# Share of the time budget given to forming the opted-in triplets, the rest goes to pairing everybody else
+TRIPLET_BUDGET_SHARE = 0.25
+
+
+class RoundSolution:
+    def __init__(self, arrays, scores, groups, unmatched, matching, score_time, solve_time, blocking=None):
+        self.arrays = arrays
+        self.scores = scores
+        self.groups = groups
+        self.unmatched = unmatched
+        self.matching = matching
+        self.score_time = score_time
+        self.solve_time = solve_time
+        self.blocking = blocking
+
+    @property
+    def objective(self):
+        return objective(self.scores, self.groups)
+
+    def suggestions(self):
+        ids = self.arrays.ids
+        suggestions = []
+        for group in self.groups:
+            entry_ids = [int(ids[i]) for i in group] + [None]
+            suggestions.append(MatchingSuggestion(
+                entry_1_id=entry_ids[0], entry_2_id=entry_ids[1], entry_3_id=entry_ids[2],
+                score=group_score(self.scores, group)
+            ))
+        return suggestions
+
+
+def group_objective(score, size):
+    """
+    What a group with this score (the mean of its pairs' scores) adds to the objective: half its score per person,
+    so a pair counts its score and a triple one and a half times its mean, which is half the sum of its three pairs.
+    """
+    return score * size / 2
+
+
+def objective(scores, groups):
+    return sum(group_objective(group_score(scores, group), len(group)) for group in groups)
+
+
+def unmatched_entries():
+    """Entries which aren't part of an approved suggestion yet."""
+    approved = MatchingSuggestion.objects.filter(status=MatchingSuggestion.Status.APPROVED)
+    return MatchingEntry.objects.exclude(pk__in=approved.entry_ids())
+
+
+def solve_round(queryset=None, time_budget=30.0, workers=1, tile_size=parallel.DEFAULT_TILE_SIZE,
+                min_block_candidates=None, snapshot=None):
+    """
+    Score every unmatched entry and split them into groups: triples among the people who opted into triplets,
+    pairs for everyone else. If that leaves one person on their own they join the pair they fit best with.
+    The scoring is spread over `workers` processes, `tile_size` rows at a time. With `min_block_candidates`,
+    only the pairs in the macrogenre blocks are scored instead (see engine.blocking) and the others score 0.
+    Either way the solver gets the whole N x N matrix.
+    With a `snapshot` (a RoundSnapshot, see engine.snapshot) the round is read from it without any query.
+    """
+    start = time.perf_counter()
+    if snapshot is not None:
+        arrays = snapshot.entry_arrays()
+    else:
+        arrays = EntryArrays.from_queryset(unmatched_entries() if queryset is None else queryset)
+    blocking = None
+    if min_block_candidates is not None:
+        blocking = (Blocking(arrays, snapshot.macrogenre_tags(), min_block_candidates) if snapshot is not None
+                    else Blocking.for_arrays(arrays, min_block_candidates))
+        # The solver and the triplets look pairs up at random, so they get the blocks as a dense matrix
+        # and blocking only saves the scoring here, not the memory of the matrix
+        scores = blocked_score_matrix(arrays, blocking, tile_size=tile_size, workers=workers).toarray()
+    else:
+        scores = parallel.score_matrix(arrays, workers=workers, tile_size=tile_size)
+    score_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    triples, left = form_triplets(scores, np.flatnonzero(arrays.triplet),
+                                  deadline=start + time_budget * TRIPLET_BUDGET_SHARE)
+    pool = np.sort(np.concatenate([np.flatnonzero(~arrays.triplet), left]))
+    matching = max_weight_matching(scores, time_budget=time_budget - (time.perf_counter() - start),
+                                   candidates=pool)
+
+    groups = [tuple(triple) for triple in triples] + [tuple(pair) for pair in matching.pairs]
+    unmatched = list(matching.unmatched)
+    if len(unmatched) == 1 and len(matching.pairs):
+        pair = len(triples) + absorb(scores, matching.pairs, unmatched[0])
+        groups[pair] += (unmatched.pop(),)
+    solve_time = time.perf_counter() - start
+    return RoundSolution(arrays, scores, groups, unmatched, matching, score_time, solve_time, blocking)
+
+
+def repair_round(time_budget=1.0):
+    """
+    Fix up the solver's pending suggestions after entries joined the round or left it (taking their suggestion with
+    them), without solving the whole round again.
+
+    Only a neighbourhood of the entries left without a group is matched again: the free entries themselves,
+    their best candidates (from the candidates table) and the entries paired with those candidates by the solver.
+    Every other suggestion is kept. Within the neighbourhood the better of two solutions is used, everybody
+    matched again from scratch, or the existing pairs kept and only the free entries matched among themselves.
+
+    The text index is loaded (or built, the first time) before the clock starts, see RepairedRound.index_time.
+    Returns a RepairedRound, or None when nobody is free.
+    """
+    start = time.perf_counter()
+    get_text_index()
+    index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pending = MatchingSuggestion.objects.filter(status=MatchingSuggestion.Status.PENDING)
+    free = set(unmatched_entries().exclude(pk__in=pending.values('entry_1')).exclude(
+        pk__in=pending.values('entry_2')).exclude(
+        pk__in=pending.filter(entry_3__isnull=False).values('entry_3')).values_list('pk', flat=True))
+    if not free:
+        return None
+
+    # Only the solver's pairs can be broken up, triplets and the matchers' suggestions stay as they are
+    neighbours = set(MatchingCandidate.objects.filter(entry_id__in=free).values_list('candidate_id', flat=True))
+    replaced = list(pending.filter(suggested_by__isnull=True, entry_3__isnull=True).involving(neighbours))
+
+    arrays = EntryArrays.from_queryset(MatchingEntry.objects.filter(
+        pk__in=free.union(*(suggestion.entry_ids for suggestion in replaced))))
+    scores = score_matrix(arrays)
+    score_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = {int(pk): i for i, pk in enumerate(arrays.ids)}
+    kept = np.array([[index[pk] for pk in suggestion.entry_ids] for suggestion in replaced],
+                    dtype=np.int64).reshape(-1, 2)
+    free_rows = np.array(sorted(index[pk] for pk in free), dtype=np.int64)
+    rematched = _local_solution(scores, np.empty((0, 2), dtype=np.int64), max_weight_matching(scores, time_budget / 2))
+    free_matched = _local_solution(scores, kept, max_weight_matching(scores, time_budget / 2, candidates=free_rows))
+    groups, unmatched, matching = max(rematched, free_matched, key=lambda solution: objective(scores, solution[0]))
+    solution = RoundSolution(arrays, scores, groups, unmatched, matching, score_time, time.perf_counter() - start)
+    return RepairedRound(solution, replaced, index_time)
+
+
+def _local_solution(scores, kept, matching):
+    pairs = np.concatenate([kept, matching.pairs]).astype(np.int64)
+    groups = [tuple(pair) for pair in pairs]
+    unmatched = list(matching.unmatched)
+    if len(unmatched) == 1 and len(pairs):
+        groups[absorb(scores, pairs, unmatched[0])] += (unmatched.pop(),)
+    return groups, unmatched, matching
+
+
+class RepairedRound:
+    """
+    The new groups of a repaired neighbourhood, and the solver's suggestions they replace.
+    `index_time` is how long loading the text index took, which the solution's score_time leaves out.
+    """
+
+    def __init__(self, solution, replaced, index_time=0.0):
+        self.solution = solution
+        self.replaced = replaced
+        self.index_time = index_time
+
+    @property
+    def gain(self):
+        """How much the repair adds to the objective of the round."""
+        return self.solution.objective - sum(group_objective(suggestion.score, len(suggestion.entry_ids))
+                                             for suggestion in self.replaced)
+
+
+def round_objective():
+    """The objective value of the pending suggestions, the same measure as `RoundSolution.objective`."""
+    pending = MatchingSuggestion.objects.filter(status=MatchingSuggestion.Status.PENDING)
+    return sum(group_objective(suggestion.score, len(suggestion.entry_ids)) for suggestion in pending)
+
+
+@transaction.atomic
+def save_repair(repaired):
+    """Replace the suggestions of the repaired neighbourhood with its new groups, the pairs which stayed are kept."""
+    replaced = {frozenset(suggestion.entry_ids): suggestion for suggestion in repaired.replaced}
+    new = [suggestion for suggestion in repaired.solution.suggestions()
+           if replaced.pop(frozenset(suggestion.entry_ids), None) is None]
+    MatchingSuggestion.objects.filter(pk__in=[suggestion.pk for suggestion in replaced.values()]).delete()
+    return MatchingSuggestion.objects.bulk_create(new)
+
+
+@transaction.atomic
+def save_suggestions(solution):
+    """Replace the solver's previous pending suggestions with the ones from `solution`."""
+    MatchingSuggestion.objects.filter(
+        suggested_by__isnull=True, status=MatchingSuggestion.Status.PENDING
+    ).delete()
+    return MatchingSuggestion.objects.bulk_create(solution.suggestions())
@@ -0,0 +1,211 @@
+"""
+Compatibility scoring between every pair of entries in a round.
+
+The score of a pair is made of three parts:
+  - talk: the talk type compatibility described above `MatchingEntry.talkativity_preference`, from 0 to 5.
+    A talk compatibility of 0 means one of the people said they are NOT OKAY with the other, the pair scores 0.
+  - fit: the fraction of the tags each person wants in a match that the other person's album has,
+    averaged over both directions. Somebody who doesn't want any tags in particular is happy with anything.
+    When the entries' texts are loaded, the TF-IDF cosine similarity of what each person wrote they want with
+    the other person's album description (see engine.text_index), also averaged over both directions, is added.
+  - adventure: people who value `person_above_adventure` want an album similar to theirs,
+    people who are `adventurous` want something different. Album similarity is the Jaccard index of the album tags.
+
+`score_matrix` computes every pair at once with array operations and `reference_score_matrix` computes
+the same numbers one pair at a time. All the arithmetic is float32 and happens in the same order in both,
+so their results are identical, not just close.
+"""
+import numpy as np
+
+from ..models import MatchingEntry
+from .arrays import TALKATIVITY_CODES, TALKING, NETWORKING
+from .text_index import cosine
+
+TALK_WEIGHT = np.float32(2)
+FIT_WEIGHT = np.float32(2)
+TEXT_WEIGHT = np.float32(1)
+ADVENTURE_WEIGHT = np.float32(1)
+
+IDEAL_TALK = 5
+
+_ZERO = np.float32(0)
+_ONE = np.float32(1)
+_TWO = np.float32(2)
+_FIVE = np.float32(5)
+
+
+def talk_block(arrays, rows, cols=None):
+    """
+    Talk type compatibility (0-5) of the entries at `rows` with every entry (or the entries at `cols`),
+    as a len(rows) x N int8 array.
+    """
+    row_pref = arrays.talkativity[rows][:, None]
+    col_pref = _take(arrays.talkativity, cols)[None, :]
+
+    # How okay each person is with the other one as a match
+    row_okay = np.where(col_pref == TALKING,
+                        arrays.minds_talking[rows][:, None], arrays.minds_not_talking[rows][:, None])
+    col_okay = np.where(row_pref == TALKING,
+                        _take(arrays.minds_talking, cols)[None, :], _take(arrays.minds_not_talking, cols)[None, :])
+
+    talk = np.where(row_pref == NETWORKING, row_okay,
+                    np.where(col_pref == NETWORKING, col_okay, np.maximum(row_okay, col_okay)))
+    return np.where(row_pref == col_pref, IDEAL_TALK, talk).astype(np.int8)
+
+
+def score_block(arrays, rows):
+    """Scores of the entries at `rows` (a slice or an index array) against every entry, as a len(rows) x N array."""
+    talk, fit, adventure = parts_block(arrays, rows)
+    return talk + fit + adventure
+
+
+def parts_block(arrays, rows, cols=None):
+    """
+    The talk, fit and adventure parts of the scores of `rows` against every entry (or the entries at `cols`, an
+    index array), already weighted, as three len(rows) x N arrays which add up to `score_block`.
+    Pairs scoring 0 (themselves, or a talk compatibility of 0) have every part set to 0.
+    """
+    rows = np.arange(len(arrays))[rows]
+    talk = talk_block(arrays, rows, cols)
+
+    album_tags = _take(arrays.album_tags, cols)
+    match_tags = _take(arrays.match_tags, cols)
+    album_counts = _take(arrays.album_tag_counts, cols)
+    match_counts = _take(arrays.match_tag_counts, cols)
+
+    # fit[b, j] - how much of what rows[b] wants is on j's album, fit_back[b, j] - the other way round
+    wanted_found = arrays.match_tags[rows] @ album_tags.T
+    fit = _divide(wanted_found, np.broadcast_to(arrays.match_tag_counts[rows][:, None], wanted_found.shape), _ONE)
+    found_wanted = arrays.album_tags[rows] @ match_tags.T
+    fit_back = _divide(found_wanted, np.broadcast_to(match_counts[None, :], found_wanted.shape), _ONE)
+
+    shared = arrays.album_tags[rows] @ album_tags.T
+    union = arrays.album_tag_counts[rows][:, None] + album_counts[None, :] - shared
+    similarity = _divide(shared, union, _ZERO)
+    adventure = _adventure(arrays.adventurous[rows][:, None], arrays.person_above_adventure[rows][:, None], similarity)
+    adventure_back = _adventure(_take(arrays.adventurous, cols)[None, :],
+                                _take(arrays.person_above_adventure, cols)[None, :], similarity)
+
+    text = arrays.text.similarity_block(rows, cols) if arrays.text is not None else ()
+    parts = _weighted_parts(talk, fit, fit_back, adventure, adventure_back, *text)
+    zero = talk == 0
+    if cols is None:
+        zero[np.arange(len(rows)), rows] = True
+    else:
+        zero |= rows[:, None] == np.asarray(cols)[None, :]
+    for part in parts:
+        part[zero] = 0
+    return parts
+
+
+def score_matrix(arrays, block_size=1024):
+    """The full N x N score matrix, computed `block_size` rows at a time to bound the size of the temporaries."""
+    n = len(arrays)
+    scores = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, block_size):
+        scores[start:start + block_size] = score_block(arrays, slice(start, start + block_size))
+    return scores
+
+
+def _take(array, cols):
+    return array if cols is None else array[cols]
+
+
+def _divide(numerator, denominator, default):
+    out = np.full(numerator.shape, default, dtype=np.float32)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def _adventure(adventurous, person_above_adventure, similarity):
+    adventurous = np.float32(adventurous) if np.isscalar(adventurous) else adventurous.astype(np.float32)
+    person_above_adventure = (np.float32(person_above_adventure) if np.isscalar(person_above_adventure)
+                              else person_above_adventure.astype(np.float32))
+    return (person_above_adventure * similarity + adventurous * (_ONE - similarity)) / _FIVE
+
+
+def _weighted_parts(talk, fit, fit_back, adventure, adventure_back, text=None, text_back=None):
+    talk = np.float32(talk) if np.isscalar(talk) else talk.astype(np.float32)
+    fit = FIT_WEIGHT * ((fit + fit_back) / _TWO)
+    if text is not None:
+        fit = fit + TEXT_WEIGHT * ((text + text_back) / _TWO)
+    return (TALK_WEIGHT * (talk / _FIVE),
+            fit,
+            ADVENTURE_WEIGHT * ((adventure + adventure_back) / _TWO))
+
+
+def _combine(talk, fit, fit_back, adventure, adventure_back, text=None, text_back=None):
+    talk, fit, adventure = _weighted_parts(talk, fit, fit_back, adventure, adventure_back, text, text_back)
+    return talk + fit + adventure
+
+
+# The slow reference implementation, one pair at a time straight from the model instances
+
+def reference_talk(entry_a, entry_b):
+    pref_a = TALKATIVITY_CODES[entry_a.talkativity_preference]
+    pref_b = TALKATIVITY_CODES[entry_b.talkativity_preference]
+    if pref_a == pref_b:
+        return IDEAL_TALK
+
+    def how_okay(entry, other_pref):
+        return entry.minds_talking if other_pref == TALKING else entry.minds_not_talking
+
+    if pref_a == NETWORKING:
+        return how_okay(entry_a, pref_b)
+    if pref_b == NETWORKING:
+        return how_okay(entry_b, pref_a)
+    return max(how_okay(entry_a, pref_b), how_okay(entry_b, pref_a))
+
+
+def reference_pair_score(entry_a, entry_b, tags_a, tags_b, text_a=None, text_b=None):
+    """
+    Score of one pair of entries.
+    `tags_a` and `tags_b` are (album tags, match tags) tuples of sets of Tag ids, `text_a` and `text_b` the
+    (wanted, album) TF-IDF vectors of the entries from a TextIndex, to score their texts as well.
+    """
+    if entry_a.pk == entry_b.pk:
+        return _ZERO
+    talk = reference_talk(entry_a, entry_b)
+    if talk == 0:
+        return _ZERO
+    album_a, wanted_a = tags_a
+    album_b, wanted_b = tags_b
+
+    def fit(wanted, album):
+        if not wanted:
+            return _ONE
+        return np.float32(len(wanted & album)) / np.float32(len(wanted))
+
+    shared = len(album_a & album_b)
+    union = len(album_a) + len(album_b) - shared
+    similarity = np.float32(shared) / np.float32(union) if union else _ZERO
+
+    text = (cosine(text_a[0], text_b[1]), cosine(text_b[0], text_a[1])) if text_a is not None else ()
+    return _combine(
+        talk,
+        fit(wanted_a, album_b), fit(wanted_b, album_a),
+        _adventure(entry_a.adventurous, entry_a.person_above_adventure, similarity),
+        _adventure(entry_b.adventurous, entry_b.person_above_adventure, similarity),
+        *text
+    )
+
+
+def reference_score_matrix(queryset=None, text_index=None):
+    """
+    The same matrix as `score_matrix`, one pair at a time. Only useful to check the fast version.
+    The texts are scored with the vectors in `text_index`, which has to be up to date, when one is given.
+    """
+    if queryset is None:
+        queryset = MatchingEntry.objects.all()
+    entries = list(queryset.order_by('pk').prefetch_related('all_tags'))
+    tags = [
+        ({t.tag_id for t in entry.all_tags.all() if t.describes_album},
+         {t.tag_id for t in entry.all_tags.all() if not t.describes_album})
+        for entry in entries
+    ]
+    texts = [text_index.vectors[entry.pk][1:] if text_index is not None else None for entry in entries]
+    scores = np.empty((len(entries), len(entries)), dtype=np.float32)
+    for i, entry_a in enumerate(entries):
+        for j, entry_b in enumerate(entries):
+            scores[i, j] = reference_pair_score(entry_a, entry_b, tags[i], tags[j], texts[i], texts[j])
+    return scores
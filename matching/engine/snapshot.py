@@ -0,0 +1,218 @@
+"""
+Round snapshots: every field and tag of the entries of a round frozen in one columnar file, so solver and scoring
+experiments can run again and again on exactly the same input without touching the database.
+
+The file is a small JSON header followed by one aligned array per column, and `RoundSnapshot` memory maps it so
+the arrays are views of the file, nothing is read until it is used. `RoundSnapshot.entry_arrays` does copy: the
+scoring wants dense float32 tag matrices and talkativity codes, which are built from the file in memory.
+Columns are stored by field type:
+  - integers, booleans and foreign keys as arrays of the smallest integer type that holds them,
+  - datetimes as int64 microseconds since the epoch,
+  - fields with choices as integer codes into the list of their values,
+  - other text as one UTF-8 blob with an offsets table (the text of row i is blob[offsets[i]:offsets[i + 1]]),
+  - tag bitsets as N x words uint64 matrices, the tags themselves (MatchingTag rows) CSR style per entry.
+The TF-IDF vectors of the entries' texts are saved too, so the scores don't depend on the text index either.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.db import models
+
+from ..models import MatchingEntry, MatchingTag, Tag
+from . import bitsets
+from .arrays import EntryArrays, TALKATIVITY_CODES
+from .text_index import TEXT_FIELDS, TextVectors, get_text_index
+
+MAGIC = b'PPSNAP01'
+ALIGNMENT = 64
+VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def write_snapshot(path, queryset=None):
+    """
+    Write the entries in `queryset` (all entries by default), their tags and text vectors to a snapshot file at
+    `path`, in three queries plus the text index's. Returns how many entries were written.
+    """
+    if queryset is None:
+        queryset = MatchingEntry.objects.all()
+    fields = MatchingEntry._meta.concrete_fields
+    rows = list(queryset.order_by('pk').values_list(*(field.attname for field in fields)))
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    arrays, columns = {}, {}
+    for col, field in enumerate(fields):
+        columns[field.attname] = _encode(field, [row[col] for row in rows], arrays)
+
+    tags = list(MatchingTag.objects.filter(matching_entry__in=queryset).order_by(
+        'matching_entry_id', '-describes_album', 'position', 'pk').values_list(
+        'matching_entry_id', 'tag_id', 'describes_album', 'position'))
+    tag_entries = np.fromiter((tag[0] for tag in tags), dtype=np.int64, count=len(tags))
+    arrays['tags.offsets'] = np.searchsorted(tag_entries, np.r_[ids, np.iinfo(np.int64).max]).astype(np.int64)
+    arrays['tags.tag'] = np.fromiter((tag[1] for tag in tags), dtype=np.int32, count=len(tags))
+    arrays['tags.describes_album'] = np.fromiter((tag[2] for tag in tags), dtype=bool, count=len(tags))
+    arrays['tags.position'] = np.fromiter((tag[3] for tag in tags), dtype=np.int16, count=len(tags))
+
+    vocabulary = list(Tag.objects.filter(pk__in=set(arrays['tags.tag'].tolist())).order_by('pk').values_list(
+        'pk', 'tagtype', 'name'))
+    arrays['vocabulary.id'] = np.fromiter((tag[0] for tag in vocabulary), dtype=np.int32, count=len(vocabulary))
+    vocabulary_columns = {
+        'tagtype': _encode(Tag._meta.get_field('tagtype'), [tag[1] for tag in vocabulary], arrays, 'vocabulary.'),
+        'name': _encode(Tag._meta.get_field('name'), [tag[2] for tag in vocabulary], arrays, 'vocabulary.'),
+    }
+
+    index = get_text_index()
+    text_columns = [fields.index(MatchingEntry._meta.get_field(name)) for name in TEXT_FIELDS]
+    index.update((row[0], *(row[col] for col in text_columns)) for row in rows)
+    for name, array in index.text_vectors(ids.tolist()).arrays().items():
+        arrays[f'text.{name}'] = array
+
+    header = {'version': VERSION, 'created': time.time(), 'entries': len(rows),
+              'columns': columns, 'vocabulary': vocabulary_columns, 'arrays': {}}
+    # Offsets are from the start of the data, the first aligned position after the header
+    header_offsets, offset = {}, 0
+    for name, array in arrays.items():
+        header['arrays'][name] = (array.dtype.str, array.shape, offset)
+        header_offsets[name] = offset
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps(header).encode()
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(MAGIC + np.uint64(len(header)).tobytes() + header)
+        start = _aligned(file.tell())
+        for name, array in arrays.items():
+            file.write(b'\0' * (start + header_offsets[name] - file.tell()))
+            file.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temporary, path)
+    return len(rows)
+
+
+class RoundSnapshot:
+    """A snapshot file memory mapped, `arrays` are read only views of the file by name."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a round snapshot.')
+            length = int(np.frombuffer(file.read(8), dtype=np.uint64)[0])
+            header = json.loads(file.read(length))
+        if header['version'] != VERSION:
+            raise ValueError(f'{path} is a version {header["version"]} snapshot, this reads version {VERSION}.')
+        self.path = path
+        self.created = header['created']
+        self.columns = header['columns']
+        self.vocabulary_columns = header['vocabulary']
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        start = _aligned(len(MAGIC) + 8 + length)
+        self.arrays = {name: np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=self._map, offset=start + offset)
+                       for name, (dtype, shape, offset) in header['arrays'].items()}
+        self.ids = self.arrays['user_id']
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, name):
+        """One field of every entry, decoded: an array, or a list of strings for text."""
+        return _decode(self.columns[name], self.arrays)
+
+    def text(self, name, row):
+        """One text field of the entry at `row`, without decoding the whole column."""
+        offsets, blob = self.arrays[f'{name}.offsets'], self.arrays[f'{name}.blob']
+        return bytes(blob[offsets[row]:offsets[row + 1]]).decode()
+
+    def tags(self, row):
+        """The tags of the entry at `row`, as (tag id, describes_album, position) tuples."""
+        start, stop = self.arrays['tags.offsets'][row:row + 2]
+        return list(zip(self.arrays['tags.tag'][start:stop].tolist(),
+                        self.arrays['tags.describes_album'][start:stop].tolist(),
+                        self.arrays['tags.position'][start:stop].tolist()))
+
+    def vocabulary(self):
+        """The tags used by the entries, as {id: (tagtype, name)}."""
+        return dict(zip(self.arrays['vocabulary.id'].tolist(), zip(
+            _decode(self.vocabulary_columns['tagtype'], self.arrays),
+            _decode(self.vocabulary_columns['name'], self.arrays))))
+
+    def macrogenre_tags(self):
+        tagtypes = _decode(self.vocabulary_columns['tagtype'], self.arrays)
+        macrogenre = np.array([tagtype == Tag.TagType.MACROGENRE for tagtype in tagtypes], dtype=bool)
+        return self.arrays['vocabulary.id'][macrogenre].astype(np.int64)
+
+    def entry_arrays(self, text=True):
+        """
+        The EntryArrays of the round, like EntryArrays.from_queryset but without any query. The answers, triplet
+        flags and text vectors stay views of the file, the tag matrices, talkativity and narrower ids are copies.
+        """
+        categories = self.columns['talkativity_preference']['categories']
+        codes = np.array([TALKATIVITY_CODES[value] for value in categories], dtype=np.int8)
+        talkativity = codes[self.arrays['talkativity_preference.codes']]
+        columns = [self.arrays[name].astype(np.int8, copy=False) for name in
+                   ('minds_talking', 'minds_not_talking', 'adventurous', 'person_above_adventure')]
+        text_vectors = None
+        if text:
+            text_vectors = TextVectors(**{name[len('text.'):]: array for name, array in self.arrays.items()
+                                          if name.startswith('text.')})
+        return EntryArrays.from_columns(self.ids.astype(np.int64, copy=False), talkativity, columns, self.arrays['triplet'],
+                                        self.arrays['album_tag_bits.words'], self.arrays['match_tag_bits.words'],
+                                        text_vectors)
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _int_array(values):
+    array = np.array(values, dtype=np.int64)
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if not len(array) or (array.min() >= info.min and array.max() <= info.max):
+            return array.astype(dtype)
+    return array
+
+
+def _encode(field, values, arrays, prefix=''):
+    """Add the arrays of one column to `arrays`, returns its description for the header."""
+    name = prefix + field.attname
+    if isinstance(field, models.BinaryField):
+        arrays[f'{name}.words'] = bitsets.to_words([bytes(value) for value in values])
+        return {'kind': 'bitset', 'name': name}
+    if isinstance(field, models.BooleanField):
+        arrays[name] = np.array(values, dtype=bool)
+        return {'kind': 'bool', 'name': name}
+    if isinstance(field, models.DateTimeField):
+        arrays[name] = np.array([(value - _EPOCH) // timedelta(microseconds=1) for value in values], dtype=np.int64)
+        return {'kind': 'datetime', 'name': name}
+    if isinstance(field, (models.IntegerField, models.ForeignKey)):
+        arrays[name] = _int_array(values)
+        return {'kind': 'int', 'name': name}
+    if isinstance(field, (models.CharField, models.TextField)) and field.choices:
+        categories = [value for value, _ in field.choices]
+        categories += sorted(set(values) - set(categories))
+        codes = {value: code for code, value in enumerate(categories)}
+        arrays[f'{name}.codes'] = _int_array([codes[value] for value in values])
+        return {'kind': 'category', 'name': name, 'categories': categories}
+    if isinstance(field, (models.CharField, models.TextField)):
+        encoded = [value.encode() for value in values]
+        arrays[f'{name}.offsets'] = np.concatenate([[0], np.cumsum([len(value) for value in encoded])]).astype(np.int64)
+        arrays[f'{name}.blob'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return {'kind': 'text', 'name': name}
+    raise ValueError(f'Snapshots can\'t store {type(field).__name__} fields like {field.attname}.')
+
+
+def _decode(column, arrays):
+    name = column['name']
+    if column['kind'] == 'bitset':
+        return arrays[f'{name}.words']
+    if column['kind'] == 'datetime':
+        return arrays[name].astype('datetime64[us]')
+    if column['kind'] == 'category':
+        return np.array(column['categories'], dtype=object)[arrays[f'{name}.codes']]
+    if column['kind'] == 'text':
+        offsets, blob = arrays[f'{name}.offsets'], bytes(arrays[f'{name}.blob'])
+        return [blob[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+    return arrays[name]
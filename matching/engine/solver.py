@@ -0,0 +1,285 @@
+"""
+Maximum weight perfect matching over a dense symmetric score matrix.
+
+An exact blossom algorithm is far too slow in Python for rounds of thousands of entries, so the matching is solved
+through its assignment relaxation instead: every entry is assigned a different partner with the auction algorithm
+(epsilon scaling, bidders vectorised with NumPy). The assignment is a permutation, its 2-cycles are pairs and
+longer cycles are split into the best alternating set of pairs. Whatever is left over is solved again on its own,
+and the pairs are finally improved by 2-opt swaps until nothing improves or the time budget runs out.
+Problems of at most EXACT_SIZE entries, like the leftovers and the neighbourhoods of a repair, are solved exactly
+with a dynamic programme over the subsets of their entries instead.
+
+The auction prices give a dual bound on the assignment, and for an even number of entries half of it is an upper
+bound on the best possible matching, which tells us how far from optimal a solution can be.
+"""
+import time
+
+import numpy as np
+
+# Bidders are processed in chunks so that the chunk x N temporaries stay small
+CHUNK_SIZE = 1024
+# Each epsilon scaling phase divides epsilon by this
+EPSILON_FACTOR = 5
+# Epsilon of the last phase, the assignment is within N * epsilon of the best one
+FINAL_EPSILON = 1e-4
+# Problems this small are solved exactly, in about 2 ** EXACT_SIZE * EXACT_SIZE steps
+EXACT_SIZE = 12
+
+
+class MatchingResult:
+    def __init__(self, pairs, unmatched, objective, upper_bound, solve_time):
+        self.pairs = pairs
+        self.unmatched = unmatched
+        self.objective = objective
+        self.upper_bound = upper_bound
+        self.solve_time = solve_time
+
+
+def max_weight_matching(weights, time_budget=30.0, candidates=None):
+    """
+    Pair up the rows of the symmetric `weights` matrix so that the sum of the weights of the pairs is as high as
+    possible. `candidates` optionally restricts the problem to some row indices.
+    Returns a MatchingResult whose `pairs` is a k x 2 array of row indices and `unmatched` the rows left alone,
+    at most one unless the time budget ran out.
+    """
+    start = time.perf_counter()
+    deadline = start + time_budget
+    nodes = np.arange(len(weights)) if candidates is None else np.asarray(candidates)
+
+    pairs, unmatched, upper_bound = _solve(weights, nodes, deadline, bound=True)
+    pairs = _two_opt(weights, pairs, deadline)
+
+    return MatchingResult(pairs, unmatched, _pairs_weight(weights, pairs), upper_bound, time.perf_counter() - start)
+
+
+def _solve(weights, nodes, deadline, bound=False):
+    pairs = []
+    upper_bound = None
+    while len(nodes) >= 2:
+        if len(nodes) <= EXACT_SIZE:
+            local_pairs, left = exact_matching(weights[np.ix_(nodes, nodes)])
+            pairs.append(nodes[local_pairs])
+            if bound:
+                # Nothing can beat an exact solution
+                upper_bound = _pairs_weight(weights, pairs[-1])
+            nodes = nodes[left]
+            break
+        sub = weights[np.ix_(nodes, nodes)]
+        assignment, prices = auction_assignment(sub, deadline)
+        if bound and len(nodes) % 2 == 0:
+            upper_bound = _dual_bound(sub, prices) / 2
+        bound = False
+        local_pairs, left = _split_cycles(sub, assignment)
+        pairs.append(nodes[local_pairs])
+        if len(left) == len(nodes) or time.perf_counter() > deadline:
+            nodes = nodes[left]
+            break
+        nodes = nodes[left]
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    return pairs, nodes, upper_bound
+
+
+def _pairs_weight(weights, pairs):
+    return float(weights[pairs[:, 0], pairs[:, 1]].astype(np.float64).sum()) if len(pairs) else 0.0
+
+
+def exact_matching(weights):
+    """
+    The best matching of a small symmetric `weights` matrix, pairing everybody but one when there is an odd number of
+    them, like `max_weight_matching`. best[mask] is the best matching of the rows in the bitmask `mask`, found by
+    pairing its lowest row with each of the others (or leaving it alone, once, when the count is odd).
+    Returns the pairs as a k x 2 array and the row left alone, if any.
+    """
+    n = len(weights)
+    values = weights.astype(np.float64).tolist()
+    best = [0.0] * (1 << n)
+    choice = [-1] * (1 << n)
+    odd = [False] * (1 << n)
+    for mask in range(1, 1 << n):
+        odd[mask] = not odd[mask & (mask - 1)]
+        low = (mask & -mask).bit_length() - 1
+        rest = mask & ~(1 << low)
+        if odd[mask]:
+            best[mask], choice[mask] = best[rest], low
+        else:
+            best[mask] = -np.inf
+        row = values[low]
+        other = rest
+        while other:
+            bit = other & -other
+            j = bit.bit_length() - 1
+            value = row[j] + best[rest & ~bit]
+            if value > best[mask]:
+                best[mask], choice[mask] = value, j
+            other &= other - 1
+
+    pairs, left = [], []
+    mask = (1 << n) - 1
+    while mask:
+        low = (mask & -mask).bit_length() - 1
+        j = choice[mask]
+        if j == low:
+            left.append(low)
+            mask &= ~(1 << low)
+        else:
+            pairs.append((low, j))
+            mask &= ~(1 << low) & ~(1 << j)
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2), np.array(left, dtype=np.int64)
+
+
+def auction_assignment(weights, deadline):
+    """
+    Assign each row a column other than itself, maximising the total weight, with the auction algorithm.
+    Returns the assignment (row -> column) and the final prices of the columns.
+    If the deadline passes mid phase the assignment of the last finished phase is returned.
+    """
+    n = len(weights)
+    prices = np.zeros(n)
+    spread = float(weights.max() - weights.min()) or 1.0
+    epsilon = spread / EPSILON_FACTOR
+    best_assignment = None
+
+    while True:
+        assignment = _auction_phase(weights, prices, epsilon, deadline)
+        if assignment is None:
+            break
+        best_assignment = assignment
+        if epsilon <= FINAL_EPSILON:
+            break
+        epsilon = max(epsilon / EPSILON_FACTOR, FINAL_EPSILON)
+
+    if best_assignment is None:
+        # Not even the first phase finished, fall back to any valid assignment
+        best_assignment = np.roll(np.arange(n), 1)
+    return best_assignment, prices
+
+
+def _auction_phase(weights, prices, epsilon, deadline):
+    n = len(weights)
+    owner = np.full(n, -1)
+    assignment = np.full(n, -1)
+    unassigned = np.arange(n)
+
+    while len(unassigned):
+        if time.perf_counter() > deadline:
+            return None
+        targets = np.empty(len(unassigned), dtype=np.int64)
+        bids = np.empty(len(unassigned))
+        for start in range(0, len(unassigned), CHUNK_SIZE):
+            rows = unassigned[start:start + CHUNK_SIZE]
+            index = np.arange(len(rows))
+            values = weights[rows] - prices
+            values[index, rows] = -np.inf
+            best = values.argmax(axis=1)
+            best_value = values[index, best]
+            values[index, best] = -np.inf
+            second_value = values.max(axis=1)
+            targets[start:start + CHUNK_SIZE] = best
+            bids[start:start + CHUNK_SIZE] = prices[best] + (best_value - second_value) + epsilon
+
+        # The highest bid for each column wins it
+        order = np.lexsort((bids, targets))
+        sorted_targets = targets[order]
+        last = np.r_[sorted_targets[1:] != sorted_targets[:-1], True]
+        winners = order[last]
+        columns = targets[winners]
+
+        evicted = owner[columns]
+        evicted = evicted[evicted >= 0]
+        assignment[evicted] = -1
+        owner[columns] = unassigned[winners]
+        assignment[unassigned[winners]] = columns
+        prices[columns] = bids[winners]
+
+        losers = np.ones(len(unassigned), dtype=bool)
+        losers[winners] = False
+        unassigned = np.concatenate([unassigned[losers], evicted])
+    return assignment
+
+
+def _dual_bound(weights, prices):
+    profits = np.empty(len(weights))
+    for start in range(0, len(weights), CHUNK_SIZE):
+        rows = np.arange(start, min(start + CHUNK_SIZE, len(weights)))
+        values = weights[rows] - prices
+        values[np.arange(len(rows)), rows] = -np.inf
+        profits[rows] = values.max(axis=1)
+    return float(prices.sum() + profits.sum())
+
+
+def _split_cycles(weights, assignment):
+    """Turn a permutation into pairs, keeping the better alternating half of each cycle."""
+    n = len(assignment)
+    seen = np.zeros(n, dtype=bool)
+    pairs = []
+    left = []
+    for start in range(n):
+        if seen[start]:
+            continue
+        cycle = [start]
+        seen[start] = True
+        node = assignment[start]
+        while node != start:
+            cycle.append(node)
+            seen[node] = True
+            node = assignment[node]
+        cycle = np.array(cycle)
+        length = len(cycle)
+
+        if length == 1:
+            left.append(cycle[0])
+            continue
+        if length == 2:
+            pairs.append(cycle)
+            continue
+        # edges[k] joins cycle[k] and cycle[k + 1]
+        edges = weights[cycle, np.roll(cycle, -1)].astype(np.float64)
+        if length % 2 == 0:
+            first = 0 if edges[0::2].sum() >= edges[1::2].sum() else 1
+        else:
+            # Leaving out cycle[d] keeps edges d + 1, d + 3, ... d + length - 2, summed with alternating prefix sums
+            doubled = np.concatenate([edges, edges])
+            alternating = doubled.copy()
+            alternating[2:] = 0
+            for k in range(2, len(doubled)):
+                alternating[k] = doubled[k] + alternating[k - 2]
+            dropped = np.arange(length)
+            totals = alternating[dropped + length - 2] - np.where(dropped >= 1, alternating[dropped - 1], 0)
+            drop = int(totals.argmax())
+            left.append(cycle[drop])
+            cycle = np.roll(cycle, -(drop + 1))[:length - 1]
+            first = 0
+        starts = np.arange(first, first + (len(cycle) // 2) * 2, 2)
+        pairs.extend(np.stack([cycle[starts % length], cycle[(starts + 1) % length]], axis=1))
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    return pairs, np.array(left, dtype=np.int64)
+
+
+def _two_opt(weights, pairs, deadline):
+    """Swap partners between two pairs whenever it increases the total, until no swap helps or time runs out."""
+    if len(pairs) < 2:
+        return pairs
+    pairs = pairs.copy()
+    first, second = pairs[:, 0], pairs[:, 1]
+    improved = True
+    while improved:
+        improved = False
+        for p in range(len(pairs)):
+            if time.perf_counter() > deadline:
+                return pairs
+            a, b = first[p], second[p]
+            current = weights[a, b] + weights[first, second]
+            swap_second = weights[a, first] + weights[b, second] - current
+            swap_first = weights[a, second] + weights[b, first] - current
+            swap_second[p] = swap_first[p] = 0
+            q_second, q_first = swap_second.argmax(), swap_first.argmax()
+            if max(swap_second[q_second], swap_first[q_first]) <= 1e-6:
+                continue
+            improved = True
+            if swap_second[q_second] >= swap_first[q_first]:
+                q = q_second
+                first[p], second[p], first[q], second[q] = a, first[q], b, second[q]
+            else:
+                q = q_first
+                first[p], second[p], first[q], second[q] = a, second[q], b, first[q]
+    return pairs
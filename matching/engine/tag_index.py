@@ -0,0 +1,160 @@
+"""
+In-process inverted index over MatchingTag.
+
+Every (tagtype, name, describes_album) key maps to the sorted array of the ids of the entries that have that tag,
+so "who has these tags" questions become merges of a few small sorted arrays instead of scans of the tag table.
+The index also keeps the opposite direction (the keys of each entry) so that looking up the candidates for one
+entry doesn't need the database at all.
+
+Both directions are stored CSR style: one flat array of values plus an offsets array, which is also how they are
+saved to disk.
+
+engine.candidates uses `candidates` to pick the entries to score an entry against when candidates are found by
+tag overlap (refresh_candidates' `tag_recall`).
+"""
+import numpy as np
+
+from ..models import MatchingTag, Tag
+
+# How many entries `candidates` finds in each direction
+TAG_CANDIDATES = 50
+
+
+class TagIndex:
+    def __init__(self, keys, offsets, postings, entries, entry_offsets, entry_keys):
+        # keys[k] is (tagtype, name, describes_album), its posting list is postings[offsets[k]:offsets[k + 1]]
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        # The keys of entries[e] are entry_keys[entry_offsets[e]:entry_offsets[e + 1]], as indices into keys
+        self.entries = entries
+        self.entry_offsets = entry_offsets
+        self.entry_keys = entry_keys
+        self.key_index = {key: k for k, key in enumerate(keys)}
+
+    @classmethod
+    def build(cls, queryset=None):
+        """
+        Build the index from the tags in `queryset` (every tag by default) with one query over the integer tag rows
+        and one over the vocabulary.
+        """
+        if queryset is None:
+            queryset = MatchingTag.objects.all()
+        rows = np.array(queryset.order_by('tag_id', 'describes_album', 'matching_entry_id').values_list(
+            'tag_id', 'describes_album', 'matching_entry_id').distinct(), dtype=np.int64).reshape(-1, 3)
+        return cls._from_rows(rows, Tag.objects.all())
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Build the index from the tag matrices of an EntryArrays, with one query over the round's vocabulary."""
+        rows = [np.empty((0, 3), dtype=np.int64)]
+        for describes_album, tags in ((1, arrays.album_tags), (0, arrays.match_tags)):
+            entries, cols = np.nonzero(tags)
+            rows.append(np.column_stack([arrays.tag_keys[cols], np.full(len(cols), describes_album),
+                                         arrays.ids[entries]]).astype(np.int64))
+        rows = np.concatenate(rows)
+        rows = rows[np.lexsort((rows[:, 2], rows[:, 1], rows[:, 0]))]
+        return cls._from_rows(rows, Tag.objects.filter(pk__in=arrays.tag_keys.tolist()))
+
+    @classmethod
+    def _from_rows(cls, rows, tags):
+        # rows are (tag id, describes_album, entry id) sorted in that order, without duplicates
+        vocabulary = {pk: (tagtype, name) for pk, tagtype, name in tags.values_list('pk', 'tagtype', 'name')}
+
+        # Rows are sorted by (tag, describes_album) so every key is one run of rows
+        packed = rows[:, 0] * 2 + rows[:, 1]
+        key_starts = np.flatnonzero(np.r_[True, packed[1:] != packed[:-1]]) if len(rows) else packed
+        keys = [vocabulary[tag_id] + (bool(describes_album),) for tag_id, describes_album in rows[key_starts, :2]]
+        offsets = np.append(key_starts, len(rows))
+        postings = rows[:, 2]
+        key_of_row = np.repeat(np.arange(len(keys)), np.diff(offsets))
+
+        by_entry = np.lexsort((key_of_row, postings))
+        entries, entry_starts = np.unique(postings[by_entry], return_index=True)
+        entry_offsets = np.append(entry_starts, len(postings))
+        return cls(keys, offsets, postings, entries, entry_offsets, key_of_row[by_entry])
+
+    def posting_list(self, tagtype, name, describes_album):
+        k = self.key_index.get((tagtype, name, describes_album))
+        if k is None:
+            return self.postings[:0]
+        return self.postings[self.offsets[k]:self.offsets[k + 1]]
+
+    def _lists(self, keys):
+        return [self.posting_list(*key) for key in keys]
+
+    def intersect(self, keys):
+        """Ids of the entries that have every one of `keys`."""
+        lists = sorted(self._lists(keys), key=len)
+        if not lists:
+            return self.postings[:0]
+        result = lists[0]
+        for posting_list in lists[1:]:
+            result = np.intersect1d(result, posting_list, assume_unique=True)
+        return result
+
+    def union(self, keys):
+        """Ids of the entries that have at least one of `keys`."""
+        lists = self._lists(keys)
+        if not lists:
+            return self.postings[:0]
+        return np.unique(np.concatenate(lists))
+
+    def top_k_overlap(self, keys, k, exclude=()):
+        """
+        The (at most) `k` entries having the most of `keys`, best first, as (entry ids, overlap counts).
+        Ties are broken by entry id.
+        """
+        lists = self._lists(keys)
+        if not lists:
+            return self.postings[:0], self.postings[:0]
+        entry_ids, counts = np.unique(np.concatenate(lists), return_counts=True)
+        if len(exclude):
+            keep = ~np.isin(entry_ids, exclude)
+            entry_ids, counts = entry_ids[keep], counts[keep]
+        best = np.lexsort((entry_ids, -counts))[:k]
+        return entry_ids[best], counts[best]
+
+    def entry_tags(self, entry_id, describes_album=None):
+        """The keys of one entry, optionally only the album (True) or the wanted (False) ones."""
+        e = np.searchsorted(self.entries, entry_id)
+        if e == len(self.entries) or self.entries[e] != entry_id:
+            return []
+        keys = [self.keys[k] for k in self.entry_keys[self.entry_offsets[e]:self.entry_offsets[e + 1]]]
+        if describes_album is None:
+            return keys
+        return [key for key in keys if key[2] == describes_album]
+
+    def candidates_for(self, entry_id, k=TAG_CANDIDATES):
+        """The entries whose albums have the most of what `entry_id` wants in a match."""
+        wanted = [(tagtype, name, True) for tagtype, name, _ in self.entry_tags(entry_id, describes_album=False)]
+        return self.top_k_overlap(wanted, k, exclude=[entry_id])
+
+    def wanted_by(self, entry_id, k=TAG_CANDIDATES):
+        """The entries who want the most of what `entry_id`'s album has, the other way round from `candidates_for`."""
+        album = [(tagtype, name, False) for tagtype, name, _ in self.entry_tags(entry_id, describes_album=True)]
+        return self.top_k_overlap(album, k, exclude=[entry_id])
+
+    def candidates(self, entry_id, k=TAG_CANDIDATES):
+        """
+        The ids of the `candidates_for` and the `wanted_by` `entry_id`, as a sorted array, the way
+        MinHashIndex.candidates finds them.
+        """
+        return np.union1d(self.candidates_for(entry_id, k)[0], self.wanted_by(entry_id, k)[0])
+
+    def save(self, path):
+        tagtypes, names, describes_album = zip(*self.keys) if self.keys else ((), (), ())
+        np.savez(
+            path,
+            tagtypes=np.array(tagtypes, dtype=str), names=np.array(names, dtype=str),
+            describes_album=np.array(describes_album, dtype=bool),
+            offsets=self.offsets, postings=self.postings,
+            entries=self.entries, entry_offsets=self.entry_offsets, entry_keys=self.entry_keys
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            keys = list(zip(data['tagtypes'].tolist(), data['names'].tolist(), data['describes_album'].tolist()))
+            return cls(keys, data['offsets'], data['postings'],
+                       data['entries'], data['entry_offsets'], data['entry_keys'])
@@ -0,0 +1,297 @@
+"""
+TF-IDF vectors of the entries' free text answers, for the text part of the fit score.
+
+Every entry has two documents: its album (`album_description`) and what it wants (`match_description` together
+with `what_get_out`). How well B's album answers A's wishes is the cosine similarity of A's wishes with B's album.
+
+Term weights are (1 + log tf) * idf, with the idf frozen when the index is built: entries whose texts change
+are vectorised again against the same idf (a term nobody used at build time gets the idf of a term with no
+documents), so one entry's edit never moves anybody else's scores. `build` computes the idf again from scratch.
+
+Vectors are kept per entry together with a hash of the entry's texts, so keeping the index up to date only
+tokenises the entries whose texts changed. The commands which bring it up to date (refresh_candidates,
+solve_matches, rebuild_text_index) save it to settings.MATCHING_TEXT_INDEX_PATH when set, see `save_text_index`.
+
+Similarities are computed with plain NumPy sparse arithmetic, see TextVectors.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+from ..models import MatchingEntry
+
+TEXT_FIELDS = ('album_description', 'match_description', 'what_get_out')
+
+_TOKEN = re.compile(r"[^\W\d_]{2,}")
+STOP_WORDS = frozenset('''
+    about all also am an and any are as at be because been but by can could did do does for from get got had has
+    have he her him his how if in into is it its just like me more most much my no not of on one or our out really
+    she so some something than that the their them then there these they this to too up us very want was we
+    were what when which who will with would you your
+'''.split())
+
+_cached_index = None
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.casefold()) if token not in STOP_WORDS]
+
+
+def text_hash(album_description, match_description, what_get_out):
+    digest = hashlib.blake2b('\0'.join((album_description, match_description, what_get_out)).encode(),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+class TextIndex:
+    def __init__(self, terms, idf, documents):
+        # idf[t] is the weight of terms[t], which is column t of the vectors
+        self.terms = list(terms)
+        self.idf = list(idf)
+        self.term_index = {term: t for t, term in enumerate(self.terms)}
+        # The number of documents the idf was computed over, for the idf of terms added later
+        self.documents = documents
+        # entry id: (text hash, wanted vector, album vector), vectors are (sorted columns, weights) arrays
+        self.vectors = {}
+        self.changed = False
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, queryset=None):
+        """Index the entries in `queryset` (all entries by default) with a new idf, in one query."""
+        if queryset is None:
+            queryset = MatchingEntry.objects.all()
+        rows = list(queryset.values_list('pk', *TEXT_FIELDS))
+        tokens = {pk: (tokenize(album), tokenize(wanted + ' ' + get_out)) for pk, album, wanted, get_out in rows}
+
+        frequencies = {}
+        for album, wanted in tokens.values():
+            for term in set(album).union(wanted):
+                frequencies[term] = frequencies.get(term, 0) + 1
+        terms = sorted(frequencies)
+        idf = [float(np.log((1 + len(rows)) / (1 + frequencies[term])) + 1) for term in terms]
+        index = cls(terms, idf, len(rows))
+        for pk, album, wanted, get_out in rows:
+            index._add(pk, text_hash(album, wanted, get_out), *tokens[pk])
+        return index
+
+    def _column(self, term):
+        t = self.term_index.get(term)
+        if t is None:
+            t = self.term_index[term] = len(self.terms)
+            self.terms.append(term)
+            self.idf.append(float(np.log(1 + self.documents) + 1))
+        return t
+
+    def vector(self, tokens):
+        """The unit length TF-IDF vector of a list of tokens, as (sorted columns, weights)."""
+        counts = {}
+        for token in tokens:
+            t = self._column(token)
+            counts[t] = counts.get(t, 0) + 1
+        columns = np.array(sorted(counts), dtype=np.int64)
+        weights = np.array([(1 + np.log(counts[t])) * self.idf[t] for t in columns.tolist()], dtype=np.float64)
+        norm = np.sqrt(np.dot(weights, weights))
+        return columns, (weights / norm if norm else weights).astype(np.float32)
+
+    def _add(self, entry_id, digest, album_tokens, wanted_tokens):
+        self.vectors[entry_id] = (digest, self.vector(wanted_tokens), self.vector(album_tokens))
+        self.changed = True
+
+    def update(self, rows):
+        """
+        Bring the vectors of the entries in `rows` ((id, album_description, match_description, what_get_out) tuples)
+        up to date, only tokenising the entries whose texts changed. Returns how many were vectorised.
+        """
+        updated = 0
+        for pk, album, wanted, get_out in rows:
+            digest = text_hash(album, wanted, get_out)
+            known = self.vectors.get(pk)
+            if known is None or known[0] != digest:
+                self._add(pk, digest, tokenize(album), tokenize(wanted + ' ' + get_out))
+                updated += 1
+        return updated
+
+    def remove(self, entry_ids):
+        for pk in entry_ids:
+            if self.vectors.pop(pk, None) is not None:
+                self.changed = True
+
+    def text_vectors(self, ids):
+        """The TextVectors of the entries with `ids`, which have to be indexed, in that order."""
+        wanted = [self.vectors[pk][1] for pk in ids]
+        album = [self.vectors[pk][2] for pk in ids]
+        return TextVectors(*_stack(wanted), *_stack(album), len(self.terms))
+
+    def save(self, path):
+        """
+        Save the index to a .npz file, through a temporary file of its own so readers never see half of it and
+        processes saving at the same time don't write over each other's temporary files.
+        """
+        ids = np.fromiter(self.vectors, dtype=np.int64, count=len(self.vectors))
+        hashes = np.array([self.vectors[pk][0] for pk in ids.tolist()], dtype=np.int64)
+        wanted = _stack([self.vectors[pk][1] for pk in ids.tolist()])
+        album = _stack([self.vectors[pk][2] for pk in ids.tolist()])
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp.npz',
+                                         delete=False) as temporary:
+            try:
+                np.savez(temporary, terms=np.array(self.terms, dtype=str),
+                         idf=np.array(self.idf, dtype=np.float64), documents=self.documents, ids=ids, hashes=hashes,
+                         wanted_indptr=wanted[0], wanted_indices=wanted[1], wanted_data=wanted[2],
+                         album_indptr=album[0], album_indices=album[1], album_data=album[2])
+            except BaseException:
+                temporary.close()
+                os.unlink(temporary.name)
+                raise
+        os.replace(temporary.name, path)
+        self.changed = False
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(data['terms'].tolist(), data['idf'].tolist(), int(data['documents']))
+            wanted = _unstack(data['wanted_indptr'], data['wanted_indices'], data['wanted_data'])
+            album = _unstack(data['album_indptr'], data['album_indices'], data['album_data'])
+            index.vectors = dict(zip(data['ids'].tolist(), zip(data['hashes'].tolist(), wanted, album)))
+        return index
+
+
+class TextVectors:
+    """
+    The wanted and album vectors of the entries of a round, row `i` for the entry at row `i` of its EntryArrays,
+    stored CSR style: the columns of row i are indices[indptr[i]:indptr[i + 1]] and their weights are in data.
+
+    `similarity_block` multiplies sparse rows with sparse rows through the column major copies (one posting list
+    of (row, weight) per term) which are built here: every (row, term) of the block is paired with the posting
+    list of its term and the products are summed per pair of rows with one bincount. Against a few `cols`, the
+    posting lists of just those rows are built for the block instead.
+    """
+
+    def __init__(self, wanted_indptr, wanted_indices, wanted_data, album_indptr, album_indices, album_data, n_terms):
+        self.wanted = (wanted_indptr, wanted_indices, wanted_data)
+        self.album = (album_indptr, album_indices, album_data)
+        self.n_terms = int(n_terms)
+        self.wanted_postings = _postings(*self.wanted, self.n_terms)
+        self.album_postings = _postings(*self.album, self.n_terms)
+
+    def __len__(self):
+        return len(self.wanted[0]) - 1
+
+    def arrays(self):
+        """The arrays this is made of by name, to rebuild it with TextVectors(**arrays)."""
+        return dict(zip(('wanted_indptr', 'wanted_indices', 'wanted_data'), self.wanted),
+                    **dict(zip(('album_indptr', 'album_indices', 'album_data'), self.album)),
+                    n_terms=np.array(self.n_terms))
+
+    def similarity_block(self, rows, cols=None):
+        """
+        Cosine similarities of what the entries at `rows` want with the albums of every entry (or the entries at
+        `cols`), and of their albums with what the others want, as two len(rows) x N float32 arrays.
+        Each pair's products are summed in the order of the terms' columns whichever row the pair is computed from,
+        so the second array is exactly the transpose of the first one computed from the other side.
+        """
+        if cols is None:
+            return (_dot(self.wanted, rows, self.album_postings, len(self)),
+                    _dot(self.album, rows, self.wanted_postings, len(self)))
+        return (_dot(self.wanted, rows, _postings(*_take_rows(self.album, cols), self.n_terms), len(cols)),
+                _dot(self.album, rows, _postings(*_take_rows(self.wanted, cols), self.n_terms), len(cols)))
+
+
+def _stack(vectors):
+    lengths = np.fromiter((len(columns) for columns, _ in vectors), dtype=np.int64, count=len(vectors))
+    indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    if not vectors:
+        return indptr, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return (indptr, np.concatenate([columns for columns, _ in vectors]).astype(np.int64),
+            np.concatenate([weights for _, weights in vectors]).astype(np.float32))
+
+
+def _unstack(indptr, indices, data):
+    return [(indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]]) for i in range(len(indptr) - 1)]
+
+
+def _postings(indptr, indices, data, n_terms):
+    # The same matrix column major: the rows having term t are rows[offsets[t]:offsets[t + 1]]
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=n_terms), out=offsets[1:])
+    return offsets, rows[order], data[order]
+
+
+def _take_rows(matrix, rows):
+    """The CSR matrix of the `rows` (an index array) of a CSR matrix."""
+    indptr, indices, data = matrix
+    rows = np.arange(len(indptr) - 1)[rows]
+    lengths = indptr[rows + 1] - indptr[rows]
+    entries = np.repeat(indptr[rows] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64), indices[entries], data[entries]
+
+
+def _dot(matrix, rows, postings, n):
+    # n is the number of rows the postings were built from, the columns of the result
+    offsets, posting_rows, posting_data = postings
+
+    # Every (block row, term, weight) of the block rows, in column order within each row
+    indptr, terms, weights = _take_rows(matrix, rows)
+    block_rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    # Paired with every row in the posting list of their term
+    counts = offsets[terms + 1] - offsets[terms]
+    starts = np.repeat(offsets[terms] - np.cumsum(counts) + counts, counts)
+    postings = starts + np.arange(counts.sum())
+    products = np.repeat(weights.astype(np.float64), counts) * posting_data[postings]
+    bins = np.repeat(block_rows, counts) * n + posting_rows[postings]
+    m = len(indptr) - 1
+    return np.bincount(bins, weights=products, minlength=m * n).reshape(m, n).astype(np.float32)
+
+
+def cosine(a, b):
+    """The similarity of two vectors, one term at a time in column order. Only useful to check TextVectors."""
+    weights = dict(zip(a[0].tolist(), a[1].tolist()))
+    total = 0.0
+    for column, weight in zip(b[0].tolist(), b[1].tolist()):
+        if column in weights:
+            total += weights[column] * weight
+    return np.float32(total)
+
+
+def get_text_index():
+    """
+    The process wide index, loaded from settings.MATCHING_TEXT_INDEX_PATH (or built, when there is no file yet)
+    the first time it is needed.
+    """
+    global _cached_index
+    if _cached_index is None:
+        path = getattr(settings, 'MATCHING_TEXT_INDEX_PATH', None)
+        if path and os.path.exists(path):
+            _cached_index = TextIndex.load(path)
+        else:
+            _cached_index = TextIndex.build()
+    return _cached_index
+
+
+def save_text_index(index=None):
+    """
+    Save `index` (the process wide index by default) to settings.MATCHING_TEXT_INDEX_PATH if it changed since it
+    was loaded, dropping the vectors of the entries deleted since.
+    """
+    index = _cached_index if index is None else index
+    path = getattr(settings, 'MATCHING_TEXT_INDEX_PATH', None)
+    if index is None or not path:
+        return
+    index.remove(set(index.vectors).difference(MatchingEntry.objects.values_list('pk', flat=True)))
+    if index.changed:
+        index.save(path)
+
+
+def set_text_index(index):
+    """Use `index` as the process wide index from now on, after building a new one."""
+    global _cached_index
+    _cached_index = index
@@ -0,0 +1,68 @@
+"""
+Three person groups, built from the pairwise scores that are already in memory.
+
+A group's score is the mean of the scores of the pairs inside it, so a pair scores its own weight.
+Trying every possible split into triples is hopeless, so `form_triplets` starts from a random split and then keeps
+swapping two people between groups whenever that increases the total, evaluating all the swaps for one person with
+a few array operations. It stops when a full pass finds nothing better or the deadline passes.
+"""
+import time
+
+import numpy as np
+
+# The other two positions of a triple for each position
+_OTHERS = np.array([[1, 2], [0, 2], [0, 1]])
+
+
+def group_score(weights, group):
+    group = list(group)
+    pair_scores = [weights[a, b] for i, a in enumerate(group) for b in group[i + 1:]]
+    return float(np.mean(pair_scores)) if pair_scores else 0.0
+
+
+def form_triplets(weights, members, deadline, seed=0):
+    """
+    Split `members` (row indices of `weights`) into triples with a high total score.
+    Returns a k x 3 array of triples and the (up to two) members that didn't fit in one.
+    """
+    members = np.asarray(members)
+    rng = np.random.default_rng(seed)
+    members = rng.permutation(members)
+    k = len(members) // 3
+    left = members[3 * k:]
+    triples = members[:3 * k].reshape(k, 3)
+    if k < 2:
+        return triples, left
+
+    others = triples[:, _OTHERS]
+    # contribution[t, s] - the sum of the scores of the person at triples[t, s] with the other two in their triple
+    contribution = weights[triples[:, :, None], others].sum(axis=2)
+    row_of = np.repeat(np.arange(k), 3).reshape(k, 3)
+
+    improved = True
+    while improved:
+        improved = False
+        for t, s in rng.permutation(np.argwhere(np.ones((k, 3), dtype=bool))):
+            if time.perf_counter() > deadline:
+                return triples, left
+            x = triples[t, s]
+            x_others = others[t, s]
+            # Gain of swapping x with every person y in every other triple
+            x_joins = weights[x, others].sum(axis=2)
+            y_joins = weights[triples, x_others[0]] + weights[triples, x_others[1]]
+            gain = x_joins + y_joins - contribution - contribution[t, s]
+            gain[row_of == t] = 0
+            u, v = np.unravel_index(gain.argmax(), gain.shape)
+            if gain[u, v] <= 1e-6:
+                continue
+            improved = True
+            triples[t, s], triples[u, v] = triples[u, v], x
+            for row in (t, u):
+                others[row] = triples[row][_OTHERS]
+                contribution[row] = weights[triples[row][:, None], others[row]].sum(axis=1)
+    return triples, left
+
+
+def absorb(weights, pairs, node):
+    """Index of the pair in `pairs` that `node` fits best into as a third member."""
+    return int((weights[node, pairs[:, 0]] + weights[node, pairs[:, 1]]).argmax())
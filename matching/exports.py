@@ -0,0 +1,63 @@
+"""
+Streaming exports of every entry with its tags, for the moderators' reviews and backups.
+
+Entries are read through a server side cursor `chunk_size` at a time and the tags of each chunk come with one more
+query, so memory use depends on the chunk size and not on how many entries there are. Each entry comes out as
+MatchingEntrySerializer represents it, the same fields and names as the API.
+"""
+import csv
+import json
+from itertools import islice
+
+from .models import MatchingEntry, MatchingTag
+from .serializers import MatchingEntrySerializer
+
+EXPORT_CHUNK_SIZE = 2000
+# Tag lists are joined into one CSV cell with this
+CSV_LIST_SEPARATOR = '; '
+
+
+def export_entries(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Every entry in `queryset` (all entries by default) as a dict, in user id order."""
+    if queryset is None:
+        queryset = MatchingEntry.objects.all()
+    serializer = MatchingEntrySerializer()
+    entries = queryset.order_by('pk').defer('album_tag_bits', 'match_tag_bits').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(entries, chunk_size))
+        if not chunk:
+            return
+        groups = {entry.pk: {} for entry in chunk}
+        tags = MatchingTag.objects.filter(matching_entry_id__in=groups).order_by(
+            'matching_entry_id', 'describes_album', 'position').values_list(
+            'matching_entry_id', 'tag__tagtype', 'tag__name', 'describes_album')
+        for entry_id, tagtype, name, describes_album in tags:
+            groups[entry_id].setdefault((tagtype, describes_album), []).append(name)
+        for entry in chunk:
+            entry.tag_groups = groups[entry.pk]
+            yield serializer.to_representation(entry)
+
+
+def export_fields():
+    return list(MatchingEntrySerializer.Meta.fields)
+
+
+def jsonl_lines(rows):
+    """One JSON document per line."""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # A file for csv.writer which hands every line back instead of keeping it
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    """A header line with `fields`, then one line per row with lists joined by CSV_LIST_SEPARATOR."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(CSV_LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+                              for value in (row.get(field) for field in fields))
@@ -0,0 +1,138 @@
+"""
+Bulk imports of entries and their tags from JSON lines, for migrating signups from another form tool and for
+seeding test environments.
+
+Every line is one entry as MatchingEntrySerializer takes it, plus the `username` (and optionally `email`) of its
+user, who is created if they don't exist yet. Lines in the format of the export (with `user` ids instead of
+usernames) work too when those users exist. Records are validated with the serializer's rules, then written
+`batch_size` at a time with bulk inserts, one transaction per batch.
+
+Users who already have an entry are skipped, so an interrupted import can simply be run again from the start.
+The candidates table isn't updated by bulk inserts, see `import_entries`.
+"""
+import json
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from .engine import bitsets
+from .models import MatchingEntry, MatchingTag, Tag
+from .serializers import MatchingEntrySerializer
+
+IMPORT_BATCH_SIZE = 1000
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        # (line number, errors) of the records which weren't valid
+        self.rejected = []
+        self.start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self):
+        return self.imported / self.seconds if self.seconds else 0.0
+
+
+def import_entries(lines, batch_size=IMPORT_BATCH_SIZE, on_batch=None):
+    """
+    Import the entries in `lines` (JSON strings) and return an ImportResult. `on_batch` is called with the result
+    so far after every batch. Run refresh_candidates afterwards, the candidates don't know about bulk inserts.
+    """
+    result = ImportResult()
+    validator = MatchingEntrySerializer()
+    batch = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            batch.append((number, _user_key(record), validator.run_validation(record)))
+        except (ValueError, serializers.ValidationError) as error:
+            result.rejected.append((number, getattr(error, 'detail', str(error))))
+            continue
+        if len(batch) >= batch_size:
+            _import_batch(validator, batch, result)
+            batch = []
+            if on_batch:
+                on_batch(result)
+    if batch:
+        _import_batch(validator, batch, result)
+        if on_batch:
+            on_batch(result)
+    return result
+
+
+def _user_key(record):
+    if not isinstance(record, dict):
+        raise ValueError('Every line has to be a JSON object.')
+    if record.get('username'):
+        return 'username', str(record['username']), str(record.get('email') or '')
+    if isinstance(record.get('user'), int):
+        return 'user', record['user'], ''
+    raise serializers.ValidationError({'username': 'Every entry needs the username of its user.'})
+
+
+@transaction.atomic
+def _import_batch(validator, batch, result):
+    usernames = {key[1]: key[2] for _, key, _ in batch if key[0] == 'username'}
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+    # Imported users log in after resetting their password, any password starting with ! is unusable
+    password = make_password(None)
+    missing = [User(username=username, email=email, password=password)
+               for username, email in usernames.items() if username not in users]
+    if missing:
+        User.objects.bulk_create(missing, batch_size=IMPORT_BATCH_SIZE)
+        users.update(User.objects.filter(username__in=[user.username for user in missing])
+                     .values_list('username', 'pk'))
+    user_ids = {key[1] for _, key, _ in batch if key[0] == 'user'}
+    known_ids = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    done = set(MatchingEntry.objects.filter(user_id__in=set(users.values()) | known_ids)
+               .values_list('user_id', flat=True))
+
+    records = []
+    for number, key, validated_data in batch:
+        user_id = users[key[1]] if key[0] == 'username' else key[1]
+        if key[0] == 'user' and user_id not in known_ids:
+            result.rejected.append((number, {'user': f'There is no user {user_id}.'}))
+        elif user_id in done:
+            result.skipped += 1
+        else:
+            done.add(user_id)
+            records.append((user_id, dict(validated_data)))
+
+    tags = [validator.pop_tags(validated_data) for _, validated_data in records]
+    tag_ids = Tag.objects.intern(
+        (tagtype, name) for entry_tags in tags for (tagtype, _), names in entry_tags.items() for name in names)
+    entries, rows = [], []
+    for (user_id, validated_data), entry_tags in zip(records, tags):
+        validated_data.setdefault('album_lastfm_should_rerun', True)
+        entry_rows = [(user_id, tag_ids[(tagtype, name)], describes_album, position)
+                      for (tagtype, describes_album), names in entry_tags.items()
+                      for position, name in enumerate(names)]
+        entries.append(MatchingEntry(
+            user_id=user_id, **validated_data,
+            album_tag_bits=bitsets.pack(row[1] for row in entry_rows if row[2]),
+            match_tag_bits=bitsets.pack(row[1] for row in entry_rows if not row[2])))
+        rows.extend(entry_rows)
+    MatchingEntry.objects.bulk_create(entries, batch_size=IMPORT_BATCH_SIZE)
+    _insert_tags(rows)
+    result.imported += len(entries)
+
+
+def _insert_tags(rows):
+    # Tags are most of the rows, a plain executemany skips building a model instance for each of them
+    quote = connection.ops.quote_name
+    columns = [MatchingTag._meta.get_field(name).column
+               for name in ('matching_entry', 'tag', 'describes_album', 'position')]
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {quote(MatchingTag._meta.db_table)} '
+                           f'({", ".join(quote(column) for column in columns)}) VALUES (%s, %s, %s, %s)', rows)
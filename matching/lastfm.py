@@ -0,0 +1,392 @@
+"""
+Last.fm enrichment of the entries' albums: their Last.fm page, cover images and top tags.
+
+Entries are flagged with `album_lastfm_should_rerun` when they are created or their album changes. The worker
+(`enrich_flagged`, run by the enrich_lastfm command) picks flagged entries up a batch at a time, looks every album
+up concurrently and writes a whole batch back at once. The album's Last.fm tags are merged into its MatchingTag rows
+as album tags of type Tag.TagType.LASTFM.
+
+Lookups are cached in the LastfmAlbum table by normalized artist and album (see AlbumCache), and entries
+recommending the same album in a batch share one lookup, so popular albums are only fetched once in a while.
+
+The requests go through one pooled `requests` session driven from asyncio by a thread pool the size of the
+concurrency limit, there is no asynchronous HTTP client among the dependencies. On top of the concurrency limit
+a token bucket keeps the request rate within Last.fm's limits, and failed requests are retried with exponential
+backoff. The API url comes from settings.LASTFM_API_URL so the worker can be pointed at a local stub server.
+"""
+import asyncio
+import random
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import LastfmAlbum, MatchingEntry, MatchingTag, Tag
+from .signals import tag_bits_handled
+
+LASTFM_BATCH_SIZE = 100
+LASTFM_CONCURRENCY = 8
+# Requests per second, Last.fm asks for no more than 5 on average
+LASTFM_RATE = 5.0
+LASTFM_RETRIES = 4
+LASTFM_BACKOFF = 0.5
+LASTFM_TIMEOUT = 10.0
+# How many of the album's top tags to keep
+LASTFM_MAX_TAGS = 10
+LASTFM_CACHE_TTL = timedelta(days=30)
+# Albums Last.fm doesn't know may be added soon, so that answer is kept for less time
+LASTFM_NOT_FOUND_TTL = timedelta(days=1)
+LASTFM_CACHE_SIZE = 50000
+
+# Last.fm error codes worth trying again: operation failed, service offline, temporarily unavailable, rate limited
+RETRYABLE_ERRORS = {8, 11, 16, 29}
+ALBUM_NOT_FOUND = 6
+
+IMAGE_FIELDS = {
+    'small': 'album_image_small_url',
+    'medium': 'album_image_medium_url',
+    'large': 'album_image_large_url',
+    'extralarge': 'album_image_xlarge_url',
+}
+
+
+class LastfmError(Exception):
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Lets `rate` requests per second through on average, in bursts of at most `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AlbumInfo:
+    def __init__(self, url, images, tags):
+        self.url = url
+        # {entry field: url} for the sizes Last.fm has
+        self.images = images
+        self.tags = tags
+
+    @classmethod
+    def from_response(cls, album):
+        images = {IMAGE_FIELDS[image['size']]: image['#text'] for image in album.get('image', [])
+                  if image.get('size') in IMAGE_FIELDS and image.get('#text')}
+        tags = album.get('tags') or {}
+        tags = tags.get('tag', []) if isinstance(tags, dict) else []
+        # A single tag comes as an object rather than a list
+        tags = [tags] if isinstance(tags, dict) else tags
+        names = list(dict.fromkeys(tag['name'].strip().lower() for tag in tags if tag.get('name', '').strip()))
+        return cls(album.get('url', ''), images, names[:LASTFM_MAX_TAGS])
+
+
+def album_key(artist, album):
+    """The cache key of an album: its artist and name case folded, with their whitespace collapsed."""
+    return tuple(' '.join(unicodedata.normalize('NFKC', name).casefold().split())[:256] for name in (artist, album))
+
+
+class AlbumCache:
+    """
+    Album lookups kept in the LastfmAlbum table for `ttl` (`not_found_ttl` for albums Last.fm didn't know), at most
+    `max_size` of them: beyond that the least recently used are evicted. Counts its hits and misses.
+    """
+
+    def __init__(self, ttl=LASTFM_CACHE_TTL, not_found_ttl=LASTFM_NOT_FOUND_TTL, max_size=LASTFM_CACHE_SIZE):
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self):
+        """The share of the keys asked for which were cached, 0 before any."""
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def _rows(self, keys):
+        rows = LastfmAlbum.objects.filter(artist_key__in={artist for artist, _ in keys},
+                                          album_key__in={album for _, album in keys})
+        return [row for row in rows if (row.artist_key, row.album_key) in keys]
+
+    def get_many(self, keys):
+        """{key: AlbumInfo, or None when the album wasn't found} for the keys with a fresh lookup cached."""
+        keys = set(keys)
+        now = timezone.now()
+        found = {}
+        for row in self._rows(keys):
+            if row.fetched_at > now - (self.ttl if row.found else self.not_found_ttl):
+                found[(row.artist_key, row.album_key)] = (
+                    row.pk, AlbumInfo(row.url, row.images, row.tags) if row.found else None)
+        if found:
+            LastfmAlbum.objects.filter(pk__in=[pk for pk, _ in found.values()]).update(
+                used_at=now, hits=F('hits') + 1)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {key: info for key, (_, info) in found.items()}
+
+    @transaction.atomic
+    def put_many(self, infos):
+        """Cache {key: AlbumInfo or None}, replacing what was cached for those keys, then evict."""
+        if not infos:
+            return
+        now = timezone.now()
+        LastfmAlbum.objects.filter(pk__in=[row.pk for row in self._rows(set(infos))]).delete()
+        LastfmAlbum.objects.bulk_create([
+            LastfmAlbum(artist_key=artist, album_key=album, found=info is not None,
+                        url=info.url[:256] if info else '', images=info.images if info else {},
+                        tags=info.tags if info else [], fetched_at=now, used_at=now)
+            for (artist, album), info in infos.items()])
+        self.evict()
+
+    def evict(self):
+        """Delete the expired lookups, and the least recently used ones beyond `max_size`."""
+        now = timezone.now()
+        LastfmAlbum.objects.filter(fetched_at__lt=now - self.ttl).delete()
+        LastfmAlbum.objects.filter(found=False, fetched_at__lt=now - self.not_found_ttl).delete()
+        extra = LastfmAlbum.objects.count() - self.max_size
+        if extra > 0:
+            LastfmAlbum.objects.filter(pk__in=list(
+                LastfmAlbum.objects.order_by('used_at', 'pk').values_list('pk', flat=True)[:extra])).delete()
+
+
+class LastfmClient:
+    """
+    album.getInfo over a pooled HTTP session, at most `concurrency` requests at a time and `rate` per second,
+    each retried up to `retries` times. Use it as an async context manager, or call close() when done.
+    """
+
+    def __init__(self, api_key, url=None, concurrency=LASTFM_CONCURRENCY, rate=LASTFM_RATE,
+                 retries=LASTFM_RETRIES, backoff=LASTFM_BACKOFF, timeout=LASTFM_TIMEOUT):
+        self.api_key = api_key
+        self.url = url or settings.LASTFM_API_URL
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='lastfm')
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate)
+        self.requests = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    async def album_info(self, artist, album):
+        """The AlbumInfo of an album, None if Last.fm doesn't know it. Raises LastfmError once retries run out."""
+        params = {'method': 'album.getinfo', 'api_key': self.api_key, 'artist': artist, 'album': album,
+                  'autocorrect': 1, 'format': 'json'}
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                await self.bucket.acquire()
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self.executor, partial(self._get, params))
+                except LastfmError as error:
+                    if not error.retryable or attempt == self.retries:
+                        raise
+                    delay = error.retry_after or self.backoff * 2 ** attempt
+                    # Jitter, so requests that failed together don't all come back together
+                    await asyncio.sleep(delay * (1 + random.random()))
+
+    def _get(self, params):
+        self.requests += 1
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+        except requests.RequestException as error:
+            raise LastfmError(str(error), retryable=True)
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get('Retry-After')
+            raise LastfmError(f'HTTP {response.status_code}', retryable=True,
+                              retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        try:
+            data = response.json()
+        except ValueError:
+            raise LastfmError(f'HTTP {response.status_code}, not JSON', retryable=response.status_code != 200)
+        if 'error' in data:
+            if data['error'] == ALBUM_NOT_FOUND:
+                return None
+            raise LastfmError(f'Last.fm error {data["error"]}: {data.get("message", "")}',
+                              retryable=data['error'] in RETRYABLE_ERRORS)
+        if response.status_code != 200 or 'album' not in data:
+            raise LastfmError(f'HTTP {response.status_code}, no album in the response')
+        return AlbumInfo.from_response(data['album'])
+
+
+class EnrichmentResult:
+    def __init__(self):
+        self.enriched = 0
+        self.not_found = 0
+        # Still flagged, for the next run
+        self.failed = 0
+        # Changed their album while it was being looked up, still flagged
+        self.changed = 0
+        self.tagged = 0
+        # Entries whose album was cached or looked up for another entry of their batch, and the albums requested
+        self.shared = 0
+        self.looked_up = 0
+        self.start = time.perf_counter()
+
+    @property
+    def seen(self):
+        return self.enriched + self.not_found + self.failed + self.changed
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.seen / elapsed if elapsed else 0.0
+
+
+async def enrich_flagged(client, batch_size=LASTFM_BATCH_SIZE, max_batches=None, on_batch=None, cache=None):
+    """
+    Look up every flagged entry's album, `batch_size` entries at a time, and save the results.
+    The `cache` (an AlbumCache) is asked before Last.fm, and every album is requested once per batch.
+    Entries whose lookup failed with a LastfmError stay flagged but aren't tried again in the same run, any other
+    error is raised once the batch's lookups are done. Returns an EnrichmentResult.
+    """
+    result = EnrichmentResult()
+    after = None
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = await sync_to_async(_flagged_batch)(after, batch_size)
+        if not batch:
+            break
+        after = batch[-1][0]
+        keys = [album_key(artist, album) for _, artist, album in batch]
+        cached = await sync_to_async(cache.get_many)(keys) if cache is not None else {}
+        albums = {key: (artist, album) for key, (_, artist, album) in zip(keys, batch) if key not in cached}
+        fetched = dict(zip(albums, await asyncio.gather(
+            *(client.album_info(artist, album) for artist, album in albums.values()), return_exceptions=True)))
+        # A failed lookup is a LastfmError (request errors are turned into one), anything else is a bug
+        for info in fetched.values():
+            if isinstance(info, BaseException) and not isinstance(info, LastfmError):
+                raise info
+        if cache is not None:
+            await sync_to_async(cache.put_many)(
+                {key: info for key, info in fetched.items() if not isinstance(info, LastfmError)})
+        result.looked_up += len(fetched)
+        result.shared += len(batch) - len(fetched)
+        infos = [cached[key] if key in cached else fetched[key] for key in keys]
+        await sync_to_async(save_results)(batch, infos, result)
+        batches += 1
+        if on_batch:
+            on_batch(result)
+    return result
+
+
+def _flagged_batch(after, batch_size):
+    queryset = MatchingEntry.objects.filter(album_lastfm_should_rerun=True)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    return list(queryset.order_by('pk').values_list('pk', 'album_artist', 'album_name')[:batch_size])
+
+
+@transaction.atomic
+def save_results(batch, infos, result):
+    """
+    Write a batch of lookups back: the entries' Last.fm fields with one bulk_update and their Last.fm tags merged
+    into their MatchingTag rows. `infos` holds an AlbumInfo, None (not found) or a LastfmError for each entry.
+    """
+    current = {pk: (artist, album) for pk, artist, album in MatchingEntry.objects.select_for_update().filter(
+        pk__in=[pk for pk, _, _ in batch]).values_list('pk', 'album_artist', 'album_name')}
+    entries, tags = [], {}
+    for (pk, artist, album), info in zip(batch, infos):
+        if isinstance(info, LastfmError):
+            result.failed += 1
+            continue
+        if current.get(pk) != (artist, album):
+            # Deleted, or the album changed since the lookup started and the entry is flagged again
+            result.changed += 1
+            continue
+        entry = MatchingEntry(pk=pk, album_lastfm_should_rerun=False)
+        if info is None:
+            result.not_found += 1
+            entries.append(entry)
+            continue
+        entry.album_lastfm_url = info.url[:256]
+        for field in IMAGE_FIELDS.values():
+            setattr(entry, field, info.images.get(field, '')[:256])
+        entries.append(entry)
+        tags[pk] = info.tags
+        result.enriched += 1
+
+    MatchingEntry.objects.bulk_update(entries, ['album_lastfm_should_rerun', 'album_lastfm_url',
+                                                *IMAGE_FIELDS.values()])
+    retagged = merge_lastfm_tags(tags)
+    result.tagged += len(retagged)
+
+
+def merge_lastfm_tags(tags):
+    """
+    Make {entry id: [tag names]} the entries' Last.fm album tags, keeping the rows which stay.
+    Returns the ids of the entries whose tags changed, with their bitsets synced.
+    """
+    if not tags:
+        return []
+    tag_ids = Tag.objects.intern((Tag.TagType.LASTFM, name) for names in tags.values() for name in names)
+    existing = {}
+    for row in MatchingTag.objects.filter(matching_entry_id__in=tags, describes_album=True,
+                                          tag__tagtype=Tag.TagType.LASTFM):
+        existing.setdefault(row.matching_entry_id, {})[row.tag_id] = row
+
+    stale, new, moved, changed = [], [], [], set()
+    for entry_id, names in tags.items():
+        current = existing.get(entry_id, {})
+        wanted = {tag_ids[(Tag.TagType.LASTFM, name)]: position for position, name in enumerate(names)}
+        for tag_id, row in current.items():
+            if tag_id not in wanted:
+                stale.append(row.pk)
+                changed.add(entry_id)
+            elif row.position != wanted[tag_id]:
+                row.position = wanted[tag_id]
+                moved.append(row)
+        for tag_id, position in wanted.items():
+            if tag_id not in current:
+                new.append(MatchingTag(matching_entry_id=entry_id, tag_id=tag_id, describes_album=True,
+                                       position=position))
+                changed.add(entry_id)
+
+    with tag_bits_handled():
+        if stale:
+            MatchingTag.objects.filter(pk__in=stale).delete()
+        MatchingTag.objects.bulk_create(new)
+        MatchingTag.objects.bulk_update(moved, ['position'])
+    if changed:
+        MatchingEntry.objects.filter(pk__in=changed).sync_tag_bits()
+    return sorted(changed)
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from matching.models import MatchingEntry
+from matching.serializers import MatchingEntrySerializer
+
+
+class Command(BaseCommand):
+    help = 'Time serializing matching entries with their tags, with the tags prefetched and without (the naive ' \
+           'version that loads them entry by entry).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='How many entries to serialize (default 500).')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='How many times to time each version, the best run is reported (default 3).')
+
+    def handle(self, *args, **options):
+        entries = MatchingEntry.objects.order_by('pk')
+        ids = list(entries.values_list('pk', flat=True)[:options['limit']])
+        if not ids:
+            self.stdout.write('There are no matching entries to serialize.')
+            return
+
+        versions = [
+            ('naive', lambda: entries.filter(pk__in=ids)),
+            ('prefetched', lambda: entries.filter(pk__in=ids).with_tags()),
+        ]
+        for name, queryset in versions:
+            with CaptureQueriesContext(connection) as queries:
+                MatchingEntrySerializer(queryset(), many=True).data
+            best = min(self.time(queryset) for _ in range(options['repeat']))
+            self.stdout.write(f'{name}: {len(queries)} queries, {1000 * best:.1f}ms in total, '
+                              f'{1000 * best / len(ids):.3f}ms per entry')
+
+        with CaptureQueriesContext(connection) as queries:
+            MatchingEntrySerializer(entries.with_tags().get(pk=ids[0])).data
+        self.stdout.write(f'single entry prefetched: {len(queries)} queries')
+
+    @staticmethod
+    def time(queryset):
+        start = time.perf_counter()
+        MatchingEntrySerializer(queryset(), many=True).data
+        return time.perf_counter() - start
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.engine import parallel
+from matching.engine.arrays import EntryArrays
+from matching.engine.candidates import CANDIDATES_PER_ENTRY, top_k
+from matching.engine.rounds import unmatched_entries
+from matching.engine.snapshot import RoundSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Time scoring the round and extracting every entry\'s top candidates with 1 to N processes, ' \
+           'to see how the scoring scales with cores.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=parallel.default_workers(),
+                            help='The most processes to try, doubling from 1 (default: one per core).')
+        parser.add_argument('--tile-size', type=int, default=parallel.DEFAULT_TILE_SIZE,
+                            help=f'How many rows each process scores at a time (default {parallel.DEFAULT_TILE_SIZE}).')
+        parser.add_argument('--snapshot',
+                            help='Score the round frozen in this snapshot file (see snapshot_round) instead.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='How many times to time each run, the best one is reported (default 3).')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers has to be at least 1.')
+        if options['snapshot']:
+            arrays = RoundSnapshot(options['snapshot']).entry_arrays()
+        else:
+            arrays = EntryArrays.from_queryset(unmatched_entries())
+        self.stdout.write(f'{len(arrays)} entries, {len(arrays.tag_keys)} tags, tiles of {options["tile_size"]} rows.')
+
+        counts = []
+        workers = 1
+        while workers < options['workers']:
+            counts.append(workers)
+            workers *= 2
+        counts.append(options['workers'])
+
+        baseline = None
+        for workers in counts:
+            score_time = self.best(options['repeat'], lambda: parallel.score_matrix(
+                arrays, workers=workers, tile_size=options['tile_size']))
+            top_k_time = self.best(options['repeat'], lambda: parallel.map_tiles(
+                arrays, top_k, CANDIDATES_PER_ENTRY, workers=workers, tile_size=options['tile_size']))
+            if baseline is None:
+                baseline = score_time, top_k_time
+            self.stdout.write(f'{workers:>3} workers: score matrix {score_time:.2f}s ({baseline[0] / score_time:.1f}x), '
+                              f'top {CANDIDATES_PER_ENTRY} {top_k_time:.2f}s ({baseline[1] / top_k_time:.1f}x)')
+
+    @staticmethod
+    def best(repeat, run):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        return min(times)
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.lastfm import (LASTFM_BACKOFF, LASTFM_BATCH_SIZE, LASTFM_CACHE_SIZE, LASTFM_CONCURRENCY, LASTFM_RATE,
+                             LASTFM_RETRIES, AlbumCache, LastfmClient, enrich_flagged)
+
+
+class Command(BaseCommand):
+    help = 'Look up the albums of the entries flagged with album_lastfm_should_rerun on Last.fm and save their ' \
+           'Last.fm page, cover images and tags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=LASTFM_BATCH_SIZE,
+                            help=f'How many entries to look up and save at a time (default {LASTFM_BATCH_SIZE}).')
+        parser.add_argument('--concurrency', type=int, default=LASTFM_CONCURRENCY,
+                            help=f'How many requests can be in flight at once (default {LASTFM_CONCURRENCY}).')
+        parser.add_argument('--rate', type=float, default=LASTFM_RATE,
+                            help=f'How many requests to send per second at most (default {LASTFM_RATE:g}).')
+        parser.add_argument('--retries', type=int, default=LASTFM_RETRIES,
+                            help=f'How many times to retry a failed request (default {LASTFM_RETRIES}).')
+        parser.add_argument('--backoff', type=float, default=LASTFM_BACKOFF,
+                            help=f'Seconds before the first retry, doubling after each (default {LASTFM_BACKOFF:g}).')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after this many batches instead of going through every flagged entry.')
+        parser.add_argument('--poll', type=float,
+                            help='Keep running, looking for newly flagged entries every this many seconds.')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Look every album up on Last.fm, without asking or filling the lookup cache.')
+        parser.add_argument('--cache-size', type=int, default=LASTFM_CACHE_SIZE,
+                            help=f'How many album lookups to keep cached at most (default {LASTFM_CACHE_SIZE}).')
+        parser.add_argument('--api-url', help='The Last.fm API url, to use a stub server (default from settings).')
+
+    def handle(self, *args, **options):
+        if not settings.LASTFM_API_KEY:
+            raise CommandError('Set LASTFM_API_KEY to use the Last.fm API.')
+        # One cache for every poll, so its hit ratio covers the whole run
+        cache = None if options['no_cache'] else AlbumCache(max_size=options['cache_size'])
+        while True:
+            result = asyncio.run(self.enrich(options, cache))
+            self.stdout.write(self.style.SUCCESS(
+                f'Enriched {result.enriched} entries ({result.tagged} with new tags), {result.not_found} albums '
+                f'not found, {result.failed} failed, {result.changed} changed meanwhile, {result.rate:.1f} entries/s.'))
+            self.stdout.write(f'{result.looked_up} albums requested from Last.fm, {result.shared} entries served from '
+                              f'the cache or another entry\'s lookup'
+                              + (f', cache hit ratio {cache.hit_ratio:.1%} ({cache.hits} hits, {cache.misses} misses).'
+                                 if cache is not None else '.'))
+            if options['poll'] is None:
+                return
+            time.sleep(options['poll'])
+
+    async def enrich(self, options, cache):
+        async with LastfmClient(settings.LASTFM_API_KEY, url=options['api_url'],
+                                concurrency=options['concurrency'], rate=options['rate'],
+                                retries=options['retries'], backoff=options['backoff']) as client:
+            return await enrich_flagged(client, batch_size=options['batch_size'],
+                                        max_batches=options['max_batches'], on_batch=self.report, cache=cache)
+
+    def report(self, result):
+        self.stdout.write(f'{result.seen} entries looked up: {result.enriched} enriched, {result.not_found} not found, '
+                          f'{result.failed} failed, {result.rate:.1f} entries/s')
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from matching.exports import EXPORT_CHUNK_SIZE, csv_lines, export_entries, export_fields, jsonl_lines
+
+
+class Command(BaseCommand):
+    help = 'Export every entry with its tags as JSON lines or CSV, streaming them a chunk at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl',
+                            help='The file format (default jsonl).')
+        parser.add_argument('--output', help='Write to this file instead of the standard output.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help=f'How many entries to read at a time (default {EXPORT_CHUNK_SIZE}).')
+
+    def handle(self, *args, **options):
+        rows = export_entries(chunk_size=options['chunk_size'])
+        lines = jsonl_lines(rows) if options['format'] == 'jsonl' else csv_lines(rows, export_fields())
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            count = -1 if options['format'] == 'csv' else 0
+            for line in lines:
+                output.write(line)
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f'Exported {count} entries to {options["output"]}.'))
@@ -0,0 +1,45 @@
+import json
+import sys
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from matching.imports import IMPORT_BATCH_SIZE, import_entries
+
+
+class Command(BaseCommand):
+    help = 'Import entries and their tags from JSON lines (one entry per line, with the username of its user), ' \
+           'validated like the API does. Entries of users who already have one are skipped, so an interrupted ' \
+           'import can be run again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The JSON lines file, - for the standard input.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help=f'How many entries to insert per transaction (default {IMPORT_BATCH_SIZE}).')
+        parser.add_argument('--rejects', help='Write the rejected lines\' numbers and errors to this file.')
+        parser.add_argument('--refresh-candidates', action='store_true',
+                            help='Rebuild the candidates table afterwards, which bulk inserts don\'t update.')
+
+    def handle(self, *args, **options):
+        def report(result):
+            self.stdout.write(f'{result.imported} imported, {result.skipped} skipped, {len(result.rejected)} '
+                              f'rejected, {result.rate:.0f} entries/s')
+
+        file = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        try:
+            result = import_entries(file, batch_size=options['batch_size'], on_batch=report)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        if options['rejects']:
+            with open(options['rejects'], 'w', encoding='utf-8') as rejects:
+                for number, errors in result.rejected:
+                    rejects.write(json.dumps({'line': number, 'errors': errors}) + '\n')
+        for number, errors in result.rejected[:10]:
+            self.stderr.write(f'Line {number}: {json.dumps(errors)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.imported} entries in {result.seconds:.1f}s ({result.rate:.0f} entries/s), '
+            f'skipped {result.skipped} already imported, rejected {len(result.rejected)}.'))
+        if options['refresh_candidates']:
+            call_command('refresh_candidates', stdout=self.stdout._out)
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from matching.engine.arrays import EntryArrays
+from matching.engine.candidates import CANDIDATES_PER_ENTRY, shortlist_cols, top_k
+from matching.engine.minhash import DEFAULT_BANDS, DEFAULT_ROWS, MinHashIndex
+from matching.engine.rounds import unmatched_entries
+
+
+class Command(BaseCommand):
+    help = 'Build the MinHash/LSH index of the unmatched entries, report its recall against exact scoring ' \
+           'and optionally save it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bands', type=int, default=DEFAULT_BANDS,
+                            help=f'How many LSH bands, more raise the recall (default {DEFAULT_BANDS}).')
+        parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                            help=f'How many signature positions per band, more cut the candidates down '
+                                 f'(default {DEFAULT_ROWS}).')
+        parser.add_argument('--k', type=int, default=CANDIDATES_PER_ENTRY,
+                            help=f'Recall is measured on the top k candidates (default {CANDIDATES_PER_ENTRY}).')
+        parser.add_argument('--sample', type=int, default=500,
+                            help='How many entries to measure the recall on (default 500).')
+        parser.add_argument('--output', help='Save the index to this .npz file.')
+
+    def handle(self, *args, **options):
+        arrays = EntryArrays.from_queryset(unmatched_entries())
+        start = time.perf_counter()
+        index = MinHashIndex.from_arrays(arrays, bands=options['bands'], rows=options['rows'])
+        self.stdout.write(f'Indexed {len(index)} of {len(arrays)} entries in {time.perf_counter() - start:.2f}s '
+                          f'({options["bands"]} bands of {options["rows"]} rows).')
+
+        rows = np.random.default_rng(0).permutation(len(arrays))[:options['sample']]
+        position = {pk: i for i, pk in enumerate(arrays.ids.tolist())}
+        exact_time = approximate_time = 0.0
+        found = relevant = candidates = 0
+        for row in rows:
+            start = time.perf_counter()
+            exact = set(top_k(arrays, [row], options['k'])[1].tolist())
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cols = shortlist_cols(arrays, index, row, position)
+            approximate = set(top_k(arrays, [row], options['k'], cols=cols)[1].tolist()) if len(cols) else set()
+            approximate_time += time.perf_counter() - start
+
+            found += len(exact & approximate)
+            relevant += len(exact)
+            candidates += len(cols)
+
+        if len(rows):
+            self.stdout.write(f'Recall@{options["k"]}: {found / relevant if relevant else 1:.3f} over {len(rows)} '
+                              f'entries, {candidates / len(rows):.1f} candidates per entry '
+                              f'({100 * candidates / len(rows) / max(len(arrays) - 1, 1):.2f}% of the round).')
+            self.stdout.write(f'Per entry: {1000 * approximate_time / len(rows):.3f}ms with the index, '
+                              f'{1000 * exact_time / len(rows):.3f}ms exact.')
+
+        if options['output']:
+            index.save(options['output'])
+            self.stdout.write(self.style.SUCCESS(f'Saved the index to {options["output"]}.'))
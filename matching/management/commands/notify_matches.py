@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from matching.models import MatchNotification
+from matching.notifications import (NOTIFY_BATCH_SIZE, NOTIFY_WORKERS, create_notifications, dispatch_notifications,
+                                    release_unknown)
+
+
+class Command(BaseCommand):
+    help = 'E-mail the members of the approved suggestions who they were matched with. Safe to run again: ' \
+           'notifications already sent are never sent twice.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=NOTIFY_WORKERS,
+                            help=f'How many connections to send over in parallel (default {NOTIFY_WORKERS}).')
+        parser.add_argument('--batch-size', type=int, default=NOTIFY_BATCH_SIZE,
+                            help=f'How many e-mails a connection sends at a time (default {NOTIFY_BATCH_SIZE}).')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after this many batches instead of sending every pending notification.')
+        parser.add_argument('--release-unknown', action='store_true',
+                            help='Send the notifications a crashed run left half sent again. Only use it when the '
+                                 'mail server\'s logs show they never went out.')
+
+    def handle(self, *args, **options):
+        if options['release_unknown']:
+            self.stdout.write(f'Released {release_unknown()} notifications.')
+        pending = create_notifications()
+        self.stdout.write(f'{pending} notifications to send.')
+        result = dispatch_notifications(workers=options['workers'], batch_size=options['batch_size'],
+                                        max_batches=options['max_batches'], on_batch=self.report)
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {result.sent} notifications, {result.retried} to retry, {result.failed} failed, '
+            f'{result.rate:.1f} e-mails/s.'))
+        unknown = MatchNotification.objects.filter(status=MatchNotification.Status.SENDING).count()
+        if unknown:
+            self.stderr.write(f'{unknown} notifications were left half sent by a crashed run, see --release-unknown.')
+
+    def report(self, result):
+        self.stdout.write(f'{result.sent} sent, {result.retried} to retry, {result.failed} failed, '
+                          f'{result.rate:.1f} e-mails/s')
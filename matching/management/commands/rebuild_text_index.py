@@ -0,0 +1,26 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from matching.engine.text_index import TextIndex, save_text_index, set_text_index
+
+
+class Command(BaseCommand):
+    help = 'Build the TF-IDF index of the entries\' texts again with a new idf. The index is kept up to date as ' \
+           'entries change but their idf is frozen, this is for when the round has grown a lot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh-candidates', action='store_true',
+                            help='Rebuild the candidates table afterwards, since every text score moves.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = TextIndex.build()
+        set_text_index(index)
+        save_text_index(index)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed the texts of {len(index)} entries, {len(index.terms)} terms, '
+            f'in {time.perf_counter() - start:.2f}s.'))
+        if options['refresh_candidates']:
+            call_command('refresh_candidates', stdout=self.stdout._out)
@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.engine.blocking import DEFAULT_MIN_CANDIDATES
+from matching.engine.candidates import refresh_candidates, update_stale_candidates, CANDIDATES_PER_ENTRY
+from matching.engine.minhash import save_minhash_index
+from matching.engine.parallel import DEFAULT_TILE_SIZE, default_workers
+from matching.engine.text_index import save_text_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the table of the best candidates of every unmatched entry from scratch, or with --stale only ' \
+           'update it for the entries which changed since. Run with --stale --poll to keep the table up to date.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=CANDIDATES_PER_ENTRY,
+                            help=f'How many candidates to keep per entry (default {CANDIDATES_PER_ENTRY}).')
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help='How many processes score the entries (default: one per core).')
+        parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                            help=f'How many entries each process scores at a time (default {DEFAULT_TILE_SIZE}).')
+        parser.add_argument('--blocking', action='store_true',
+                            help='Only score pairs with compatible macrogenres, for very large rounds.')
+        parser.add_argument('--min-block-candidates', type=int, default=DEFAULT_MIN_CANDIDATES,
+                            help='With --blocking, people with fewer compatible entries than this are scored against '
+                                 f'everyone (default {DEFAULT_MIN_CANDIDATES}).')
+        parser.add_argument('--lsh', type=float, metavar='MIN_RECALL',
+                            help='Only score the candidates found by MinHash LSH, if they hold at least this share '
+                                 'of the exact candidates on a sample (between 0 and 1). Not with --blocking.')
+        parser.add_argument('--tags', type=float, metavar='MIN_RECALL',
+                            help='Only score the entries sharing the most tags with each entry, if they hold at least '
+                                 'this share of the exact candidates on a sample (between 0 and 1). Not with '
+                                 '--blocking or --lsh.')
+        parser.add_argument('--stale', action='store_true',
+                            help='Only update the candidates around the entries changed since the last run.')
+        parser.add_argument('--poll', type=float,
+                            help='With --stale, keep running, looking for changed entries every this many seconds.')
+
+    def handle(self, *args, **options):
+        if options['blocking'] + (options['lsh'] is not None) + (options['tags'] is not None) > 1:
+            raise CommandError('Use only one of --blocking, --lsh and --tags.')
+        if options['stale']:
+            return self.update_stale(options)
+        start = time.perf_counter()
+        saved, blocking, recall = refresh_candidates(
+            k=options['k'], workers=options['workers'], tile_size=options['tile_size'],
+            min_block_candidates=options['min_block_candidates'] if options['blocking'] else None,
+            lsh_recall=options['lsh'], tag_recall=options['tags'])
+        save_text_index()
+        save_minhash_index()
+        if recall is not None:
+            name, min_recall = ('LSH', options['lsh']) if options['lsh'] is not None else ('Tag', options['tags'])
+            self.stdout.write(f'{name} recall@{options["k"]} was {recall:.3f}, '
+                              + (f'scored the {name.lower()} candidates only.' if recall >= min_recall
+                                 else 'scored everyone against everyone.'))
+        if blocking:
+            self.stdout.write(f'Blocking scored {blocking.scored_pairs} of {blocking.all_pairs} pairs '
+                              f'({blocking.reduction:.1f}x fewer), {len(blocking.fallback)} entries fell back '
+                              f'to everyone.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {saved} candidates in {time.perf_counter() - start:.2f}s.'))
+
+    def update_stale(self, options):
+        while True:
+            start = time.perf_counter()
+            stale, updated = update_stale_candidates(k=options['k'], tile_size=options['tile_size'],
+                                                     lsh_recall=options['lsh'], tag_recall=options['tags'])
+            if stale:
+                save_text_index()
+                save_minhash_index()
+            if stale or options['poll'] is None:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Updated {updated} candidate lists around {stale} changed entries '
+                    f'in {time.perf_counter() - start:.2f}s.'))
+            if options['poll'] is None:
+                return
+            time.sleep(options['poll'])
@@ -0,0 +1,28 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from matching.engine.rounds import unmatched_entries
+from matching.engine.snapshot import RoundSnapshot, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Freeze every unmatched entry, with its tags and text vectors, into a columnar snapshot file that ' \
+           'solve_matches --snapshot and benchmark_scoring --snapshot can run on without the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Where to write the snapshot.')
+        parser.add_argument('--all', action='store_true',
+                            help='Include the entries which are already matched.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        entries = write_snapshot(options['path'], None if options['all'] else unmatched_entries())
+        write_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        RoundSnapshot(options['path']).entry_arrays()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {entries} entries ({os.path.getsize(options["path"]) / 1024:.0f} KiB) to {options["path"]} '
+            f'in {write_time:.2f}s, loading them back takes {1000 * (time.perf_counter() - start):.1f}ms.'))
@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.engine.blocking import DEFAULT_MIN_CANDIDATES
+from matching.engine.parallel import DEFAULT_TILE_SIZE, default_workers
+from matching.engine.rounds import solve_round, save_suggestions, repair_round, save_repair, round_objective
+from matching.engine.snapshot import RoundSnapshot
+from matching.engine.text_index import save_text_index
+
+
+class Command(BaseCommand):
+    help = 'Group every entry that is not matched yet with a maximum weight matching (and triplets for ' \
+           'the people who opted in) and save the groups as suggestions for the moderators to review.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--time-budget', type=float, default=50.0,
+                            help='How many seconds the solver may spend (default 50).')
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help='How many processes score the round (default: one per core).')
+        parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                            help=f'How many rows each process scores at a time (default {DEFAULT_TILE_SIZE}).')
+        parser.add_argument('--blocking', action='store_true',
+                            help='Only score pairs with compatible macrogenres, for very large rounds.')
+        parser.add_argument('--min-block-candidates', type=int, default=DEFAULT_MIN_CANDIDATES,
+                            help='With --blocking, people with fewer compatible entries than this are scored against '
+                                 f'everyone (default {DEFAULT_MIN_CANDIDATES}).')
+        parser.add_argument('--snapshot',
+                            help='Solve the round frozen in this snapshot file (see snapshot_round) instead of the '
+                                 'database. Implies --dry-run.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Solve and report without saving any suggestions.")
+        parser.add_argument('--repair', action='store_true',
+                            help='Only match the entries left without a group since the last solve (late entries, '
+                                 'partners of deleted entries) around the existing suggestions.')
+        parser.add_argument('--compare', action='store_true',
+                            help='With --repair, also solve the whole round (without saving it) and report how far '
+                                 'the repaired suggestions are from it.')
+
+    def handle(self, *args, **options):
+        if options['repair']:
+            if options['snapshot']:
+                raise CommandError('--repair works on the pending suggestions in the database, not on a snapshot.')
+            self.repair(options)
+            return
+
+        snapshot = RoundSnapshot(options['snapshot']) if options['snapshot'] else None
+        solution = solve_round(time_budget=options['time_budget'], workers=options['workers'],
+                               tile_size=options['tile_size'], min_block_candidates=self.min_block_candidates(options),
+                               snapshot=snapshot)
+        if snapshot is None:
+            save_text_index()
+        matching = solution.matching
+        triplets = sum(len(group) == 3 for group in solution.groups)
+        self.stdout.write(f'Scored {len(solution.arrays)} entries in {solution.score_time:.2f}s.')
+        if solution.blocking:
+            self.report_blocking(solution.blocking)
+        self.stdout.write(f'Solved in {solution.solve_time:.2f}s: {len(solution.groups) - triplets} pairs, '
+                          f'{triplets} triplets, {len(solution.unmatched)} unmatched.')
+        self.stdout.write(f'Objective value: {solution.objective:.3f}')
+        if matching.upper_bound:
+            self.stdout.write(f'Pairing objective: {matching.objective:.3f} (upper bound {matching.upper_bound:.3f}, '
+                              f'within {100 * (1 - matching.objective / matching.upper_bound):.3f}% of optimal)')
+
+        if options['dry_run'] or snapshot is not None:
+            return
+        suggestions = save_suggestions(solution)
+        self.stdout.write(self.style.SUCCESS(f'Saved {len(suggestions)} suggestions for review.'))
+
+    def repair(self, options):
+        repaired = repair_round(time_budget=min(options['time_budget'], 1.0))
+        save_text_index()
+        if repaired is None:
+            self.stdout.write('Every entry already has a group, nothing to repair.')
+            return
+        solution = repaired.solution
+        self.stdout.write(f'Repaired a neighbourhood of {len(solution.arrays)} entries in '
+                          f'{1000 * (solution.score_time + solution.solve_time):.1f}ms: '
+                          f'{len(repaired.replaced)} pairs broken up into {len(solution.groups)} groups, '
+                          f'{len(solution.unmatched)} unmatched, objective {repaired.gain:+.3f}.')
+        self.stdout.write(f'Loading the text index took another {1000 * repaired.index_time:.1f}ms.')
+
+        if not options['dry_run']:
+            suggestions = save_repair(repaired)
+            self.stdout.write(self.style.SUCCESS(f'Saved {len(suggestions)} new suggestions for review.'))
+        if options['compare']:
+            objective = round_objective() if not options['dry_run'] else round_objective() + repaired.gain
+            full = solve_round(time_budget=options['time_budget'], workers=options['workers'],
+                               tile_size=options['tile_size'],
+                               min_block_candidates=self.min_block_candidates(options)).objective
+            self.stdout.write(f'Objective value: {objective:.3f}, a full re-solve gets {full:.3f} '
+                              f'({100 * (1 - objective / full):.3f}% behind).' if full else
+                              f'Objective value: {objective:.3f}, a full re-solve gets 0.')
+
+    @staticmethod
+    def min_block_candidates(options):
+        return options['min_block_candidates'] if options['blocking'] else None
+
+    def report_blocking(self, blocking):
+        self.stdout.write(f'Blocking scored {blocking.scored_pairs} of {blocking.all_pairs} pairs '
+                          f'({blocking.reduction:.1f}x fewer), {len(blocking.fallback)} entries fell back '
+                          f'to everyone.')
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('matching', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchingSuggestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text='Compatibility score given by the matching engine.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('Pending', 'Pending review'), ('Approved', 'Approved'), ('Rejected', 'Rejected')], default='Pending', max_length=15)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('entry_1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='matching.matchingentry')),
+                ('entry_2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='matching.matchingentry')),
+                ('entry_3', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='matching.matchingentry')),
+                ('reviewed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reviewed_matching_suggestions', to=settings.AUTH_USER_MODEL)),
+                ('suggested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='matching_suggestions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
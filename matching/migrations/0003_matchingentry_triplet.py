@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0002_matchingsuggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingentry',
+            name='triplet',
+            field=models.BooleanField(default=False, help_text='Would you be happy to be matched in a group of three?'),
+        ),
+    ]
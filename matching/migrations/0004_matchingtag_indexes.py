@@ -0,0 +1,21 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0003_matchingentry_triplet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='matchingtag',
+            index=models.Index(fields=['tagtype', 'name', 'describes_album', 'matching_entry'], name='matchingtag_posting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matchingtag',
+            index=models.Index(fields=['matching_entry', 'describes_album'], name='matchingtag_entry_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0004_matchingtag_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tagtype', models.CharField(max_length=256)),
+                ('name', models.CharField(max_length=256)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('tagtype', 'name'), name='unique_tag'),
+        ),
+        migrations.AddField(
+            model_name='matchingtag',
+            name='tag',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='matching_tags', to='matching.tag'),
+        ),
+    ]
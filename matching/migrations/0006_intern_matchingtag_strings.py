@@ -0,0 +1,65 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:37
+
+from django.db import migrations
+from django.db.models import Min
+
+# The closed vocabularies at the time of this migration, added first so that they get the lowest ids
+CLOSED_VOCABULARIES = {
+    'macrogenre': [
+        'Country, Folk & Blues', 'Classical', 'Electronic and Dance', 'Hip Hop and R&B',
+        'Indie, Indie Pop, Emo and Pop Punk', 'Jazz, Soul, Neo-Soul and Funk', 'Pop',
+        'Rock, Metal, Punk, Noise, Prog, Post-Rock, Industrial', 'Other',
+    ],
+    'decade': ['Pre-50s', '50s', '60s', '70s', '80s', '90s', '00s', '10s-20s'],
+    'adjective': [
+        'All over the place', 'Ambitious/epic', 'Angry/passionate/intense', 'Chill/slow-paced/ballads',
+        'Classic/influential', 'Concept album', 'Danceable/festival', 'Disturbing/disgusting',
+        'Domestic/wholesome/sincere', 'Dreamy/meditative', 'Empowering/proud', 'Experimental/strange',
+        'Fast-paced/Upbeat', 'Funny', 'Happy/joyful', 'Heartbreaking/break-up', 'Instrumental (i.e. no lyrics)',
+        'Loud', 'LGBT', 'Lyrical', 'Musically complex', 'Musically simple/acoustic', 'Political', 'Psychedelic',
+        'Quiet', 'Romantic', 'Sad/melancholic/sombre', 'Screaming/shouting', 'Silly', 'Summery', 'Vibey', 'Wintery',
+    ],
+    'musical_element': [
+        'Vocals', 'Guitar', 'Drums', 'Bass/bassline', 'Piano/keyboard', 'Synths/beats', 'Brass', 'Crazy sounds!',
+    ],
+}
+
+
+def intern_tags(apps, schema_editor):
+    Tag = apps.get_model('matching', 'Tag')
+    MatchingTag = apps.get_model('matching', 'MatchingTag')
+
+    Tag.objects.bulk_create([
+        Tag(tagtype=tagtype, name=name) for tagtype, names in CLOSED_VOCABULARIES.items() for name in names
+    ])
+    known = set(Tag.objects.values_list('tagtype', 'name'))
+    Tag.objects.bulk_create([
+        Tag(tagtype=tagtype, name=name)
+        for tagtype, name in MatchingTag.objects.values_list('tagtype', 'name').distinct().order_by('tagtype', 'name')
+        if (tagtype, name) not in known
+    ])
+    # One UPDATE per word of the vocabulary, each one served by the old (tagtype, name, ...) index
+    for pk, tagtype, name in Tag.objects.values_list('pk', 'tagtype', 'name'):
+        MatchingTag.objects.filter(tagtype=tagtype, name=name).update(tag=pk)
+
+    # The same tag twice on one entry means nothing more, drop the duplicates before the unique constraint
+    keep = MatchingTag.objects.values('matching_entry', 'tag', 'describes_album').annotate(keep=Min('pk'))
+    MatchingTag.objects.exclude(pk__in=keep.values('keep')).delete()
+
+
+def restore_tag_strings(apps, schema_editor):
+    Tag = apps.get_model('matching', 'Tag')
+    MatchingTag = apps.get_model('matching', 'MatchingTag')
+    for pk, tagtype, name in Tag.objects.values_list('pk', 'tagtype', 'name'):
+        MatchingTag.objects.filter(tag=pk).update(tagtype=tagtype, name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0005_tag_vocabulary'),
+    ]
+
+    operations = [
+        migrations.RunPython(intern_tags, restore_tag_strings),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0006_intern_matchingtag_strings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='matchingtag',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='matching_tags', to='matching.tag'),
+        ),
+        # Defaults so that the columns can be added back to existing rows when migrating backwards
+        migrations.AlterField(
+            model_name='matchingtag',
+            name='name',
+            field=models.CharField(default='', max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='matchingtag',
+            name='tagtype',
+            field=models.CharField(default='', max_length=256),
+        ),
+        migrations.RemoveIndex(
+            model_name='matchingtag',
+            name='matchingtag_posting_idx',
+        ),
+        migrations.RemoveField(
+            model_name='matchingtag',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='matchingtag',
+            name='tagtype',
+        ),
+        migrations.AddIndex(
+            model_name='matchingtag',
+            index=models.Index(fields=['tag', 'describes_album', 'matching_entry'], name='matchingtag_posting_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='matchingtag',
+            constraint=models.UniqueConstraint(fields=('matching_entry', 'tag', 'describes_album'), name='unique_matching_tag'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0007_remove_matchingtag_strings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingentry',
+            name='album_tag_bits',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name='matchingentry',
+            name='match_tag_bits',
+            field=models.BinaryField(default=bytes),
+        ),
+    ]
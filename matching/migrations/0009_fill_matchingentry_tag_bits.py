@@ -0,0 +1,36 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:58
+
+from django.db import migrations
+
+
+def pack(tag_ids):
+    value = 0
+    for tag_id in tag_ids:
+        value |= 1 << tag_id
+    return value.to_bytes((value.bit_length() + 63) // 64 * 8, 'little')
+
+
+def fill_tag_bits(apps, schema_editor):
+    MatchingEntry = apps.get_model('matching', 'MatchingEntry')
+    MatchingTag = apps.get_model('matching', 'MatchingTag')
+
+    tags = {}
+    for entry_id, tag_id, describes_album in MatchingTag.objects.values_list(
+            'matching_entry_id', 'tag_id', 'describes_album'):
+        tags.setdefault((entry_id, describes_album), []).append(tag_id)
+    entries = list(MatchingEntry.objects.only('pk'))
+    for entry in entries:
+        entry.album_tag_bits = pack(tags.get((entry.pk, True), []))
+        entry.match_tag_bits = pack(tags.get((entry.pk, False), []))
+    MatchingEntry.objects.bulk_update(entries, ['album_tag_bits', 'match_tag_bits'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0008_matchingentry_tag_bits'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_tag_bits, migrations.RunPython.noop),
+    ]
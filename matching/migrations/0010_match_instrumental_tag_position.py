@@ -0,0 +1,27 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0009_fill_matchingentry_tag_bits'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='matchingtag',
+            options={'ordering': ['position']},
+        ),
+        migrations.AddField(
+            model_name='matchingentry',
+            name='match_instrumental',
+            field=models.BooleanField(default=True, help_text='Are you happy to receive an instrumental (no vocals) album?'),
+        ),
+        migrations.AddField(
+            model_name='matchingtag',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0010_match_instrumental_tag_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='matchingentry',
+            index=models.Index(fields=['created_at', 'user'], name='matchingentry_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.8 on 2026-10-17 11:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0011_matchingentry_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchingCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('talk', models.FloatField()),
+                ('fit', models.FloatField()),
+                ('adventure', models.FloatField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='matching.matchingentry')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='matching.matchingentry')),
+            ],
+            options={
+                'ordering': ['rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='matchingcandidate',
+            constraint=models.UniqueConstraint(fields=('entry', 'rank'), name='unique_candidate_rank'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.8 on 2026-10-17 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0012_matchingcandidate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LastfmAlbum',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('artist_key', models.CharField(max_length=256)),
+                ('album_key', models.CharField(max_length=256)),
+                ('found', models.BooleanField()),
+                ('url', models.CharField(blank=True, max_length=256)),
+                ('images', models.JSONField(default=dict)),
+                ('tags', models.JSONField(default=list)),
+                ('fetched_at', models.DateTimeField()),
+                ('used_at', models.DateTimeField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='lastfmalbum',
+            index=models.Index(fields=['used_at'], name='lastfmalbum_lru_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lastfmalbum',
+            constraint=models.UniqueConstraint(fields=('artist_key', 'album_key'), name='unique_lastfm_album'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.8 on 2026-10-17 12:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0013_lastfmalbum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('dispatch', models.UUIDField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_notifications', to='matching.matchingentry')),
+                ('suggestion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='matching.matchingsuggestion')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='matchnotification',
+            index=models.Index(fields=['status'], name='matchnotification_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='matchnotification',
+            constraint=models.UniqueConstraint(fields=('suggestion', 'recipient'), name='unique_match_notification'),
+        ),
+    ]
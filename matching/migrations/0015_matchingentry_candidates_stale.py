@@ -0,0 +1,22 @@
+# Generated by Django 3.2.8 on 2026-10-17 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0014_matchnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingentry',
+            name='candidates_stale',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='matchingentry',
+            index=models.Index(condition=models.Q(('candidates_stale', True)), fields=['candidates_stale'], name='matchingentry_stale_idx'),
+        ),
+    ]
@@ -1 +1,6 @@
-from .matching_entry import MatchingEntry
+from .tag import Tag
+from .matching_entry import MatchingEntry, MatchingTag
+from .matching_suggestion import MatchingSuggestion
+from .matching_candidate import MatchingCandidate
+from .lastfm_album import LastfmAlbum
+from .match_notification import MatchNotification
@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class LastfmAlbum(models.Model):
+    """
+    A cached Last.fm album lookup, shared by every entry recommending the same album (see matching.lastfm).
+    Albums are keyed on their normalized artist and album names, `found` is False when Last.fm didn't know the album.
+    """
+    class Meta:
+        indexes = [
+            # Least recently used first, for the eviction
+            models.Index(fields=['used_at'], name='lastfmalbum_lru_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['artist_key', 'album_key'], name='unique_lastfm_album')
+        ]
+
+    artist_key = models.CharField(max_length=256)
+    album_key = models.CharField(max_length=256)
+    found = models.BooleanField()
+    url = models.CharField(max_length=256, blank=True)
+    # {entry image field: url}
+    images = models.JSONField(default=dict)
+    tags = models.JSONField(default=list)
+    fetched_at = models.DateTimeField()
+    used_at = models.DateTimeField()
+    hits = models.PositiveIntegerField(default=0)
@@ -0,0 +1,35 @@
+from django.db import models
+
+from .matching_entry import MatchingEntry
+from .matching_suggestion import MatchingSuggestion
+
+
+class MatchNotification(models.Model):
+    """
+    The e-mail telling one member of an approved suggestion who they were matched with (see matching.notifications).
+    A notification is `sending` from the moment it's handed to a dispatcher until the mail server's answer is saved,
+    so one left `sending` by a crash may or may not have gone out and isn't sent again unless released.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENDING = 'sending', 'Sending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='matchnotification_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['suggestion', 'recipient'], name='unique_match_notification')
+        ]
+
+    suggestion = models.ForeignKey(MatchingSuggestion, on_delete=models.CASCADE, related_name='notifications')
+    recipient = models.ForeignKey(MatchingEntry, on_delete=models.CASCADE, related_name='match_notifications')
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    # The dispatcher run which took the notification, so concurrent runs never send the same one
+    dispatch = models.UUIDField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
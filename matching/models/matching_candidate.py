@@ -0,0 +1,23 @@
+from django.db import models
+
+from .matching_entry import MatchingEntry
+
+
+class MatchingCandidate(models.Model):
+    """
+    One of the best scoring candidates for an entry, precomputed by the matching engine (see engine.candidates).
+    The score is broken down into its weighted talk, fit and adventure parts, which add up to it.
+    """
+    class Meta:
+        ordering = ['rank']
+        constraints = [
+            models.UniqueConstraint(fields=['entry', 'rank'], name='unique_candidate_rank')
+        ]
+
+    entry = models.ForeignKey(MatchingEntry, on_delete=models.CASCADE, related_name='candidates')
+    candidate = models.ForeignKey(MatchingEntry, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    talk = models.FloatField()
+    fit = models.FloatField()
+    adventure = models.FloatField()
@@ -2,11 +2,55 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import URLValidator, MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+
+from ..engine import bitsets
+from .tag import Tag
+
+
+class MatchingEntryQuerySet(models.QuerySet):
+    def with_tags(self):
+        """Prefetch the tags of the entries along with their Tag rows, so reading entries with tags is two queries."""
+        return self.prefetch_related(models.Prefetch(
+            'all_tags', queryset=MatchingTag.objects.select_related('tag').order_by('describes_album', 'position')))
+
+    def sync_tag_bits(self):
+        """
+        Recompute the tag bitsets of the entries in this queryset from their MatchingTag rows, in two queries.
+        Their candidates are flagged stale as well.
+        """
+        entries = {entry.pk: entry for entry in self.only('pk')}
+        album_tags = {pk: [] for pk in entries}
+        match_tags = {pk: [] for pk in entries}
+        rows = MatchingTag.objects.filter(matching_entry__in=entries).values_list(
+            'matching_entry_id', 'tag_id', 'describes_album')
+        for entry_id, tag_id, describes_album in rows:
+            (album_tags if describes_album else match_tags)[entry_id].append(tag_id)
+        for pk, entry in entries.items():
+            entry.album_tag_bits = bitsets.pack(album_tags[pk])
+            entry.match_tag_bits = bitsets.pack(match_tags[pk])
+            entry.candidates_stale = True
+        MatchingEntry.objects.bulk_update(entries.values(), ['album_tag_bits', 'match_tag_bits', 'candidates_stale'],
+                                          batch_size=1000)
+        return len(entries)
+
+    def mark_candidates_stale(self):
+        """Flag the entries' candidates for `update_stale_candidates` (see engine.candidates) to bring up to date."""
+        return self.update(candidates_stale=True)
 
 
 class MatchingEntry(models.Model):
+    objects = MatchingEntryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Matching Entries'
+        indexes = [
+            # Keyset pagination of the matcher listing
+            models.Index(fields=['created_at', 'user'], name='matchingentry_keyset_idx'),
+            # The entries whose candidates are waiting to be updated
+            models.Index(fields=['candidates_stale'], condition=models.Q(candidates_stale=True),
+                         name='matchingentry_stale_idx'),
+        ]
         permissions = [  # TODO: Move these permissions to matching object
             ('is_matcher', 'Can make matching suggestions'),
             ('is_moderator', 'Can moderate matching suggestions')
@@ -18,6 +62,17 @@ class MatchingEntry(models.Model):
         if not self.tags and self.album_adjectives != []:
             raise ValidationError({"tags": "Tags is not formatted correctly."})
 
+    @cached_property
+    def tag_groups(self):
+        """
+        The names of the entry's tags grouped by (tagtype, describes_album), in list order.
+        Built once from all_tags, use MatchingEntry.objects.with_tags() to prefetch them.
+        """
+        groups = {}
+        for matching_tag in self.all_tags.all():
+            groups.setdefault((matching_tag.tag.tagtype, matching_tag.describes_album), []).append(matching_tag.tag.name)
+        return groups
+
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -79,16 +134,17 @@ class MatchingEntry(models.Model):
 
     # Was previously going to limit it to just these choices but why have that pain
     # Can use front end stuff to ensure that the choices are limited
-    # class MacroGenres(models.TextChoices):
-    #     CFB = 'Country, Folk & Blues', 'Country, Folk & Blues'
-    #     CLASSICAL = 'Classical', 'Classical'
-    #     ED = 'Electronic and Dance', 'Electronic and Dance'
-    #     HHRB = 'Hip Hop and R&B', 'Hip Hop and R&B'
-    #     IIPEPP = 'Indie, Indie Pop, Emo and Pop Punk', 'Indie, Indie Pop, Emo and Pop Punk'
-    #     JSNSF = 'Jazz, Soul, Neo-Soul and Funk', 'Jazz, Soul, Neo-Soul and Funk'
-    #     POP = 'Pop', 'Pop'
-    #     RMPNPPRI = 'Rock, Metal, Punk, Noise, Prog, Post-Rock, Industrial', 'Rock, Metal, Punk, Noise, Prog, Post-Rock, Industrial',
-    #     OTHER = 'Other', 'Other'
+    # They still seed the tag vocabulary and the serializer checks the lists against them
+    class MacroGenres(models.TextChoices):
+        CFB = 'Country, Folk & Blues', 'Country, Folk & Blues'
+        CLASSICAL = 'Classical', 'Classical'
+        ED = 'Electronic and Dance', 'Electronic and Dance'
+        HHRB = 'Hip Hop and R&B', 'Hip Hop and R&B'
+        IIPEPP = 'Indie, Indie Pop, Emo and Pop Punk', 'Indie, Indie Pop, Emo and Pop Punk'
+        JSNSF = 'Jazz, Soul, Neo-Soul and Funk', 'Jazz, Soul, Neo-Soul and Funk'
+        POP = 'Pop', 'Pop'
+        RMPNPPRI = 'Rock, Metal, Punk, Noise, Prog, Post-Rock, Industrial', 'Rock, Metal, Punk, Noise, Prog, Post-Rock, Industrial',
+        OTHER = 'Other', 'Other'
 
     # ++ Add to tags ++
 
@@ -104,53 +160,54 @@ class MatchingEntry(models.Model):
 
     # Was going to limit it to just the following
     # Can just do that on the front end
-    # class MusicDecades(models.TextChoices):
-    #     NO_CHOICE = '', 'No Choice'
-    #     PRE50S = 'Pre-50s', 'Pre-50s'
-    #     D50S = '50s', '50s'
-    #     D60S = '60s', '60s'
-    #     D70S = '70s', '70s'
-    #     D80S = '80s', '80s'
-    #     D90S = '90s', '90s'
-    #     D00S = '00s', '2000s'
-    #     D10S20S = '10s-20s', '2010s-20s'
+    # Like the macrogenres they seed the tag vocabulary
+    class MusicDecades(models.TextChoices):
+        NO_CHOICE = '', 'No Choice'
+        PRE50S = 'Pre-50s', 'Pre-50s'
+        D50S = '50s', '50s'
+        D60S = '60s', '60s'
+        D70S = '70s', '70s'
+        D80S = '80s', '80s'
+        D90S = '90s', '90s'
+        D00S = '00s', '2000s'
+        D10S20S = '10s-20s', '2010s-20s'
 
     # ++ Add to tags ++
 
-    # ADJECTIVE_CHOICES = (
-    #     'All over the place',
-    #     'Ambitious/epic',
-    #     'Angry/passionate/intense',
-    #     'Chill/slow-paced/ballads',
-    #     'Classic/influential',
-    #     'Concept album',
-    #     'Danceable/festival',
-    #     'Disturbing/disgusting',
-    #     'Domestic/wholesome/sincere',
-    #     'Dreamy/meditative',
-    #     'Empowering/proud',
-    #     'Experimental/strange',
-    #     'Fast-paced/Upbeat',
-    #     'Funny',
-    #     'Happy/joyful',
-    #     'Heartbreaking/break-up',
-    #     'Instrumental (i.e. no lyrics)',
-    #     'Loud',
-    #     'LGBT',
-    #     'Lyrical',
-    #     'Musically complex',
-    #     'Musically simple/acoustic',
-    #     'Political',
-    #     'Psychedelic',
-    #     'Quiet',
-    #     'Romantic',
-    #     'Sad/melancholic/sombre',
-    #     'Screaming/shouting',
-    #     'Silly',
-    #     'Summery',
-    #     'Vibey',
-    #     'Wintery'
-    # )
+    ADJECTIVE_CHOICES = (
+        'All over the place',
+        'Ambitious/epic',
+        'Angry/passionate/intense',
+        'Chill/slow-paced/ballads',
+        'Classic/influential',
+        'Concept album',
+        'Danceable/festival',
+        'Disturbing/disgusting',
+        'Domestic/wholesome/sincere',
+        'Dreamy/meditative',
+        'Empowering/proud',
+        'Experimental/strange',
+        'Fast-paced/Upbeat',
+        'Funny',
+        'Happy/joyful',
+        'Heartbreaking/break-up',
+        'Instrumental (i.e. no lyrics)',
+        'Loud',
+        'LGBT',
+        'Lyrical',
+        'Musically complex',
+        'Musically simple/acoustic',
+        'Political',
+        'Psychedelic',
+        'Quiet',
+        'Romantic',
+        'Sad/melancholic/sombre',
+        'Screaming/shouting',
+        'Silly',
+        'Summery',
+        'Vibey',
+        'Wintery'
+    )
 
     # Q3 - What adjectives would you use to describe your album?
 
@@ -158,6 +215,16 @@ class MatchingEntry(models.Model):
 
     # Q4 - What musical elements/instruments do you love the most about your album?
     # Vocals, Guitar, Drums, Bass/bassline, Piano/keyboard, Synths/beats, Brass, Crazy sounds!, Other (free choice)
+    MUSICAL_ELEMENT_CHOICES = (
+        'Vocals',
+        'Guitar',
+        'Drums',
+        'Bass/bassline',
+        'Piano/keyboard',
+        'Synths/beats',
+        'Brass',
+        'Crazy sounds!'
+    )
 
     # ++ Add to tags ++
 
@@ -243,6 +310,13 @@ class MatchingEntry(models.Model):
                     MaxValueValidator(5, "Can't be greater than 5")]
     )
 
+    # Q5 - Would you be happy to be matched in a group of three?
+    #    - If there is an odd number of people someone will end up in a group of three anyway.
+    triplet = models.BooleanField(
+        default=False,
+        help_text='Would you be happy to be matched in a group of three?'
+    )
+
     # Q6 - Which macrogenres would you be happy to receive recommendations from, in order of preference?
     #    - Select at least two
 
@@ -254,8 +328,11 @@ class MatchingEntry(models.Model):
     # ++ add to tags ++
 
     # Q8 - Are you happy to receive an instrumental (no vocals) album?
-
-    # ++ add to tags ++
+    # Not a tag after all, it isn't something you want in a match but something you would put up with
+    match_instrumental = models.BooleanField(
+        default=True,
+        help_text='Are you happy to receive an instrumental (no vocals) album?'
+    )
 
     # Q9 - What kind of album would you like to be matched with?
     match_description = models.TextField(
@@ -288,16 +365,53 @@ class MatchingEntry(models.Model):
         blank=True
     )
 
+    # Copies of all_tags as bitsets over Tag ids (see matching.engine.bitsets), for cheap overlap scoring
+    # Kept in sync by the MatchingTag signals, code writing tags in bulk has to call sync_tag_bits itself
+    album_tag_bits = models.BinaryField(
+        default=bytes,
+        editable=False
+    )
+    match_tag_bits = models.BinaryField(
+        default=bytes,
+        editable=False
+    )
+
+    # Set when the entry changed (its answers or tags) or lost one of its candidates since its candidates were
+    # computed, cleared by the candidates updates (see engine.candidates)
+    candidates_stale = models.BooleanField(
+        default=False,
+        editable=False
+    )
+
 
 class MatchingTag(models.Model):
+    class Meta:
+        ordering = ['position']
+        indexes = [
+            # Posting lists of the tag index and the matcher listing's tag filter, and the tags of one entry
+            models.Index(fields=['tag', 'describes_album', 'matching_entry'], name='matchingtag_posting_idx'),
+            models.Index(fields=['matching_entry', 'describes_album'], name='matchingtag_entry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['matching_entry', 'tag', 'describes_album'], name='unique_matching_tag')
+        ]
+
     matching_entry = models.ForeignKey(
         MatchingEntry, on_delete=models.CASCADE, related_name='all_tags')
-    name = models.CharField(
-        max_length=256
-    )
-    tagtype = models.CharField(
-        max_length=256
-    )
+    tag = models.ForeignKey(
+        Tag, on_delete=models.PROTECT, related_name='matching_tags')
     describes_album = models.BooleanField(
         help_text='Does this tag describe the album (true) or what the matcher wants in their match (false)?'
     )
+    # Tags come from lists where order can matter, like macrogenres in order of preference
+    position = models.PositiveSmallIntegerField(
+        default=0
+    )
+
+    @property
+    def name(self):
+        return self.tag.name
+
+    @property
+    def tagtype(self):
+        return self.tag.tagtype
@@ -0,0 +1,54 @@
+from django.db import models
+from django.db.models import Q
+from django.contrib.auth.models import User
+
+from .matching_entry import MatchingEntry
+
+
+class MatchingSuggestionQuerySet(models.QuerySet):
+    def involving(self, entry_ids):
+        return self.filter(Q(entry_1__in=entry_ids) | Q(entry_2__in=entry_ids) | Q(entry_3__in=entry_ids))
+
+    def entry_ids(self):
+        ids = set()
+        for row in self.values_list('entry_1', 'entry_2', 'entry_3'):
+            ids.update(row)
+        ids.discard(None)
+        return ids
+
+
+class MatchingSuggestion(models.Model):
+    """A pair (or a triplet) of entries suggested as a match, waiting for a moderator to review it."""
+    class Meta:
+        ordering = ['-created_at']
+
+    class Status(models.TextChoices):
+        PENDING = 'Pending', 'Pending review'
+        APPROVED = 'Approved', 'Approved'
+        REJECTED = 'Rejected', 'Rejected'
+
+    objects = MatchingSuggestionQuerySet.as_manager()
+
+    entry_1 = models.ForeignKey(MatchingEntry, on_delete=models.CASCADE, related_name='+')
+    entry_2 = models.ForeignKey(MatchingEntry, on_delete=models.CASCADE, related_name='+')
+    entry_3 = models.ForeignKey(MatchingEntry, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    score = models.FloatField(
+        help_text='Compatibility score given by the matching engine.'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Null when the suggestion was made by the solver
+    suggested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='matching_suggestions')
+
+    status = models.CharField(
+        max_length=15,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    reviewed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reviewed_matching_suggestions')
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def entry_ids(self):
+        return [pk for pk in (self.entry_1_id, self.entry_2_id, self.entry_3_id) if pk is not None]
@@ -0,0 +1,55 @@
+from django.db import models
+
+
+class TagManager(models.Manager):
+    def intern(self, keys):
+        """
+        The ids of the (tagtype, name) pairs in `keys`, adding the ones that aren't in the vocabulary yet.
+        Returns a dict from (tagtype, name) to id, in a constant number of queries.
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        names = {name for _, name in keys}
+        ids = {(tagtype, name): pk for pk, tagtype, name in
+               self.filter(name__in=names).values_list('pk', 'tagtype', 'name') if (tagtype, name) in keys}
+        missing = keys - ids.keys()
+        if missing:
+            self.bulk_create([Tag(tagtype=tagtype, name=name) for tagtype, name in missing], ignore_conflicts=True)
+            created = self.filter(name__in={name for _, name in missing}).values_list('pk', 'tagtype', 'name')
+            ids.update(((tagtype, name), pk) for pk, tagtype, name in created if (tagtype, name) in missing)
+        return ids
+
+
+class Tag(models.Model):
+    """
+    The vocabulary of tags. Every distinct (tagtype, name) is stored once and MatchingTag refers to it by id.
+    The closed vocabularies (macrogenres, decades, adjectives and musical elements) are added first,
+    so they have the lowest ids.
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tagtype', 'name'], name='unique_tag')
+        ]
+
+    class TagType(models.TextChoices):
+        MACROGENRE = 'macrogenre', 'Macrogenre'
+        MICROGENRE = 'microgenre', 'Microgenre'
+        DECADE = 'decade', 'Decade'
+        ADJECTIVE = 'adjective', 'Adjective'
+        MUSICAL_ELEMENT = 'musical_element', 'Musical element'
+        COUNTRY = 'country', 'Country'
+        LANGUAGE = 'language', 'Language'
+        LASTFM = 'lastfm', 'Last.fm tag'
+
+    objects = TagManager()
+
+    tagtype = models.CharField(
+        max_length=256
+    )
+    name = models.CharField(
+        max_length=256
+    )
+
+    def __str__(self):
+        return f'{self.tagtype}: {self.name}'
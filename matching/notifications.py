@@ -0,0 +1,211 @@
+"""
+Telling the members of the approved suggestions who they were matched with: the other members' e-mail, album and
+recommended artists.
+
+`create_notifications` adds one MatchNotification per member of every approved suggestion, it can run again after
+more suggestions are approved. `dispatch_notifications` sends the pending ones: every message is rendered from one
+query, then batches are claimed and handed to a pool of threads, each sending over its own connection of
+settings.OUTBOX_EMAIL_BACKEND which stays open from one batch to the next.
+
+A batch is marked `sending` before it's handed to a thread, and the thread saves the outcome of every message as
+soon as the mail server answers, so a crash leaves at most one message per thread `sending` (and the rest of the
+batches in flight, which are safe to release). The ones which may have gone out are never sent again by themselves:
+`release_unknown` puts them back, once the mail server's logs say they didn't.
+Failed messages go back to pending for the next run, NOTIFY_MAX_ATTEMPTS times at most, and permanent failures
+fail straight away.
+"""
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+from authstuff.mail import is_message_error, is_permanent_error
+from .models import MatchNotification, MatchingSuggestion
+
+NOTIFY_BATCH_SIZE = 50
+NOTIFY_WORKERS = 4
+NOTIFY_MAX_ATTEMPTS = 3
+
+
+def create_notifications():
+    """Add the notifications the approved suggestions are missing, returns how many notifications are pending."""
+    approved = MatchingSuggestion.objects.filter(status=MatchingSuggestion.Status.APPROVED).values_list(
+        'pk', 'entry_1', 'entry_2', 'entry_3')
+    MatchNotification.objects.bulk_create([
+        MatchNotification(suggestion_id=pk, recipient_id=entry_id)
+        for pk, *entry_ids in approved for entry_id in entry_ids if entry_id is not None
+    ], batch_size=1000, ignore_conflicts=True)
+    return MatchNotification.objects.filter(status=MatchNotification.Status.PENDING).count()
+
+
+def release_unknown():
+    """Put the notifications a crashed run left `sending` back to pending, returns how many there were."""
+    return MatchNotification.objects.filter(status=MatchNotification.Status.SENDING).update(
+        status=MatchNotification.Status.PENDING, dispatch=None)
+
+
+def render_notifications(notifications):
+    """{notification id: EmailMessage} for notifications fetched with their suggestion's entries and users."""
+    subject_template = get_template('matching/email/match_result_subject.txt')
+    message_template = get_template('matching/email/match_result_message.txt')
+    messages = {}
+    for notification in notifications:
+        suggestion = notification.suggestion
+        members = [entry for entry in (suggestion.entry_1, suggestion.entry_2, suggestion.entry_3) if entry is not None]
+        recipient = next(entry for entry in members if entry.pk == notification.recipient_id)
+        context = {'recipient': recipient, 'others': [entry for entry in members if entry is not recipient]}
+        messages[notification.pk] = EmailMessage(
+            subject=' '.join(subject_template.render(context).split()), body=message_template.render(context),
+            from_email=settings.DEFAULT_FROM_EMAIL, to=[recipient.user.email] if recipient.user.email else [])
+    return messages
+
+
+class DispatchResult:
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self):
+        return self.sent / self.seconds if self.seconds else 0.0
+
+
+class _Sender:
+    """
+    Sends batches from a pool of threads, over one connection per thread, saving the outcome of every notification
+    as it's sent and counting it in `result`.
+    """
+
+    def __init__(self, notifications, messages, result):
+        self.notifications = notifications
+        self.messages = messages
+        self.result = result
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = get_connection(settings.OUTBOX_EMAIL_BACKEND)
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def send(self, batch):
+        """Send a batch. When the connection fails the rest of the batch isn't tried, and goes back to pending."""
+        connection = self._connection()
+        try:
+            for i, pk in enumerate(batch):
+                message = self.messages[pk]
+                try:
+                    if not message.to:
+                        raise smtplib.SMTPRecipientsRefused({'': (550, b'The recipient has no e-mail address.')})
+                    # Opened here, the backends close the connections they open themselves after every send
+                    connection.open()
+                    if not connection.send_messages([message]):
+                        raise smtplib.SMTPException('The backend didn\'t send the message.')
+                except Exception as error:
+                    self._failed(self.notifications[pk], error)
+                    if not is_message_error(error):
+                        _close(connection)
+                        MatchNotification.objects.filter(
+                            status=MatchNotification.Status.SENDING, pk__in=batch[i + 1:]).update(
+                            status=MatchNotification.Status.PENDING, dispatch=None)
+                        break
+                else:
+                    self._sent(pk)
+        finally:
+            # The thread's own database connection, the pool's threads outlive the dispatch
+            db_connection.close()
+
+    def _sent(self, pk):
+        MatchNotification.objects.filter(pk=pk).update(
+            status=MatchNotification.Status.SENT, sent_at=timezone.now(), last_error='')
+        with self.lock:
+            self.result.sent += 1
+
+    def _failed(self, notification, error):
+        notification.attempts += 1
+        notification.last_error = f'{type(error).__name__}: {error}'
+        permanent = is_permanent_error(error) or notification.attempts >= NOTIFY_MAX_ATTEMPTS
+        notification.status = MatchNotification.Status.FAILED if permanent else MatchNotification.Status.PENDING
+        notification.save(update_fields=['attempts', 'last_error', 'status'])
+        with self.lock:
+            if permanent:
+                self.result.failed += 1
+            else:
+                self.result.retried += 1
+
+    def close(self):
+        for connection in self.connections:
+            _close(connection)
+
+
+def dispatch_notifications(workers=NOTIFY_WORKERS, batch_size=NOTIFY_BATCH_SIZE, max_batches=None, on_batch=None):
+    """
+    Send the pending notifications, `batch_size` at a time over `workers` connections in parallel. `on_batch` is
+    called with the result after every batch. Returns a DispatchResult.
+    """
+    result = DispatchResult()
+    notifications = {notification.pk: notification for notification in MatchNotification.objects.filter(
+        status=MatchNotification.Status.PENDING).select_related(
+        'suggestion__entry_1__user', 'suggestion__entry_2__user', 'suggestion__entry_3__user').order_by('pk')}
+    sender = _Sender(notifications, render_notifications(notifications.values()), result)
+    pks = list(notifications)
+    batches = [pks[start:start + batch_size] for start in range(0, len(pks), batch_size)][:max_batches]
+    dispatch = uuid.uuid4()
+
+    in_flight = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in batches:
+                claimed = _claim(batch, dispatch)
+                if claimed:
+                    in_flight.add(executor.submit(sender.send, claimed))
+                # Claim more only when a thread is about to need it, the claimed batches are the ones a crash loses
+                while len(in_flight) >= workers:
+                    in_flight = _wait_done(in_flight, result, on_batch)
+            while in_flight:
+                in_flight = _wait_done(in_flight, result, on_batch)
+    finally:
+        sender.close()
+    return result
+
+
+def _claim(batch, dispatch):
+    claimed = MatchNotification.objects.filter(pk__in=batch, status=MatchNotification.Status.PENDING).update(
+        status=MatchNotification.Status.SENDING, dispatch=dispatch)
+    if claimed == len(batch):
+        return batch
+    # Some were taken by another run since they were read
+    return list(MatchNotification.objects.filter(pk__in=batch, dispatch=dispatch).values_list('pk', flat=True))
+
+
+def _wait_done(in_flight, result, on_batch):
+    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+        future.result()
+        if on_batch is not None:
+            on_batch(result)
+    return in_flight
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
@@ -0,0 +1,17 @@
+from rest_framework import permissions
+
+from authstuff.permissions import has_perm
+
+
+class IsMatcher(permissions.BasePermission):
+    message = 'Only matchers can do this.'
+
+    def has_permission(self, request, view):
+        return has_perm(request.user, 'matching.is_matcher')
+
+
+class IsModerator(permissions.BasePermission):
+    message = 'Only moderators can do this.'
+
+    def has_permission(self, request, view):
+        return has_perm(request.user, 'matching.is_moderator')
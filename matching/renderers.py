@@ -0,0 +1,30 @@
+from rest_framework import renderers
+
+from .exports import csv_lines, jsonl_lines
+
+
+class JSONLinesRenderer(renderers.BaseRenderer):
+    """JSON lines, one object per line. `stream` renders rows one at a time for a StreamingHttpResponse."""
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.stream(data if isinstance(data, list) else [data]))
+
+    def stream(self, rows, fields=None):
+        return jsonl_lines(rows)
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """CSV with a header line. `stream` renders rows one at a time for a StreamingHttpResponse."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(self.stream(rows, list(rows[0]) if rows else []))
+
+    def stream(self, rows, fields=None):
+        return csv_lines(rows, fields)
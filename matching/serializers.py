@@ -1,19 +1,84 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import MatchingEntry
+
+from .engine import bitsets
+from .models import MatchingCandidate, MatchingEntry, MatchingTag, Tag
+from .signals import tag_bits_handled
+from .validators import ListOfStringsValidator
+
+
+class TagFieldMixin:
+    """
+    A field stored as MatchingTag rows of one tag type, on one side (the album or the match), instead of a column.
+    """
+
+    def __init__(self, *args, tagtype, describes_album, **kwargs):
+        self.tagtype = tagtype
+        self.describes_album = describes_album
+        super().__init__(*args, **kwargs)
+
+    def tag_names(self, instance):
+        return instance.tag_groups.get((self.tagtype, self.describes_album), [])
+
+    def to_tag_names(self, value):
+        return value
+
+
+class TagListField(TagFieldMixin, serializers.ListField):
+    def get_attribute(self, instance):
+        return self.tag_names(instance)
+
+
+class SingleTagMixin(TagFieldMixin):
+    def get_attribute(self, instance):
+        names = self.tag_names(instance)
+        return names[0] if names else ''
+
+    def to_tag_names(self, value):
+        return [value] if value else []
+
+
+class SingleTagField(SingleTagMixin, serializers.CharField):
+    pass
+
+
+class SingleTagChoiceField(SingleTagMixin, serializers.ChoiceField):
+    pass
+
+
+def _string_list(**kwargs):
+    return dict(child=serializers.CharField(trim_whitespace=True, allow_blank=False), **kwargs)
 
 
 class MatchingEntrySerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
-    album_adjectives = serializers.ListField(
-        child=serializers.CharField(
-            trim_whitespace=True,
-            allow_blank=False
-        ),
-        allow_empty=True,
-        default=list,
+    album_macrogenre = SingleTagChoiceField(
+        tagtype=Tag.TagType.MACROGENRE,
+        describes_album=True,
+        choices=MatchingEntry.MacroGenres.choices,
+        help_text="What macro genre would you classify the album you're recommending in?"
+    )
+    album_microgenre = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.MICROGENRE,
+        describes_album=True,
+        help_text="What microgenre(s) would you associate with your album?"
+    )
+    album_decade = SingleTagChoiceField(
+        tagtype=Tag.TagType.DECADE,
+        describes_album=True,
+        choices=MatchingEntry.MusicDecades.choices,
+        allow_blank=True,
+        default='',
+        help_text="What decade does your album most sound like?"
+    )
+    album_adjectives = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.ADJECTIVE,
+        describes_album=True,
         validators=[ListOfStringsValidator(
-            'Your album macrogenre was not formatted correctly.',
-            'album macrogenre',
+            'Your album adjectives were not formatted correctly.',
+            'album adjective',
             choices=MatchingEntry.ADJECTIVE_CHOICES
         )],
         help_text="What adjectives would you use to describe your album? "
@@ -22,18 +87,23 @@ class MatchingEntrySerializer(serializers.ModelSerializer):
                   f"{'</option><option>'.join(MatchingEntry.ADJECTIVE_CHOICES)}"
                   "</option></select>"
     )
-    album_musical_elements = serializers.ListField(
-        child=serializers.CharField(
-            trim_whitespace=True,
-            allow_blank=False
-        ),
-        allow_empty=True,
-        default=list,
+    album_musical_elements = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.MUSICAL_ELEMENT,
+        describes_album=True,
         help_text="What musical elements/instruments do you love the most about your album?"
     )
-    match_macrogenre = serializers.ListField(
-        min_length=2,
-        allow_empty=False,
+    album_country = SingleTagField(
+        tagtype=Tag.TagType.COUNTRY,
+        describes_album=True,
+        allow_blank=True,
+        default='',
+        help_text="What country does your album originate from?"
+    )
+    match_macrogenre = TagListField(
+        **_string_list(min_length=2, allow_empty=False),
+        tagtype=Tag.TagType.MACROGENRE,
+        describes_album=False,
         validators=[ListOfStringsValidator(
             'Your match macrogenre was invalid, you might not have selected enough genres.',
             'match macrogenre',
@@ -46,44 +116,207 @@ class MatchingEntrySerializer(serializers.ModelSerializer):
                   f"{'</option><option>'.join(x[0] + ' (' + x[1] + ')' for x in MatchingEntry.MacroGenres.choices)}"
                   f"</option></select>"
     )
-    match_adjectives = serializers.ListField(
-        child=serializers.CharField(
-            trim_whitespace=True,
-            allow_blank=False
-        ),
-        allow_empty=True,
-        default=list,
+    match_language = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.LANGUAGE,
+        describes_album=False,
+        help_text="What language preferences do you have for your match?"
+    )
+    match_microgenre = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.MICROGENRE,
+        describes_album=False,
+        help_text="Which microgenre(s) do you most want a match from?"
+    )
+    match_adjectives = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.ADJECTIVE,
+        describes_album=False,
         validators=[ListOfStringsValidator(
-            'Your album macrogenre was not formatted correctly.',
-            'album macrogenre',
+            'Your match adjectives were not formatted correctly.',
+            'match adjective',
             choices=MatchingEntry.ADJECTIVE_CHOICES
         )],
-        help_text="What adjectives would you use to describe your album? "
+        help_text="Select the adjectives you want your match to embody. "
                   f"Valid choices are "
                   "<select><option>"
                   f"{'</option><option>'.join(MatchingEntry.ADJECTIVE_CHOICES)}"
                   "</option></select>"
     )
-    match_musical_elements = serializers.ListField(
-        child=serializers.CharField(
-            trim_whitespace=True,
-            allow_blank=False
-        ),
-        allow_empty=True,
-        default=list,
-        help_text="What musical elements/instruments do you love the most about your album?"
+    match_musical_elements = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.MUSICAL_ELEMENT,
+        describes_album=False,
+        help_text="What musical elements/instruments do you want your match to have?"
+    )
+    match_country = TagListField(
+        **_string_list(allow_empty=True, default=list),
+        tagtype=Tag.TagType.COUNTRY,
+        describes_album=False,
+        help_text="Are there any particular country(/ies) that you want your match to be from?"
     )
 
     class Meta:
         model = MatchingEntry
         fields = [
             'user', 'created_at',
-            'album_spotify_id', 'album_macrogenre', 'album_description', 'album_microgenre',
+            'album_artist', 'album_name', 'album_macrogenre', 'album_description', 'album_microgenre',
             'album_decade', 'album_adjectives', 'album_musical_elements', 'album_country',
-            'artist_1_spotify_id', 'artist_2_spotify_id',
+            'artist_1_name', 'artist_2_name',
             'talkativity_preference', 'minds_talking', 'minds_not_talking',
             'adventurous', 'person_above_adventure',
             'triplet', 'match_macrogenre',
             'match_language', 'match_instrumental', 'match_description', 'match_microgenre',
             'match_adjectives', 'match_musical_elements', 'match_country', 'what_get_out'
         ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only serialize the given fields, to shrink payloads
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def tag_fields(self):
+        return {name: field for name, field in self.fields.items() if isinstance(field, TagFieldMixin)}
+
+    def pop_tags(self, validated_data):
+        """
+        Take the tag fields out of `validated_data`.
+        Returns {(tagtype, describes_album): [names]} for the tag fields that were submitted.
+        """
+        tags = {}
+        for name, field in self.tag_fields().items():
+            if name in validated_data:
+                names = field.to_tag_names(validated_data.pop(name))
+                tags[(field.tagtype, field.describes_album)] = list(dict.fromkeys(names))
+        return tags
+
+    @transaction.atomic
+    def create(self, validated_data):
+        tags = self.pop_tags(validated_data)
+        tag_ids = Tag.objects.intern(
+            (tagtype, name) for (tagtype, _), names in tags.items() for name in names)
+        rows = _tag_rows(tags, tag_ids)
+
+        validated_data.setdefault('album_lastfm_should_rerun', True)
+        instance = MatchingEntry(**validated_data)
+        _set_tag_bits(instance, rows)
+        instance.save(force_insert=True)
+        for row in rows:
+            row.matching_entry = instance
+        MatchingTag.objects.bulk_create(rows)
+
+        _cache_tags(instance, rows, tag_ids)
+        return instance
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags = self.pop_tags(validated_data)
+        if {'album_artist', 'album_name'} & validated_data.keys():
+            validated_data.setdefault('album_lastfm_should_rerun', True)
+
+        prefetched = getattr(instance, '_prefetched_objects_cache', {}).get('all_tags')
+        existing = list(prefetched if prefetched is not None else instance.all_tags.select_related('tag'))
+        tag_ids = Tag.objects.intern(
+            (tagtype, name) for (tagtype, _), names in tags.items() for name in names)
+        tag_ids.update({(t.tag.tagtype, t.tag.name): t.tag_id for t in existing})
+
+        # Tag fields that weren't submitted (partial updates) keep their rows, the submitted ones are diffed
+        # against their current rows so that rows which stay keep their ids
+        untouched = [t for t in existing if (t.tag.tagtype, t.describes_album) not in tags]
+        current = {(t.tag_id, t.describes_album): t for t in existing if (t.tag.tagtype, t.describes_album) in tags}
+        wanted = {(row.tag_id, row.describes_album): row for row in _tag_rows(tags, tag_ids)}
+
+        stale = [t.pk for key, t in current.items() if key not in wanted]
+        new = [row for key, row in wanted.items() if key not in current]
+        moved = []
+        for key, row in wanted.items():
+            if key in current and current[key].position != row.position:
+                current[key].position = row.position
+                moved.append(current[key])
+        if stale:
+            with tag_bits_handled():
+                MatchingTag.objects.filter(pk__in=stale).delete()
+        if new:
+            for row in new:
+                row.matching_entry = instance
+            MatchingTag.objects.bulk_create(new)
+        if moved:
+            MatchingTag.objects.bulk_update(moved, ['position'])
+
+        rows = untouched + [current.get(key, row) for key, row in wanted.items()]
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        _set_tag_bits(instance, rows)
+        instance.save()
+
+        _cache_tags(instance, rows, tag_ids)
+        return instance
+
+
+class MatchingEntryFilterSerializer(serializers.Serializer):
+    """Validates the query parameters of the matcher listing."""
+    tag = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        help_text='Only list entries whose album has this tag, repeat to require several.'
+    )
+    talkativity_preference = serializers.ListField(
+        child=serializers.ChoiceField(choices=MatchingEntry.TalkativityPreference.choices),
+        required=False,
+        help_text='Only list entries with this talkativity preference, repeat to allow several.'
+    )
+    adventurous_min = serializers.IntegerField(min_value=0, max_value=5, required=False)
+    adventurous_max = serializers.IntegerField(min_value=0, max_value=5, required=False)
+    fields = serializers.CharField(
+        required=False,
+        help_text='Comma separated fields to include in the results, all of them by default.'
+    )
+
+    def validate_fields(self, value):
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        invalid = [name for name in fields if name not in MatchingEntrySerializer.Meta.fields]
+        if invalid:
+            raise serializers.ValidationError(f'"{invalid[0]}" is not a valid field.')
+        return fields
+
+    def validate(self, attrs):
+        if attrs.get('adventurous_min', 0) > attrs.get('adventurous_max', 5):
+            raise serializers.ValidationError('adventurous_min can\'t be greater than adventurous_max.')
+        return attrs
+
+
+class MatchingCandidateSerializer(serializers.ModelSerializer):
+    user = serializers.IntegerField(source='candidate.user_id', read_only=True)
+    album_artist = serializers.CharField(source='candidate.album_artist', read_only=True)
+    album_name = serializers.CharField(source='candidate.album_name', read_only=True)
+
+    class Meta:
+        model = MatchingCandidate
+        fields = ['rank', 'user', 'album_artist', 'album_name', 'score', 'talk', 'fit', 'adventure']
+        read_only_fields = fields
+
+
+def _tag_rows(tags, tag_ids):
+    rows = []
+    for (tagtype, describes_album), names in tags.items():
+        for position, name in enumerate(names):
+            rows.append(MatchingTag(tag_id=tag_ids[(tagtype, name)], describes_album=describes_album,
+                                    position=position))
+    return rows
+
+
+def _set_tag_bits(instance, rows):
+    instance.album_tag_bits = bitsets.pack(row.tag_id for row in rows if row.describes_album)
+    instance.match_tag_bits = bitsets.pack(row.tag_id for row in rows if not row.describes_album)
+
+
+def _cache_tags(instance, rows, tag_ids):
+    # Group the tags like MatchingEntry.tag_groups would from all_tags, so the response doesn't query them back
+    keys = {pk: key for key, pk in tag_ids.items()}
+    groups = {}
+    for row in sorted(rows, key=lambda row: row.position):
+        tagtype, name = keys[row.tag_id]
+        groups.setdefault((tagtype, row.describes_album), []).append(name)
+    instance.tag_groups = groups
@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import MatchingCandidate, MatchingEntry, MatchingTag
+
+_state = threading.local()
+
+
+@contextmanager
+def tag_bits_handled():
+    """For code that writes tags and sets the entries' bitsets itself, so the signals don't sync them row by row."""
+    _state.depth = getattr(_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+
+
+@receiver([post_save, post_delete], sender=MatchingTag)
+def tags_changed(sender, instance, **kwargs):
+    if getattr(_state, 'depth', 0):
+        return
+    entry_id = instance.matching_entry_id
+
+    # Syncing flags the entry's candidates as stale, nothing to sync when the tags went with their entry
+    transaction.on_commit(lambda: MatchingEntry.objects.filter(pk=entry_id).sync_tag_bits())
+
+
+# Candidates are recomputed by `refresh_candidates --stale` (see matching.engine.candidates), requests only flag them
+
+
+@receiver(post_save, sender=MatchingEntry)
+def entry_saved(sender, instance, **kwargs):
+    MatchingEntry.objects.filter(pk=instance.pk).mark_candidates_stale()
+
+
+@receiver(pre_delete, sender=MatchingEntry)
+def entry_deleted(sender, instance, **kwargs):
+    # The lists the entry is on are deleted along with it, so whose they were is flagged instead
+    MatchingEntry.objects.filter(
+        pk__in=MatchingCandidate.objects.filter(candidate_id=instance.pk).values('entry_id')).mark_candidates_stale()
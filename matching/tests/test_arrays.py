@@ -0,0 +1,31 @@
+import numpy as np
+from django.test import TestCase
+
+from ..engine import bitsets
+from ..engine.arrays import EntryArrays
+from ..engine.scoring import reference_score_matrix, score_matrix
+from ..models import Tag
+from .utils import create_entry
+
+
+class BitsetTests(TestCase):
+    def test_round_trip(self):
+        tag_ids = [0, 1, 63, 64, 700, 5000]
+        self.assertEqual(bitsets.unpack(bitsets.pack(tag_ids)).tolist(), tag_ids)
+        self.assertEqual(bitsets.pack([]), b'')
+
+    def test_set_bits(self):
+        words = bitsets.to_words([bitsets.pack([1, 64, 700]), b'', bitsets.pack([3, 5000])])
+        rows, tag_ids = bitsets.set_bits(words)
+        self.assertEqual(rows.tolist(), [0, 0, 0, 2, 2])
+        self.assertEqual(tag_ids.tolist(), [1, 64, 700, 3, 5000])
+
+    def test_high_tag_ids_get_dense_columns(self):
+        Tag.objects.create(pk=200000, tagtype=Tag.TagType.LASTFM, name='late')
+        create_entry('a', album_tags=[('lastfm', 'late'), ('macrogenre', 'Pop')], match_tags=[('lastfm', 'late')])
+        create_entry('b', album_tags=[('macrogenre', 'Pop')], match_tags=[('lastfm', 'late'), ('macrogenre', 'Pop')])
+        arrays = EntryArrays.from_queryset(text=False)
+        self.assertEqual(arrays.album_tags.shape, (2, 2))
+        self.assertEqual(arrays.tag_keys[-1], 200000)
+        np.testing.assert_array_equal(arrays.match_tags, [[0, 1], [1, 1]])
+        np.testing.assert_array_equal(score_matrix(arrays), reference_score_matrix())
@@ -0,0 +1,45 @@
+import numpy as np
+from django.test import TestCase
+
+from ..engine import text_index
+from ..engine.arrays import EntryArrays
+from ..engine.blocking import Blocking, score_matrix as blocked_score_matrix
+from ..engine.scoring import score_matrix
+from ..models import MatchingEntry
+from .utils import random_entries
+
+
+class BlockingTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+        random_entries(40, seed=5)
+        self.arrays = EntryArrays.from_queryset()
+
+    def test_everyone_in_fallback_scores_everything(self):
+        blocking = Blocking.for_arrays(self.arrays, min_candidates=len(self.arrays) * 2)
+        self.assertEqual(len(blocking.fallback), len(self.arrays))
+        # The fallback block alone is every ordered pair, the macrogenre blocks come on top
+        fallback_rows, fallback_cols = blocking.blocks[-1]
+        self.assertEqual(len(fallback_rows) * len(fallback_cols) - len(self.arrays), blocking.all_pairs)
+        self.assertLess(blocking.reduction, 1.0)
+        np.testing.assert_array_equal(blocked_score_matrix(self.arrays, blocking, tile_size=7).toarray(),
+                                      score_matrix(self.arrays))
+
+    def test_blocks_score_like_everyone(self):
+        blocking = Blocking.for_arrays(self.arrays, min_candidates=0)
+        self.assertLess(blocking.scored_pairs, blocking.all_pairs)
+        scores = blocked_score_matrix(self.arrays, blocking, tile_size=7)
+        self.assertEqual(scores.nnz, sum(len(rows) * len(cols) for rows, cols in blocking.blocks))
+        blocked = scores.toarray()
+        full = score_matrix(self.arrays)
+        scored = np.zeros(blocked.shape, dtype=bool)
+        for rows, cols in blocking.blocks:
+            scored[np.ix_(rows, cols)] = scored[np.ix_(cols, rows)] = True
+        np.fill_diagonal(scored, False)
+        np.testing.assert_array_equal(blocked[scored], full[scored])
+        np.testing.assert_array_equal(blocked[~scored], 0)
+
+    def test_workers_score_like_one_process(self):
+        blocking = Blocking.for_arrays(self.arrays, min_candidates=5)
+        np.testing.assert_array_equal(blocked_score_matrix(self.arrays, blocking, tile_size=7, workers=2).toarray(),
+                                      blocked_score_matrix(self.arrays, blocking, tile_size=7).toarray())
@@ -0,0 +1,170 @@
+import os
+import tempfile
+from collections import Counter
+
+from django.test import TestCase, override_settings
+
+from ..engine import minhash, text_index
+from ..engine.arrays import EntryArrays
+from ..engine.candidates import refresh_candidates, update_stale_candidates
+from ..engine.minhash import MinHashIndex
+from ..engine.tag_index import TagIndex
+from ..models import MatchingCandidate, MatchingEntry, MatchingTag, Tag
+from .utils import random_entries
+
+K = 5
+
+
+def candidates_table():
+    return sorted(MatchingCandidate.objects.values_list('entry_id', 'candidate_id', 'rank', 'score'))
+
+
+class StaleCandidatesTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+        self.entries = random_entries(30, seed=4)
+        refresh_candidates(k=K)
+
+    def stale(self):
+        return set(MatchingEntry.objects.filter(candidates_stale=True).values_list('pk', flat=True))
+
+    def assert_same_as_refresh(self):
+        updated = candidates_table()
+        refresh_candidates(k=K)
+        self.assertEqual(updated, candidates_table())
+
+    def test_refresh_clears_flags(self):
+        self.assertEqual(self.stale(), set())
+
+    def test_saving_flags_entry(self):
+        entry = self.entries[3]
+        entry.adventurous = 5 - entry.adventurous
+        entry.save()
+        self.assertEqual(self.stale(), {entry.pk})
+        self.assertEqual(update_stale_candidates(k=K, tile_size=4)[0], 1)
+        self.assertEqual(self.stale(), set())
+        self.assert_same_as_refresh()
+
+    def test_tags_flag_entry(self):
+        entry = self.entries[7]
+        key = (Tag.TagType.MACROGENRE, MatchingEntry.MacroGenres.choices[0][0])
+        tag_id = Tag.objects.intern([key])[key]
+        with self.captureOnCommitCallbacks(execute=True):
+            MatchingTag.objects.filter(matching_entry=entry).delete()
+            MatchingTag.objects.create(matching_entry=entry, tag_id=tag_id, describes_album=False, position=0)
+        self.assertEqual(self.stale(), {entry.pk})
+        update_stale_candidates(k=K, tile_size=4)
+        self.assert_same_as_refresh()
+
+    def test_delete_flags_whose_lists_held_entry(self):
+        # The entry on the most lists
+        entry = MatchingEntry.objects.get(pk=Counter(
+            MatchingCandidate.objects.values_list('candidate_id', flat=True)).most_common(1)[0][0])
+        listed_by = set(MatchingCandidate.objects.filter(candidate=entry).values_list('entry_id', flat=True))
+        self.assertTrue(listed_by)
+        entry.delete()
+        self.assertEqual(self.stale(), listed_by)
+        update_stale_candidates(k=K, tile_size=4)
+        self.assertFalse(MatchingCandidate.objects.filter(candidate_id=entry.pk).exists())
+        self.assert_same_as_refresh()
+
+    def test_nothing_stale(self):
+        before = candidates_table()
+        self.assertEqual(update_stale_candidates(k=K), (0, 0))
+        self.assertEqual(before, candidates_table())
+
+
+@override_settings(MATCHING_MINHASH_INDEX_PATH=None)
+class LshCandidatesTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+        minhash.set_minhash_index(None)
+        self.entries = random_entries(40, seed=6)
+
+    def test_low_recall_falls_back_to_exact(self):
+        refresh_candidates(k=K)
+        exact = candidates_table()
+        saved, _, recall = refresh_candidates(k=K, lsh_recall=1.5)
+        self.assertLessEqual(recall, 1.0)
+        self.assertEqual(exact, candidates_table())
+
+    def test_only_lsh_candidates_scored(self):
+        saved, _, recall = refresh_candidates(k=K, lsh_recall=0.0)
+        self.assertIsNotNone(recall)
+        index = MinHashIndex.from_arrays(EntryArrays.from_queryset(text=False))
+        for entry_id, candidate_id in MatchingCandidate.objects.values_list('entry_id', 'candidate_id'):
+            self.assertIn(candidate_id, index.candidates(entry_id))
+
+    def test_update_same_as_refresh(self):
+        refresh_candidates(k=K, lsh_recall=0.0)
+        entry = self.entries[2]
+        entry.minds_talking = 5 - entry.minds_talking
+        entry.save()
+        self.entries[9].delete()
+        update_stale_candidates(k=K, lsh_recall=0.0)
+        updated = candidates_table()
+        refresh_candidates(k=K, lsh_recall=0.0)
+        self.assertEqual(updated, candidates_table())
+
+    def test_update_refreshes_saved_index(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'minhash.npz')
+        with override_settings(MATCHING_MINHASH_INDEX_PATH=path):
+            # Saved with another seed, so it shows whether the index was loaded or built again
+            minhash.set_minhash_index(MinHashIndex.from_arrays(EntryArrays.from_queryset(text=False), seed=3))
+            minhash.save_minhash_index()
+            minhash.set_minhash_index(None)
+
+            entry = self.entries[4]
+            key = (Tag.TagType.MACROGENRE, MatchingEntry.MacroGenres.choices[1][0])
+            with self.captureOnCommitCallbacks(execute=True):
+                MatchingTag.objects.filter(matching_entry=entry, describes_album=True).delete()
+                MatchingTag.objects.create(matching_entry=entry, tag_id=Tag.objects.intern([key])[key],
+                                           describes_album=True, position=0)
+            self.entries[11].delete()
+            update_stale_candidates(k=K, lsh_recall=0.0)
+
+            index = minhash.get_minhash_index()
+            self.assertEqual(index.seed, 3)
+            self.assertTrue(index.changed)
+            rebuilt = MinHashIndex.from_arrays(EntryArrays.from_queryset(text=False), seed=3)
+            self.assertEqual(set(index.signatures), set(rebuilt.signatures))
+            for pk, signature in rebuilt.signatures.items():
+                self.assertEqual(index.signatures[pk].tolist(), signature.tolist())
+
+            minhash.save_minhash_index()
+            self.assertFalse(index.changed)
+            self.assertEqual(set(MinHashIndex.load(path).signatures),
+                             set(rebuilt.signatures))
+
+    def test_not_with_blocking(self):
+        with self.assertRaises(ValueError):
+            refresh_candidates(k=K, min_block_candidates=10, lsh_recall=0.5)
+
+
+class TagCandidatesTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+        self.entries = random_entries(40, seed=13)
+
+    def test_only_tag_candidates_scored(self):
+        saved, _, recall = refresh_candidates(k=K, tag_recall=0.0)
+        self.assertGreater(saved, 0)
+        index = TagIndex.build()
+        shortlists = {entry.pk: set(index.candidates(entry.pk).tolist()) for entry in self.entries}
+        for entry_id, candidate_id in MatchingCandidate.objects.values_list('entry_id', 'candidate_id'):
+            self.assertIn(candidate_id, shortlists[entry_id])
+        # Somebody's shortlist left entries out, or this proves nothing
+        self.assertLess(min(len(shortlist) for shortlist in shortlists.values()), len(self.entries) - 1)
+
+    def test_low_recall_falls_back_to_exact(self):
+        refresh_candidates(k=K)
+        exact = candidates_table()
+        saved, _, recall = refresh_candidates(k=K, tag_recall=1.5)
+        self.assertLessEqual(recall, 1.0)
+        self.assertEqual(exact, candidates_table())
+
+    def test_one_way_of_finding_candidates(self):
+        with self.assertRaises(ValueError):
+            refresh_candidates(k=K, lsh_recall=0.5, tag_recall=0.5)
@@ -0,0 +1,83 @@
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from authstuff.permissions import permission_cache
+from ..models import MatchingEntry, MatchingTag, Tag
+from ..serializers import MatchingEntrySerializer
+from .utils import WORDS, valid_entries
+
+URL = '/api/matching-entry/me'
+LIST_URL = '/api/matching-entry'
+
+
+class EntryWriteTests(TestCase):
+    def setUp(self):
+        # Every tag used below is in the vocabulary already, new tags cost two more queries to intern
+        entry = valid_entries(1)[0]
+        self.payload = {name: value for name, value in MatchingEntrySerializer(entry).data.items()
+                        if name not in ('user', 'created_at')}
+        self.many_tags = dict(self.payload, album_microgenre=list(WORDS[:10]), match_musical_elements=list(WORDS[5:]))
+        Tag.objects.intern([(Tag.TagType.MICROGENRE, word) for word in WORDS] +
+                           [(Tag.TagType.MUSICAL_ELEMENT, word) for word in WORDS])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='me'))
+
+    def tag_ids(self):
+        return set(MatchingTag.objects.filter(matching_entry__user__username='me').values_list('pk', flat=True))
+
+    def test_create_queries_whatever_the_tags(self):
+        for payload in (self.payload, self.many_tags):
+            MatchingEntry.objects.filter(user__username='me').delete()
+            # Intern the tags, insert the entry, flag its candidates, insert the tags, and the savepoint around them
+            with self.assertNumQueries(6):
+                response = self.client.post(URL, payload, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.client.get(URL).data, response.data)
+
+    def test_replace_queries_whatever_the_tags(self):
+        self.client.post(URL, self.payload, format='json')
+        for payload in (self.many_tags, self.payload):
+            # The entry and its tags, the savepoint, interning, the select and delete of the dropped tags, inserting
+            # the new ones, moving the ones kept, saving the entry and flagging its candidates
+            with self.assertNumQueries(11):
+                response = self.client.put(URL, dict(payload, album_adjectives=payload['album_adjectives'][::-1]),
+                                           format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(URL).data, response.data)
+            self.assertEqual(response.data['album_microgenre'], payload['album_microgenre'])
+
+    def test_partial_update_keeps_rows(self):
+        self.client.post(URL, self.payload, format='json')
+        before = self.tag_ids()
+        with self.assertNumQueries(8):
+            response = self.client.patch(URL, {'match_musical_elements': ['sad', 'loud']}, format='json')
+        self.assertEqual(response.data['match_musical_elements'], ['sad', 'loud'])
+        self.assertEqual(response.data['album_microgenre'], self.payload['album_microgenre'])
+        # Only the new tag is a new row
+        self.assertEqual(len(self.tag_ids() - before), 1)
+
+
+class EntryReadTests(TestCase):
+    def setUp(self):
+        permission_cache.clear()
+        self.entries = valid_entries(12, seed=3)
+        self.client = APIClient()
+
+    def test_detail_two_queries(self):
+        self.client.force_authenticate(self.entries[0].user)
+        with self.assertNumQueries(2):
+            response = self.client.get(URL)
+        self.assertEqual(response.data, MatchingEntrySerializer(self.entries[0]).data)
+
+    def test_list_two_queries_whatever_the_page_size(self):
+        matcher = User.objects.create(username='matcher')
+        matcher.user_permissions.add(Permission.objects.get(codename='is_matcher'))
+        self.client.force_authenticate(matcher)
+        # The matcher's permissions are loaded by the first request only
+        self.client.get(f'{LIST_URL}?page_size=1')
+        for page_size in (3, 12):
+            with self.assertNumQueries(2):
+                response = self.client.get(f'{LIST_URL}?page_size={page_size}')
+            self.assertEqual(response.data['results'],
+                             [MatchingEntrySerializer(entry).data for entry in self.entries[:page_size]])
@@ -0,0 +1,67 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from ..exports import export_entries, jsonl_lines
+from ..imports import import_entries
+from ..models import MatchingEntry, MatchingTag
+from .utils import valid_entries
+
+
+def exported():
+    # The import stamps entries with the time they were imported
+    rows = export_entries(chunk_size=7)
+    return list(jsonl_lines({key: value for key, value in row.items() if key != 'created_at'} for row in rows))
+
+
+class ImportTests(TestCase):
+    def test_round_trip(self):
+        valid_entries(20, seed=8)
+        lines = exported()
+        tags = MatchingTag.objects.count()
+        MatchingEntry.objects.all().delete()
+
+        result = import_entries(lines, batch_size=6)
+        self.assertEqual((result.imported, result.skipped, result.rejected), (20, 0, []))
+        self.assertEqual(MatchingTag.objects.count(), tags)
+        self.assertEqual(exported(), lines)
+
+    def test_tag_bits_in_sync(self):
+        valid_entries(10, seed=9)
+        lines = exported()
+        MatchingEntry.objects.all().delete()
+        import_entries(lines)
+        bits = list(MatchingEntry.objects.order_by('pk').values_list('album_tag_bits', 'match_tag_bits'))
+        MatchingEntry.objects.sync_tag_bits()
+        self.assertEqual(bits, list(MatchingEntry.objects.order_by('pk').values_list(
+            'album_tag_bits', 'match_tag_bits')))
+
+    def test_run_again_skips_imported(self):
+        valid_entries(5, seed=10)
+        lines = exported()
+        result = import_entries(lines)
+        self.assertEqual((result.imported, result.skipped), (0, 5))
+        self.assertEqual(exported(), lines)
+
+    def test_new_users_by_username(self):
+        valid_entries(3, seed=11)
+        records = [json.loads(line) for line in exported()]
+        MatchingEntry.objects.all().delete()
+        for number, record in enumerate(records):
+            del record['user']
+            record['username'] = f'imported{number}'
+        result = import_entries(json.dumps(record) for record in records)
+        self.assertEqual(result.imported, 3)
+        user = User.objects.get(username='imported0')
+        self.assertFalse(user.has_usable_password())
+        self.assertTrue(MatchingEntry.objects.filter(user=user).exists())
+
+    def test_invalid_lines_rejected(self):
+        valid_entries(1)
+        record = json.loads(exported()[0])
+        record['match_macrogenre'] = record['match_macrogenre'][:1]
+        lines = ['{not json', json.dumps(dict(record, user=12345)), json.dumps([1, 2]), json.dumps(record)]
+        result = import_entries(lines)
+        self.assertEqual(result.imported, 0)
+        self.assertEqual([number for number, _ in result.rejected], [1, 2, 3, 4])
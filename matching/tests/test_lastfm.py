@@ -0,0 +1,263 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+
+from ..lastfm import (AlbumCache, AlbumInfo, LastfmClient, LastfmError, TokenBucket, album_key, enrich_flagged,
+                      merge_lastfm_tags)
+from ..models import LastfmAlbum, MatchingEntry, MatchingTag, Tag
+from .utils import create_entry
+
+
+def album(name, tags=()):
+    return {'album': {'name': name, 'url': f'https://www.last.fm/music/{name}',
+                      'image': [{'size': 'small', '#text': f'https://img/{name}.png'}],
+                      'tags': {'tag': [{'name': tag} for tag in tags]}}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        server = self.server
+        with server.lock:
+            name = params['album'].strip().casefold()
+            server.requests.append((time.monotonic(), name))
+            replies = server.replies.get(name, [(200, {'error': 6, 'message': 'Album not found'}, {})])
+            status, body, headers = replies.pop(0) if len(replies) > 1 else replies[0]
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """
+    A local Last.fm: `replies[lower case album name]` are the (status, JSON body, headers) to answer with in turn,
+    the last one for every later request, and albums without replies aren't found. `requests` are the
+    (time, lower case album name) asked for.
+    """
+
+    def __init__(self, replies=None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.replies = replies or {}
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/2.0/'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubTestCase(TestCase):
+    def stub(self, replies=None):
+        server = StubServer(replies)
+        self.addCleanup(server.close)
+        return server
+
+    def lastfm_client(self, server, **options):
+        # A client per event loop, its semaphore and token bucket belong to the loop they are first used in
+        return LastfmClient('key', url=server.url, **dict({'backoff': 0.01, 'rate': 1000.0}, **options))
+
+    def album_info(self, server, name, **options):
+        async def look_up():
+            async with self.lastfm_client(server, **options) as client:
+                return await client.album_info('Artist', name), client.requests
+        return async_to_sync(look_up)()
+
+
+class ClientTests(StubTestCase):
+    def test_retries_with_backoff(self):
+        server = self.stub({'flaky': [(503, {}, {}), (200, {'error': 16, 'message': 'Try again'}, {}),
+                                      (200, album('Flaky', ['rock']), {})]})
+        info, requests = self.album_info(server, 'Flaky')
+        self.assertEqual((info.url, info.tags), ('https://www.last.fm/music/Flaky', ['rock']))
+        self.assertEqual(requests, 3)
+        # Waited a jittered 0.01s then 0.02s, doubling
+        times = [at for at, _ in server.requests]
+        self.assertGreaterEqual(times[1] - times[0], 0.01)
+        self.assertGreaterEqual(times[2] - times[1], 0.02)
+
+    def test_retry_after(self):
+        server = self.stub({'busy': [(429, {}, {'Retry-After': '1'}), (200, album('Busy'), {})]})
+        self.assertIsNotNone(self.album_info(server, 'Busy')[0])
+        times = [at for at, _ in server.requests]
+        self.assertGreaterEqual(times[1] - times[0], 1.0)
+
+    def test_gives_up(self):
+        server = self.stub({'down': [(500, {}, {})]})
+        with self.assertRaises(LastfmError):
+            self.album_info(server, 'Down', retries=2)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_not_retried(self):
+        server = self.stub({'bad key': [(200, {'error': 10, 'message': 'Invalid API key'}, {})]})
+        with self.assertRaises(LastfmError) as error:
+            self.album_info(server, 'Bad key')
+        self.assertFalse(error.exception.retryable)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_not_found(self):
+        self.assertEqual(self.album_info(self.stub(), 'Nothing'), (None, 1))
+
+    def test_rate_limited(self):
+        server = self.stub()
+
+        async def look_up():
+            async with self.lastfm_client(server, rate=20.0, concurrency=8) as client:
+                for _ in range(30):
+                    await client.album_info('Artist', 'Nothing')
+        async_to_sync(look_up)()
+        # A burst of 20, then one request every 1/20s
+        times = [at for at, _ in server.requests]
+        self.assertEqual(len(times), 30)
+        self.assertGreaterEqual(times[-1] - times[0], 9 / 20)
+
+    def test_token_bucket(self):
+        async def acquire():
+            bucket = TokenBucket(rate=50.0, capacity=1)
+            start = time.monotonic()
+            for _ in range(6):
+                await bucket.acquire()
+            return time.monotonic() - start
+        self.assertGreaterEqual(async_to_sync(acquire)(), 5 / 50)
+
+
+class EnrichTests(StubTestCase):
+    def setUp(self):
+        rock = (Tag.TagType.MACROGENRE, 'Rock')
+        self.first = create_entry('first', album_tags=[rock], album_name='Known', album_lastfm_should_rerun=True)
+        self.second = create_entry('second', album_name='known ', album_lastfm_should_rerun=True)
+        self.missing = create_entry('missing', album_name='Missing', album_lastfm_should_rerun=True)
+        self.broken = create_entry('broken', album_name='Broken', album_lastfm_should_rerun=True)
+        self.done = create_entry('done', album_name='Known')
+        for entry in (self.first, self.second):
+            entry.album_artist = 'Artist'
+            entry.save()
+
+    def enrich(self, server, cache=None, **options):
+        async def enrich():
+            async with self.lastfm_client(server, retries=1) as lastfm:
+                return await enrich_flagged(lastfm, cache=cache, **options)
+        return async_to_sync(enrich)()
+
+    def flagged(self):
+        return set(MatchingEntry.objects.filter(album_lastfm_should_rerun=True).values_list('pk', flat=True))
+
+    def lastfm_tags(self, entry):
+        return list(MatchingTag.objects.filter(matching_entry=entry, tag__tagtype=Tag.TagType.LASTFM).order_by(
+            'position').values_list('tag__name', flat=True))
+
+    def test_enrich_flagged(self):
+        server = self.stub({'known': [(200, album('Known', ['Indie', 'rock ', 'indie']), {})],
+                            'broken': [(500, {}, {})]})
+        result = self.enrich(server, cache=AlbumCache(), batch_size=3)
+        self.assertEqual((result.enriched, result.not_found, result.failed, result.changed), (2, 1, 1, 0))
+        # The two entries with the same album shared one lookup, the failed one was tried twice
+        self.assertEqual(sorted(name for _, name in server.requests), ['broken', 'broken', 'known', 'missing'])
+        self.assertEqual((result.looked_up, result.shared), (3, 1))
+
+        self.assertEqual(self.flagged(), {self.broken.pk})
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.album_lastfm_url, 'https://www.last.fm/music/Known')
+        self.assertEqual(self.first.album_image_small_url, 'https://img/Known.png')
+        self.assertEqual(self.lastfm_tags(self.first), ['indie', 'rock'])
+        self.assertEqual(self.lastfm_tags(self.second), ['indie', 'rock'])
+        self.assertEqual(self.lastfm_tags(self.done), [])
+        self.assertEqual(result.tagged, 2)
+        # Failures aren't cached, the rest is
+        self.assertEqual(LastfmAlbum.objects.count(), 2)
+
+        # The failed entry is looked up again by the next run, the others come from the cache
+        server.server.replies['broken'] = [(200, album('Broken'), {})]
+        result = self.enrich(server, cache=AlbumCache())
+        self.assertEqual((result.enriched, result.failed), (1, 0))
+        self.assertEqual(self.flagged(), set())
+
+    def test_programming_error_raised(self):
+        server = self.stub()
+
+        class BrokenClient(LastfmClient):
+            async def album_info(self, artist, album):
+                if album == 'Broken':
+                    raise TypeError('a bug')
+                return await super().album_info(artist, album)
+
+        async def enrich():
+            async with BrokenClient('key', url=server.url) as client:
+                return await enrich_flagged(client, cache=AlbumCache())
+        with self.assertRaises(TypeError):
+            async_to_sync(enrich)()
+        # Nothing of the batch was saved or cached
+        self.assertEqual(len(self.flagged()), 4)
+        self.assertEqual(LastfmAlbum.objects.count(), 0)
+
+
+class MergeTagsTests(TestCase):
+    def test_merge(self):
+        rock = (Tag.TagType.MACROGENRE, 'Rock')
+        entry = create_entry('entry', album_tags=[rock], match_tags=[(Tag.TagType.LASTFM, 'jazz')])
+        other = create_entry('other')
+        self.assertEqual(merge_lastfm_tags({entry.pk: ['indie', 'lofi', 'sad'], other.pk: []}), [entry.pk])
+        rows = {row.tag.name: row for row in MatchingTag.objects.filter(
+            matching_entry=entry, describes_album=True, tag__tagtype=Tag.TagType.LASTFM).select_related('tag')}
+
+        # Kept rows stay the same rows with their new position, the tags not given any more go
+        self.assertEqual(merge_lastfm_tags({entry.pk: ['sad', 'indie', 'folk']}), [entry.pk])
+        merged = MatchingTag.objects.filter(matching_entry=entry, describes_album=True,
+                                            tag__tagtype=Tag.TagType.LASTFM).select_related('tag')
+        self.assertEqual({row.tag.name: (row.pk, row.position) for row in merged},
+                         {'sad': (rows['sad'].pk, 0), 'indie': (rows['indie'].pk, 1),
+                          'folk': (max(row.pk for row in merged), 2)})
+        # Only reordering isn't a change of the tags
+        self.assertEqual(merge_lastfm_tags({entry.pk: ['folk', 'indie', 'sad']}), [])
+
+        # The other tags are left alone, and the bitsets follow the merge
+        self.assertEqual(set(MatchingTag.objects.filter(matching_entry=entry).exclude(
+            describes_album=True, tag__tagtype=Tag.TagType.LASTFM).values_list('tag__name', 'describes_album')),
+            {('Rock', True), ('jazz', False)})
+        entry.refresh_from_db()
+        before = bytes(entry.album_tag_bits)
+        MatchingEntry.objects.filter(pk=entry.pk).sync_tag_bits()
+        entry.refresh_from_db()
+        self.assertEqual(bytes(entry.album_tag_bits), before)
+        self.assertEqual(merge_lastfm_tags({}), [])
+
+
+class AlbumCacheTests(TestCase):
+    def test_hit_ratio(self):
+        cache = AlbumCache()
+        self.assertEqual(cache.hit_ratio, 0.0)
+        known, unknown, missing = album_key('Artist', 'Album'), album_key('Nobody', 'Nothing'), album_key('A', 'B')
+        cache.put_many({known: AlbumInfo('https://last.fm/album', {}, ['rock']), unknown: None})
+
+        found = cache.get_many([known, unknown, missing])
+        self.assertEqual(found[known].tags, ['rock'])
+        self.assertIsNone(found[unknown])
+        self.assertNotIn(missing, found)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertAlmostEqual(cache.hit_ratio, 2 / 3)
+
+    def test_evicts_least_recently_used(self):
+        cache = AlbumCache(max_size=2)
+        keys = [album_key('Artist', f'Album {i}') for i in range(3)]
+        cache.put_many({keys[0]: None})
+        cache.put_many({keys[1]: None})
+        cache.get_many([keys[0]])
+        cache.put_many({keys[2]: None})
+        self.assertEqual(set(cache.get_many(keys)), {keys[0], keys[2]})
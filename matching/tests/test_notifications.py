@@ -0,0 +1,94 @@
+import smtplib
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TransactionTestCase, override_settings
+
+from ..models import MatchingSuggestion, MatchNotification
+from ..notifications import create_notifications, dispatch_notifications, release_unknown
+from .utils import create_entry
+
+
+class Crash(BaseException):
+    """The dispatcher dying halfway, which no except clause catches."""
+
+
+class FlakyBackend(EmailBackend):
+    """The locmem backend, raising FlakyBackend.errors[address] for those recipients and noting what was saved."""
+    errors = {}
+    # For every message sent, the statuses of the notifications when it was
+    seen = []
+
+    def send_messages(self, messages):
+        for message in messages:
+            FlakyBackend.seen.append(dict(MatchNotification.objects.values_list('recipient__user__email', 'status')))
+            error = FlakyBackend.errors.get(message.to[0])
+            if error is not None:
+                raise error
+        return super().send_messages(messages)
+
+
+@override_settings(OUTBOX_EMAIL_BACKEND='matching.tests.test_notifications.FlakyBackend')
+class DispatchTests(TransactionTestCase):
+    def setUp(self):
+        FlakyBackend.errors = {}
+        FlakyBackend.seen = []
+        entries = [create_entry(f'user{i}') for i in range(6)]
+        for first, second in zip(entries[::2], entries[1::2]):
+            MatchingSuggestion.objects.create(entry_1=first, entry_2=second, score=1.0,
+                                              status=MatchingSuggestion.Status.APPROVED)
+        self.assertEqual(create_notifications(), 6)
+        # The recipients in the order they are sent in
+        self.emails = list(MatchNotification.objects.order_by('pk').values_list('recipient__user__email', flat=True))
+
+    def statuses(self):
+        return dict(MatchNotification.objects.values_list('recipient__user__email', 'status'))
+
+    def test_everyone_sent_once(self):
+        result = dispatch_notifications(workers=2, batch_size=2)
+        self.assertEqual(result.sent, 6)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         sorted(f'user{i}@example.com' for i in range(6)))
+        self.assertEqual(set(self.statuses().values()), {MatchNotification.Status.SENT})
+        self.assertEqual(create_notifications(), 0)
+        self.assertEqual(dispatch_notifications().sent, 0)
+
+    def test_saved_as_sent(self):
+        dispatch_notifications(workers=1, batch_size=6)
+        # Everything sent before a message was already saved sent
+        for i, seen in enumerate(FlakyBackend.seen):
+            self.assertEqual(sorted(seen.values()).count(MatchNotification.Status.SENT), i)
+
+    def test_crash_leaves_one_sending(self):
+        FlakyBackend.errors = {self.emails[2]: Crash()}
+        with self.assertRaises(Crash):
+            dispatch_notifications(workers=1, batch_size=6)
+        statuses = self.statuses()
+        self.assertEqual([statuses[email] for email in self.emails], [MatchNotification.Status.SENT] * 2 +
+                         [MatchNotification.Status.SENDING] * 4)
+
+        # The rest of the batch was claimed too. None of it is sent again until released, what was sent never is
+        FlakyBackend.errors = {}
+        self.assertEqual(dispatch_notifications(workers=1).sent, 0)
+        self.assertEqual(release_unknown(), 4)
+        self.assertEqual(dispatch_notifications(workers=1).sent, 4)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         sorted(f'user{i}@example.com' for i in range(6)))
+
+    def test_broken_connection_puts_rest_back(self):
+        FlakyBackend.errors = {self.emails[1]: smtplib.SMTPServerDisconnected('gone')}
+        result = dispatch_notifications(workers=1, batch_size=3)
+        self.assertEqual((result.sent, result.retried, result.failed), (4, 1, 0))
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.emails[1]], MatchNotification.Status.PENDING)
+        self.assertEqual(statuses[self.emails[2]], MatchNotification.Status.PENDING)
+        attempts = dict(MatchNotification.objects.values_list('recipient__user__email', 'attempts'))
+        self.assertEqual((attempts[self.emails[1]], attempts[self.emails[2]]), (1, 0))
+        self.assertIsNone(MatchNotification.objects.get(recipient__user__email=self.emails[2]).dispatch)
+
+    def test_permanent_failure(self):
+        FlakyBackend.errors = {'user3@example.com': smtplib.SMTPRecipientsRefused(
+            {'user3@example.com': (550, b'No such user')})}
+        result = dispatch_notifications(workers=2, batch_size=2)
+        self.assertEqual((result.sent, result.failed), (5, 1))
+        self.assertEqual(self.statuses()['user3@example.com'], MatchNotification.Status.FAILED)
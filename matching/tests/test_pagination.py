@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authstuff.permissions import permission_cache
+from ..models import MatchingEntry
+from ..pagination import KeysetPagination
+from .utils import create_entry
+
+URL = '/api/matching-entry'
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        permission_cache.clear()
+        matcher = User.objects.create(username='matcher')
+        matcher.user_permissions.add(Permission.objects.get(codename='is_matcher'))
+        self.client = APIClient()
+        self.client.force_authenticate(matcher)
+
+        for i in range(9):
+            create_entry(f'user{i}')
+        # Three runs of entries created at the same instant, so pages end in the middle of ties
+        start = timezone.now()
+        users = list(MatchingEntry.objects.order_by('pk').values_list('pk', flat=True))
+        for i, user_id in enumerate(users):
+            MatchingEntry.objects.filter(pk=user_id).update(created_at=start + timedelta(seconds=i // 3))
+        self.expected = list(MatchingEntry.objects.order_by('created_at', 'user_id').values_list('user_id', flat=True))
+
+    def walk(self, page_size):
+        seen, pages, url = [], 0, f'{URL}?page_size={page_size}&fields=user'
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(entry['user'] for entry in response.data['results'])
+            url = response.data['next']
+            pages += 1
+        return seen, pages
+
+    def test_every_page_size_sees_every_entry_once(self):
+        for page_size in range(1, 11):
+            seen, pages = self.walk(page_size)
+            self.assertEqual(seen, self.expected, f'page size {page_size}')
+            self.assertEqual(pages, max(1, -(-len(self.expected) // page_size)))
+
+    def test_ties_created_after_the_cursor(self):
+        response = self.client.get(f'{URL}?page_size=4&fields=user')
+        last = response.data['results'][-1]['user']
+        # An entry tied with the last one of the page, with a higher id, shows up on the next page
+        late = create_entry('late')
+        MatchingEntry.objects.filter(pk=late.pk).update(
+            created_at=MatchingEntry.objects.get(pk=last).created_at)
+        following = self.client.get(response.data['next'])
+        self.assertIn(late.pk, [entry['user'] for entry in following.data['results']])
+
+    def test_page_size_is_clamped(self):
+        response = self.client.get(f'{URL}?page_size=0&fields=user')
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(f'{URL}?page_size=100000&fields=user')
+        self.assertEqual(len(response.data['results']), min(KeysetPagination.max_page_size, len(self.expected)))
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('nope', KeysetPagination.encode_cursor((timezone.now(), 1))[:-4], 'WyJ4IiwgMV0='):
+            self.assertEqual(self.client.get(f'{URL}?cursor={cursor}').status_code, 404)
@@ -0,0 +1,38 @@
+import numpy as np
+from django.test import TestCase
+
+from ..engine import parallel, text_index
+from ..engine.arrays import EntryArrays
+from ..engine.candidates import top_k
+from ..engine.scoring import score_matrix
+from .utils import random_entries
+
+
+class ParallelTests(TestCase):
+    def setUp(self):
+        random_entries(30, seed=17)
+        text_index.set_text_index(text_index.TextIndex.build())
+        self.arrays = EntryArrays.from_queryset()
+
+    def test_score_matrix_same_as_one_process(self):
+        # 7 doesn't divide 30, so the last tile is a short one
+        np.testing.assert_array_equal(parallel.score_matrix(self.arrays, workers=2, tile_size=7),
+                                      score_matrix(self.arrays))
+
+    def test_map_tiles_same_as_one_process(self):
+        found = parallel.map_tiles(self.arrays, top_k, 5, workers=2, tile_size=7)
+        self.assertEqual(len(found), 5)
+        for expected, parts in zip(top_k(self.arrays, np.arange(len(self.arrays)), 5), zip(*found)):
+            np.testing.assert_array_equal(np.concatenate(parts), expected)
+
+    def test_shared_blocks_freed(self):
+        with parallel.SharedBlocks({'ids': self.arrays.ids}) as shared:
+            names = [block.name for block in shared.blocks]
+            blocks, attached = parallel.attach_blocks(shared.spec)
+            np.testing.assert_array_equal(attached['ids'], self.arrays.ids)
+            del attached
+            for block in blocks:
+                block.close()
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                parallel.shared_memory.SharedMemory(name=name)
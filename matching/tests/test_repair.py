@@ -0,0 +1,94 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..engine import text_index
+from ..engine.candidates import refresh_candidates
+from ..engine.rounds import repair_round, round_objective, save_repair, save_suggestions, solve_round
+from ..models import MatchingEntry, MatchingSuggestion
+from .utils import random_entries
+
+
+class RepairTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+        self.entries = random_entries(30, seed=14)
+        MatchingEntry.objects.update(triplet=False)
+        refresh_candidates(k=8)
+        save_suggestions(solve_round(time_budget=5.0))
+        self.suggestions = list(MatchingSuggestion.objects.all())
+
+    def groups(self):
+        return {frozenset(suggestion.entry_ids) for suggestion in MatchingSuggestion.objects.all()}
+
+    def assert_everyone_grouped_once(self):
+        grouped = [pk for group in self.groups() for pk in group]
+        self.assertEqual(sorted(grouped), sorted(MatchingEntry.objects.values_list('pk', flat=True)))
+
+    def repair(self):
+        refresh_candidates(k=8)
+        repaired = repair_round()
+        save_repair(repaired)
+        return repaired
+
+    def assert_close_to_full_solve(self):
+        # The repair keeps most of the round as it was, a full solve can only do a little better
+        full = solve_round(time_budget=5.0).objective
+        self.assertGreaterEqual(round_objective(), 0.95 * full)
+
+    def test_nothing_to_repair(self):
+        self.assertIsNone(repair_round())
+
+    def test_late_entries(self):
+        late = random_entries(2, seed=15, prefix='late')
+        MatchingEntry.objects.filter(pk__in=[entry.pk for entry in late]).update(triplet=False)
+        repaired = self.repair()
+        self.assert_everyone_grouped_once()
+        self.assertGreater(repaired.gain, 0)
+        # Only the neighbourhood of the late entries was matched again, the other suggestions stay as they were
+        self.assertLess(len(repaired.solution.arrays), MatchingEntry.objects.count())
+        kept = {suggestion.pk for suggestion in self.suggestions} - {suggestion.pk for suggestion in repaired.replaced}
+        self.assertTrue(kept)
+        self.assertLessEqual(kept, set(MatchingSuggestion.objects.values_list('pk', flat=True)))
+        self.assert_close_to_full_solve()
+
+    def test_deleted_partner(self):
+        suggestion = self.suggestions[0]
+        MatchingEntry.objects.get(pk=suggestion.entry_1_id).delete()
+        self.assertEqual(len(self.groups()), len(self.suggestions) - 1)
+        repaired = self.repair()
+        # The partner left alone joins a group, which makes a triple as the round is odd now
+        self.assert_everyone_grouped_once()
+        self.assertIn(suggestion.entry_2_id, repaired.solution.arrays.ids)
+        self.assert_close_to_full_solve()
+
+    def test_withdrawn_partners(self):
+        # Two people delete their accounts, their partners are left without a group
+        for suggestion in self.suggestions[:2]:
+            MatchingEntry.objects.get(pk=suggestion.entry_2_id).user.delete()
+        repaired = self.repair()
+        self.assertLessEqual({suggestion.entry_1_id for suggestion in self.suggestions[:2]},
+                             set(repaired.solution.arrays.ids.tolist()))
+        self.assert_everyone_grouped_once()
+        self.assert_close_to_full_solve()
+
+    def test_rejected_suggestion_matched_again(self):
+        suggestion = self.suggestions[0]
+        suggestion.status = MatchingSuggestion.Status.REJECTED
+        suggestion.save()
+        repaired = repair_round()
+        self.assertIsNotNone(repaired)
+        self.assertTrue({suggestion.entry_1_id, suggestion.entry_2_id} <= set(repaired.solution.arrays.ids.tolist()))
+
+    @override_settings(MATCHING_TEXT_INDEX_PATH=None)
+    def test_command_compares_with_full_solve(self):
+        random_entries(2, seed=16, prefix='late')
+        refresh_candidates(k=8)
+        output = io.StringIO()
+        call_command('solve_matches', repair=True, compare=True, dry_run=True, workers=1, time_budget=2.0,
+                     stdout=output)
+        self.assertIn('a full re-solve gets', output.getvalue())
+        self.assertIn('Loading the text index took', output.getvalue())
+        # A dry run saves nothing
+        self.assertEqual(len(self.groups()), len(self.suggestions))
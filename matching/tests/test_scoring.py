@@ -0,0 +1,62 @@
+import numpy as np
+from django.test import TestCase
+
+from ..engine import text_index
+from ..engine.arrays import EntryArrays
+from ..engine.scoring import parts_block, reference_score_matrix, score_block, score_matrix
+from ..models import MatchingEntry
+from .utils import create_entry, random_entries
+
+
+class ScoreMatrixTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+
+    def test_matches_reference(self):
+        random_entries(40)
+        arrays = EntryArrays.from_queryset()
+        scores = score_matrix(arrays, block_size=7)
+        reference = reference_score_matrix(text_index=text_index.get_text_index())
+        np.testing.assert_array_equal(scores, reference)
+        self.assertGreater(np.count_nonzero(scores), 0)
+
+    def test_matches_reference_without_text(self):
+        random_entries(25, seed=1)
+        np.testing.assert_array_equal(score_matrix(EntryArrays.from_queryset(text=False)), reference_score_matrix())
+
+    def test_symmetric_with_empty_diagonal(self):
+        random_entries(30, seed=2)
+        scores = score_matrix(EntryArrays.from_queryset())
+        np.testing.assert_array_equal(scores, scores.T)
+        np.testing.assert_array_equal(np.diag(scores), 0)
+
+    def test_parts_add_up(self):
+        random_entries(20, seed=3)
+        arrays = EntryArrays.from_queryset()
+        rows = np.array([0, 5, 19])
+        talk, fit, adventure = parts_block(arrays, rows)
+        np.testing.assert_array_equal(talk + fit + adventure, score_block(arrays, rows))
+        cols = np.array([2, 3, 5, 11])
+        for part, part_of_cols in zip((talk, fit, adventure), parts_block(arrays, rows, cols)):
+            np.testing.assert_array_equal(part[:, cols], part_of_cols)
+
+    def test_not_okay_scores_zero(self):
+        create_entry('talker', talkativity_preference=MatchingEntry.TalkativityPreference.PREFERS_TALKING,
+                     minds_not_talking=0)
+        create_entry('quiet', talkativity_preference=MatchingEntry.TalkativityPreference.PREFERS_RECOMMENDATION_ONLY,
+                     minds_talking=0)
+        scores = score_matrix(EntryArrays.from_queryset())
+        self.assertEqual(scores[0, 1], 0)
+
+    def test_fit_counts_wanted_tags(self):
+        jazz = ('macrogenre', 'Jazz, Soul, Neo-Soul and Funk')
+        pop = ('macrogenre', 'Pop')
+        create_entry('a', album_tags=[jazz], match_tags=[pop], adventurous=0, person_above_adventure=0)
+        create_entry('b', album_tags=[pop], match_tags=[jazz], adventurous=0, person_above_adventure=0)
+        create_entry('c', album_tags=[jazz], match_tags=[jazz], adventurous=0, person_above_adventure=0)
+        arrays = EntryArrays.from_queryset(text=False)
+        talk, fit, adventure = parts_block(arrays, np.arange(3))
+        # a and b have exactly what the other wants, a and c half of it (c gets jazz, a doesn't get pop)
+        self.assertEqual(fit[0, 1], 2)
+        self.assertEqual(fit[0, 2], 1)
+        np.testing.assert_array_equal(adventure, 0)
@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from ..engine import text_index
+from ..engine.arrays import EntryArrays
+from ..engine.rounds import solve_round
+from ..engine.snapshot import RoundSnapshot, write_snapshot
+from ..models import MatchingEntry
+from .utils import random_entries
+
+
+@override_settings(MATCHING_TEXT_INDEX_PATH=None)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        text_index.set_text_index(text_index.TextIndex.build(MatchingEntry.objects.none()))
+        random_entries(24, seed=16)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'round.snapshot')
+        self.assertEqual(write_snapshot(self.path), 24)
+        self.snapshot = RoundSnapshot(self.path)
+
+    def test_round_trip(self):
+        expected = EntryArrays.from_queryset()
+        with self.assertNumQueries(0):
+            loaded = self.snapshot.entry_arrays()
+        for name in ('ids', 'talkativity', 'minds_talking', 'minds_not_talking', 'adventurous',
+                     'person_above_adventure', 'triplet', 'album_tags', 'match_tags', 'tag_keys'):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(expected, name), err_msg=name)
+        for name, array in expected.text.arrays().items():
+            np.testing.assert_array_equal(loaded.text.arrays()[name], array, err_msg=name)
+
+        # The answers are still views of the file, the tag matrices are built in memory
+        self.assertTrue(np.shares_memory(loaded.minds_talking, self.snapshot.arrays['minds_talking']))
+        self.assertFalse(np.shares_memory(loaded.album_tags, self.snapshot._map))
+
+    def test_same_scores_as_queryset(self):
+        expected = solve_round(MatchingEntry.objects.all(), time_budget=2.0)
+        with self.assertNumQueries(0):
+            loaded = solve_round(snapshot=self.snapshot, time_budget=2.0)
+        np.testing.assert_allclose(loaded.scores, expected.scores)
@@ -0,0 +1,84 @@
+import itertools
+import time
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..engine.solver import EXACT_SIZE, FINAL_EPSILON, auction_assignment, exact_matching, max_weight_matching
+
+
+def random_weights(n, seed, zeros=0.0):
+    rng = np.random.default_rng(seed)
+    weights = np.triu(rng.random((n, n)).astype(np.float32), 1)
+    weights[rng.random((n, n)) < zeros] = 0
+    return weights + weights.T
+
+
+def brute_force(weights, nodes):
+    """The best matching of `nodes` leaving at most one alone, by trying every one."""
+    if len(nodes) < 2:
+        return 0.0
+    first, rest = nodes[0], nodes[1:]
+    options = [weights[first, other] + brute_force(weights, [node for node in rest if node != other])
+               for other in rest]
+    if len(nodes) % 2:
+        options.append(brute_force(weights, rest))
+    return max(options)
+
+
+def valid(test, pairs, unmatched, nodes):
+    matched = pairs.ravel().tolist()
+    test.assertEqual(sorted(matched + list(unmatched)), sorted(nodes))
+    test.assertLessEqual(len(unmatched), 1)
+
+
+class ExactMatchingTests(SimpleTestCase):
+    def test_optimal(self):
+        for n in range(1, 11):
+            for seed in range(5):
+                weights = random_weights(n, seed, zeros=0.3 if seed % 2 else 0.0)
+                pairs, unmatched = exact_matching(weights)
+                valid(self, pairs, unmatched, range(n))
+                total = weights[pairs[:, 0], pairs[:, 1]].astype(np.float64).sum()
+                self.assertAlmostEqual(total, brute_force(weights, list(range(n))), places=5)
+
+
+class MaxWeightMatchingTests(SimpleTestCase):
+    def test_small_rounds_are_optimal(self):
+        for n in range(2, EXACT_SIZE + 1):
+            for seed in range(4):
+                weights = random_weights(n, seed, zeros=0.4 if seed % 2 else 0.0)
+                result = max_weight_matching(weights, time_budget=5)
+                valid(self, result.pairs, result.unmatched, range(n))
+                self.assertAlmostEqual(result.objective, brute_force(weights, list(range(n))), places=5)
+
+    def test_candidates(self):
+        weights = random_weights(14, seed=7)
+        candidates = [0, 2, 3, 5, 8, 9, 13]
+        result = max_weight_matching(weights, time_budget=5, candidates=candidates)
+        valid(self, result.pairs, result.unmatched, candidates)
+        self.assertAlmostEqual(result.objective, brute_force(weights, candidates), places=5)
+
+    def test_upper_bound(self):
+        # Too big to be solved exactly, the auction's dual bound has to hold
+        n = EXACT_SIZE + 2
+        for seed in range(3):
+            weights = random_weights(n, seed)
+            result = max_weight_matching(weights, time_budget=5)
+            valid(self, result.pairs, result.unmatched, range(n))
+            best = brute_force(weights, list(range(n)))
+            self.assertLessEqual(result.objective, best + 1e-5)
+            self.assertGreaterEqual(result.upper_bound, best - 1e-5)
+            self.assertGreater(result.objective, 0.95 * best)
+
+
+class AuctionTests(SimpleTestCase):
+    def test_assignment_is_optimal(self):
+        for n in range(3, 8):
+            weights = random_weights(n, seed=n).astype(np.float64)
+            assignment, _ = auction_assignment(weights, deadline=time.perf_counter() + 5)
+            self.assertEqual(sorted(assignment.tolist()), list(range(n)))
+            self.assertTrue((assignment != np.arange(n)).all())
+            best = max(sum(weights[i, p[i]] for i in range(n)) for p in itertools.permutations(range(n))
+                       if all(p[i] != i for i in range(n)))
+            self.assertGreaterEqual(weights[np.arange(n), assignment].sum(), best - n * FINAL_EPSILON)
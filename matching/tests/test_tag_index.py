@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+import numpy as np
+from django.test import TestCase
+
+from ..engine.arrays import EntryArrays
+from ..engine.tag_index import TagIndex
+from ..models import MatchingTag
+from .utils import create_entry, random_entries
+
+ROCK = ('macrogenre', 'Rock')
+POP = ('macrogenre', 'Pop')
+WARM = ('adjective', 'Warm')
+
+
+class TagIndexTests(TestCase):
+    def setUp(self):
+        self.a = create_entry('a', album_tags=[ROCK, WARM], match_tags=[POP, WARM])
+        self.b = create_entry('b', album_tags=[POP, WARM], match_tags=[ROCK])
+        self.c = create_entry('c', album_tags=[POP], match_tags=[ROCK, WARM])
+        self.d = create_entry('d', album_tags=[ROCK], match_tags=[])
+        self.index = TagIndex.build()
+
+    def test_queries(self):
+        self.assertEqual(self.index.posting_list(*POP, True).tolist(), [self.b.pk, self.c.pk])
+        self.assertEqual(self.index.intersect([(*POP, True), (*WARM, True)]).tolist(), [self.b.pk])
+        self.assertEqual(self.index.union([(*ROCK, True), (*WARM, True)]).tolist(), [self.a.pk, self.b.pk, self.d.pk])
+        self.assertEqual(self.index.intersect([(*POP, True), ('adjective', 'Nobody has it', True)]).tolist(), [])
+        ids, counts = self.index.top_k_overlap([(*POP, True), (*WARM, True), (*ROCK, True)], 2)
+        self.assertEqual((ids.tolist(), counts.tolist()), ([self.a.pk, self.b.pk], [2, 2]))
+
+    def test_candidates(self):
+        # a wants a pop and warm album, d wants nothing but its rock album is what b and c want
+        ids, counts = self.index.candidates_for(self.a.pk)
+        self.assertEqual((ids.tolist(), counts.tolist()), ([self.b.pk, self.c.pk], [2, 1]))
+        self.assertEqual(self.index.wanted_by(self.c.pk)[0].tolist(), [self.a.pk])
+        self.assertEqual(self.index.candidates(self.d.pk).tolist(), [self.b.pk, self.c.pk])
+        self.assertEqual(self.index.candidates(12345).tolist(), [])
+
+    def test_from_arrays_same_as_build(self):
+        random_entries(20, seed=12)
+        index = TagIndex.build()
+        from_arrays = TagIndex.from_arrays(EntryArrays.from_queryset(text=False))
+        self.assertEqual(from_arrays.keys, index.keys)
+        for name in ('offsets', 'postings', 'entries', 'entry_offsets', 'entry_keys'):
+            np.testing.assert_array_equal(getattr(from_arrays, name), getattr(index, name))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tags.npz')
+            self.index.save(path)
+            loaded = TagIndex.load(path)
+        self.assertEqual(loaded.keys, self.index.keys)
+        self.assertEqual(loaded.entry_tags(self.a.pk), self.index.entry_tags(self.a.pk))
+        self.assertEqual(loaded.candidates(self.d.pk).tolist(), [self.b.pk, self.c.pk])
+
+    def test_only_queryset_indexed(self):
+        index = TagIndex.build(MatchingTag.objects.filter(matching_entry__in=[self.a, self.b]))
+        self.assertEqual(index.posting_list(*POP, True).tolist(), [self.b.pk])
+        self.assertEqual(index.entry_tags(self.c.pk), [])
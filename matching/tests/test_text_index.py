@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from ..engine import text_index
+from ..engine.arrays import EntryArrays
+from ..engine.text_index import TextIndex, save_text_index
+from ..models import MatchingEntry
+from .utils import random_entries
+
+
+class TextIndexTests(TestCase):
+    def setUp(self):
+        self.entries = random_entries(30, seed=7)
+        self.index = TextIndex.build()
+        text_index.set_text_index(self.index)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'index.npz')
+
+    def test_similarity_block_of_cols(self):
+        vectors = EntryArrays.from_queryset().text
+        rows, cols = np.array([0, 4, 17, 29]), np.array([1, 4, 9, 22, 23])
+        wanted, album = vectors.similarity_block(rows)
+        wanted_cols, album_cols = vectors.similarity_block(rows, cols)
+        np.testing.assert_array_equal(wanted_cols, wanted[:, cols])
+        np.testing.assert_array_equal(album_cols, album[:, cols])
+        self.assertEqual(vectors.similarity_block(rows, np.empty(0, dtype=np.int64))[0].shape, (4, 0))
+
+    def test_save_and_load(self):
+        self.index.save(self.path)
+        loaded = TextIndex.load(self.path)
+        self.assertEqual(loaded.terms, self.index.terms)
+        self.assertEqual(set(loaded.vectors), set(self.index.vectors))
+        # Nothing but the index is left behind
+        self.assertEqual(os.listdir(self.directory), ['index.npz'])
+
+    def test_saving_drops_deleted_entries(self):
+        deleted = self.entries[5].pk
+        self.entries[5].delete()
+        with override_settings(MATCHING_TEXT_INDEX_PATH=self.path):
+            save_text_index()
+        self.assertNotIn(deleted, self.index.vectors)
+        self.assertFalse(self.index.changed)
+        self.assertEqual(set(TextIndex.load(self.path).vectors),
+                         set(MatchingEntry.objects.values_list('pk', flat=True)))
+
+    def test_nothing_saved_unchanged(self):
+        with override_settings(MATCHING_TEXT_INDEX_PATH=self.path):
+            save_text_index()
+            os.remove(self.path)
+            save_text_index()
+        self.assertFalse(os.path.exists(self.path))
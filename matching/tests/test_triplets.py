@@ -0,0 +1,72 @@
+import itertools
+import time
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..engine.rounds import group_objective, objective
+from ..engine.triplets import absorb, form_triplets, group_score
+from .test_solver import random_weights
+
+
+def total(weights, triples):
+    return sum(group_score(weights, triple) for triple in triples)
+
+
+def swap_gains(weights, triples):
+    """The gain of every swap of two people between two triples, computed the slow way."""
+    before = total(weights, triples)
+    for t, u in itertools.combinations(range(len(triples)), 2):
+        for s, v in itertools.product(range(3), repeat=2):
+            swapped = triples.copy()
+            swapped[t, s], swapped[u, v] = triples[u, v], triples[t, s]
+            yield total(weights, swapped) - before
+
+
+class FormTripletsTests(SimpleTestCase):
+    def test_no_swap_gains_anything(self):
+        for seed in range(5):
+            weights = random_weights(20, seed)
+            members = np.arange(2, 20)
+            triples, left = form_triplets(weights, members, deadline=time.perf_counter() + 5, seed=seed)
+            self.assertEqual(sorted(triples.ravel().tolist() + left.tolist()), members.tolist())
+            self.assertEqual(len(left), 0)
+            self.assertLessEqual(max(swap_gains(weights, triples)), 1e-5)
+
+    def test_improves_on_the_random_split(self):
+        weights = random_weights(30, seed=3)
+        members = np.arange(30)
+        start, _ = form_triplets(weights, members, deadline=time.perf_counter() - 1)
+        triples, _ = form_triplets(weights, members, deadline=time.perf_counter() + 5)
+        self.assertGreater(total(weights, triples), total(weights, start))
+
+    def test_two_triples_are_optimal(self):
+        # Every split of six people is one swap away from any other, so the local optimum is the best split
+        for seed in range(10):
+            weights = random_weights(6, seed)
+            triples, _ = form_triplets(weights, np.arange(6), deadline=time.perf_counter() + 5, seed=seed)
+            best = max(group_score(weights, first) + group_score(weights, [i for i in range(6) if i not in first])
+                       for first in itertools.combinations(range(6), 3))
+            self.assertAlmostEqual(total(weights, triples), best, places=5)
+
+    def test_leftovers(self):
+        weights = random_weights(8, seed=1)
+        triples, left = form_triplets(weights, np.arange(8), deadline=time.perf_counter() + 5)
+        self.assertEqual(triples.shape, (2, 3))
+        self.assertEqual(len(left), 2)
+
+
+class GroupTests(SimpleTestCase):
+    def test_absorb(self):
+        weights = random_weights(7, seed=4)
+        pairs = np.array([[0, 1], [2, 3], [4, 5]])
+        gains = [weights[6, a] + weights[6, b] for a, b in pairs]
+        self.assertEqual(absorb(weights, pairs, 6), int(np.argmax(gains)))
+
+    def test_objective(self):
+        weights = random_weights(5, seed=5)
+        groups = [(0, 1), (2, 3, 4)]
+        # A pair counts its score, a triple half the sum of its three pairs
+        expected = weights[0, 1] + (weights[2, 3] + weights[2, 4] + weights[3, 4]) / 2
+        self.assertAlmostEqual(objective(weights, groups), expected, places=5)
+        self.assertAlmostEqual(group_objective(group_score(weights, groups[1]), 3), expected - weights[0, 1], places=5)
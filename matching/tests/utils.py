@@ -0,0 +1,73 @@
+import random
+
+from django.contrib.auth.models import User
+
+from ..models import MatchingEntry, MatchingTag, Tag
+from ..signals import tag_bits_handled
+
+WORDS = ('warm', 'fuzzy', 'guitars', 'dreamy', 'synths', 'loud', 'drums', 'quiet', 'piano', 'sad', 'epic', 'jazz',
+         'lyrics', 'summer', 'dance', 'strange', 'folk', 'noise', 'soul', 'brass')
+
+
+def create_entry(username, album_tags=(), match_tags=(), **fields):
+    """
+    An entry for a new user called `username`, with the (tagtype, name) pairs of `album_tags` and `match_tags`
+    as its tags and its tag bitsets in sync with them.
+    """
+    user = User.objects.create(username=username, email=f'{username}@example.com')
+    fields = dict({
+        'album_artist': f'Artist of {username}', 'album_name': f'Album of {username}',
+        'album_lastfm_should_rerun': False, 'album_description': '', 'artist_1_name': 'One', 'artist_2_name': 'Two',
+        'talkativity_preference': MatchingEntry.TalkativityPreference.PREFERS_TALKING,
+        'minds_talking': 3, 'minds_not_talking': 3, 'adventurous': 3, 'person_above_adventure': 3,
+        'match_description': '',
+    }, **fields)
+    ids = Tag.objects.intern(list(album_tags) + list(match_tags))
+    with tag_bits_handled():
+        entry = MatchingEntry.objects.create(user=user, **fields)
+        MatchingTag.objects.bulk_create(
+            [MatchingTag(matching_entry=entry, tag_id=ids[key], describes_album=True, position=position)
+             for position, key in enumerate(album_tags)] +
+            [MatchingTag(matching_entry=entry, tag_id=ids[key], describes_album=False, position=position)
+             for position, key in enumerate(match_tags)])
+    MatchingEntry.objects.filter(pk=entry.pk).sync_tag_bits()
+    entry.refresh_from_db()
+    return entry
+
+
+def random_entries(n, seed=0, prefix='user'):
+    """`n` entries with random answers, tags out of a small vocabulary and texts out of WORDS."""
+    rng = random.Random(seed)
+    genres = [(Tag.TagType.MACROGENRE, value) for value, _ in MatchingEntry.MacroGenres.choices]
+    adjectives = [(Tag.TagType.ADJECTIVE, value) for value in MatchingEntry.ADJECTIVE_CHOICES[:8]]
+    talkativity = [value for value, _ in MatchingEntry.TalkativityPreference.choices]
+    return [create_entry(
+        f'{prefix}{i}',
+        album_tags=rng.sample(genres, 1) + rng.sample(adjectives, rng.randint(0, 3)),
+        match_tags=rng.sample(genres, rng.randint(0, 2)) + rng.sample(adjectives, rng.randint(0, 2)),
+        talkativity_preference=rng.choice(talkativity),
+        minds_talking=rng.randint(0, 5), minds_not_talking=rng.randint(0, 5),
+        adventurous=rng.randint(0, 5), person_above_adventure=rng.randint(0, 5),
+        triplet=rng.random() < 0.3,
+        album_description=' '.join(rng.choices(WORDS, k=rng.randint(0, 6))),
+        match_description=' '.join(rng.choices(WORDS, k=rng.randint(0, 4))),
+        what_get_out=' '.join(rng.choices(WORDS, k=rng.randint(0, 2))),
+    ) for i in range(n)]
+
+
+def valid_entries(n, seed=0):
+    """`n` entries which pass MatchingEntrySerializer's validation, with every kind of tag."""
+    rng = random.Random(seed)
+    genres = [value for value, _ in MatchingEntry.MacroGenres.choices]
+    entries = []
+    for i in range(n):
+        album_tags = [(Tag.TagType.MACROGENRE, rng.choice(genres)), (Tag.TagType.COUNTRY, rng.choice(('UK', 'Peru'))),
+                      *((Tag.TagType.ADJECTIVE, value) for value in rng.sample(MatchingEntry.ADJECTIVE_CHOICES, 2)),
+                      *((Tag.TagType.MICROGENRE, value) for value in rng.sample(WORDS, rng.randint(0, 2)))]
+        match_tags = [*((Tag.TagType.MACROGENRE, value) for value in rng.sample(genres, rng.randint(2, 4))),
+                      *((Tag.TagType.LANGUAGE, value) for value in rng.sample(('English', 'Spanish'), 1)),
+                      *((Tag.TagType.MUSICAL_ELEMENT, value) for value in rng.sample(WORDS, rng.randint(0, 3)))]
+        entries.append(create_entry(f'user{i}', album_tags, match_tags, minds_talking=rng.randint(0, 5),
+                                    album_description=' '.join(rng.choices(WORDS, k=4)),
+                                    match_description=' '.join(rng.choices(WORDS, k=3)), triplet=rng.random() < 0.5))
+    return entries
@@ -1,9 +1,12 @@
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
-# from . import views
+from . import views
 
 urlpatterns = [
-    #    path('api/matching-entry/me', views.MyMatchingEntryDetail.as_view())
+    path('api/matching-entry/me', views.MyMatchingEntryDetail.as_view()),
+    path('api/matching-entry', views.MatchingEntryList.as_view()),
+    path('api/matching-entry/export', views.MatchingEntryExport.as_view()),
+    path('api/matching-entry/<int:user_id>/candidates', views.MatchingCandidateList.as_view())
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -0,0 +1,25 @@
+from rest_framework import serializers
+
+
+class ListOfStringsValidator:
+    """
+    Checks a list field holds at least `min_items` strings, all of them in `choices` if given.
+    `choices` can be plain values or (value, label) pairs like a TextChoices' choices.
+    """
+
+    def __init__(self, message, name, choices=None, min_items=0):
+        self.message = message
+        self.name = name
+        self.choices = None if choices is None else {
+            choice[0] if isinstance(choice, (list, tuple)) else choice for choice in choices
+        }
+        self.min_items = min_items
+
+    def __call__(self, value):
+        if not isinstance(value, list) or len(value) < self.min_items \
+                or not all(isinstance(item, str) for item in value):
+            raise serializers.ValidationError(self.message)
+        if self.choices is not None:
+            invalid = [item for item in value if item not in self.choices]
+            if invalid:
+                raise serializers.ValidationError(f'"{invalid[0]}" is not a valid {self.name}.')
@@ -1,13 +1,26 @@
-from .models import MatchingEntry
-from .serializers import MatchingEntrySerializer
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
+
+from parallel_peaks_back.async_views import AsyncViewMixin
+from .engine.candidates import CANDIDATES_PER_ENTRY
+from .exports import export_entries, export_fields
+from .models import MatchingCandidate, MatchingEntry, MatchingTag
+from .pagination import KeysetPagination
+from .permissions import IsMatcher, IsModerator
+from .renderers import CSVRenderer, JSONLinesRenderer
+from .serializers import MatchingCandidateSerializer, MatchingEntrySerializer, MatchingEntryFilterSerializer
 from rest_framework import generics, mixins, permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.views import APIView
 
 
-class MyMatchingEntryDetail(mixins.CreateModelMixin,
+class MyMatchingEntryDetail(AsyncViewMixin,
+                          mixins.CreateModelMixin,
                           mixins.RetrieveModelMixin,
+                          mixins.UpdateModelMixin,
                           mixins.DestroyModelMixin,
                           generics.GenericAPIView):
-    queryset = MatchingEntry.objects.all()
+    queryset = MatchingEntry.objects.with_tags()
     serializer_class = MatchingEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -17,6 +30,12 @@ class MyMatchingEntryDetail(mixins.CreateModelMixin,
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
+    def put(self, request, *args, **kwargs):
+        return self.update(request, *args, **kwargs)
+
+    def patch(self, request, *args, **kwargs):
+        return self.partial_update(request, *args, **kwargs)
+
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
@@ -27,3 +46,84 @@ class MyMatchingEntryDetail(mixins.CreateModelMixin,
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+class MatchingEntryList(AsyncViewMixin, generics.ListAPIView):
+    """
+    Every matching entry, for matchers to browse when making suggestions.
+    Filter with tag, talkativity_preference, adventurous_min and adventurous_max, pick the fields to return with fields.
+    """
+    serializer_class = MatchingEntrySerializer
+    pagination_class = KeysetPagination
+    permission_classes = [permissions.IsAuthenticated, IsMatcher]
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            serializer = MatchingEntryFilterSerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            self._filters = serializer.validated_data
+        return self._filters
+
+    def get_queryset(self):
+        filters = self.get_filters()
+        queryset = MatchingEntry.objects.all()
+
+        for name in filters.get('tag', []):
+            queryset = queryset.filter(Exists(MatchingTag.objects.filter(
+                matching_entry=OuterRef('pk'), describes_album=True, tag__name=name)))
+        if 'talkativity_preference' in filters:
+            queryset = queryset.filter(talkativity_preference__in=filters['talkativity_preference'])
+        if 'adventurous_min' in filters:
+            queryset = queryset.filter(adventurous__gte=filters['adventurous_min'])
+        if 'adventurous_max' in filters:
+            queryset = queryset.filter(adventurous__lte=filters['adventurous_max'])
+
+        fields = filters.get('fields')
+        if fields is None or set(fields) & MatchingEntrySerializer().tag_fields().keys():
+            queryset = queryset.with_tags()
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_filters().get('fields'))
+        return super().get_serializer(*args, **kwargs)
+
+
+class MatchingCandidateList(AsyncViewMixin, generics.ListAPIView):
+    """
+    The best candidates for the entry of the user `user_id`, with their scores broken down, read from the
+    candidates table the matching engine keeps up to date. Pass limit to get fewer of them.
+    """
+    serializer_class = MatchingCandidateSerializer
+    permission_classes = [permissions.IsAuthenticated, IsMatcher]
+
+    def get_queryset(self):
+        try:
+            limit = min(max(int(self.request.query_params['limit']), 1), CANDIDATES_PER_ENTRY)
+        except (KeyError, ValueError):
+            limit = CANDIDATES_PER_ENTRY
+        return MatchingCandidate.objects.filter(entry__user_id=self.kwargs['user_id']).select_related(
+            'candidate').only('rank', 'score', 'talk', 'fit', 'adventure', 'candidate__user_id',
+                              'candidate__album_artist', 'candidate__album_name')[:limit]
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data and not MatchingEntry.objects.filter(user_id=self.kwargs['user_id']).exists():
+            raise NotFound('This user has no matching entry.')
+        return response
+
+
+class MatchingEntryExport(APIView):
+    """
+    Every entry with its tags, as JSON lines (export.jsonl, the default) or CSV (export.csv). The file is streamed
+    while the entries are read a chunk at a time, so exporting a big table neither fills the worker's memory
+    nor waits for the whole file before sending the first byte.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsModerator]
+    renderer_classes = [JSONLinesRenderer, CSVRenderer]
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(renderer.stream(export_entries(), export_fields()),
+                                         content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="matching-entries.{renderer.format}"'
+        return response
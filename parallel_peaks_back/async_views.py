@@ -0,0 +1,63 @@
+"""
+Async versions of DRF views, for serving over ASGI. DRF has no async views and Django 3.2 no async ORM, so the views
+stay sync and only their entry point is a coroutine.
+
+Over ASGI Django 3.2 runs sync views on one shared thread, a request at a time, rendering included. The views with
+AsyncViewMixin hand the whole request (authentication, queries and rendering) to a pool of
+settings.ASYNC_VIEW_THREADS threads instead, so that many run at once while the event loop keeps accepting requests.
+Each pool thread keeps its own database connection and closes it when it's too old, like Django does at the end of
+a sync request, so there are never more connections than threads.
+
+The views are only made async with settings.ASYNC_VIEWS on (asgi.py turns it on), over WSGI they stay plain sync
+views rather than paying for an event loop per request.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_VIEW_THREADS, thread_name_prefix='async-view')
+    return _executor
+
+
+def _respond(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # Rendered here, Django would render it on its shared thread
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+async def run_view(view, request, *args, **kwargs):
+    """Respond to a request with a sync view, on the pool."""
+    call = functools.partial(contextvars.copy_context().run, _respond, view, request, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+class AsyncViewMixin:
+    """For APIViews, answers requests from the pool when settings.ASYNC_VIEWS is on."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            return await run_view(view, request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        return async_view
@@ -0,0 +1,185 @@
+"""
+Load the API in process through the WSGI and the ASGI application side by side, with many requests in flight at
+once, and compare their throughput and latency. Each server runs in its own process.
+
+Run it from the project directory, as the user to send the requests as (with their token):
+
+    python -m parallel_peaks_back.benchmark_servers someone --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import django
+import numpy as np
+
+SERVERS = {
+    # Server: (description, whether the views are async)
+    'wsgi': ('WSGI', False),
+    'asgi-sync': ('ASGI with the views sync', False),
+    'asgi': ('ASGI with the views async', True),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('username', help='The user to send the requests as (with their token).')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='A path to request, repeat it to request several in turn '
+                             '(default /api/auth/user and /api/matching-entry/me).')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='How many requests to send to each server (default 2000).')
+    parser.add_argument('--concurrency', type=int, default=200,
+                        help='How many requests are in flight at once (default 200).')
+    parser.add_argument('--wsgi-threads', type=int, default=8,
+                        help='How many threads the WSGI server answers with (default 8).')
+    parser.add_argument('--query-latency', type=float, default=0.0,
+                        help='Milliseconds to add to every query, for the round trip to a database server '
+                             '(default 0).')
+    parser.add_argument('--server', choices=SERVERS,
+                        help='Only load this server in this process, and print its results as JSON.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'parallel_peaks_back.settings')
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    user = User.objects.filter(username=options.username).first()
+    if user is None:
+        sys.exit(f'There is no user called {options.username}.')
+    token, _ = Token.objects.get_or_create(user=user)
+    paths = options.paths or ['/api/auth/user', '/api/matching-entry/me']
+    if options.server is not None:
+        print(json.dumps(load(options.server, token.key, paths, options)))
+        return
+
+    print(f'{options.requests} requests to {", ".join(paths)}, {options.concurrency} in flight, '
+          f'{options.wsgi_threads} WSGI threads, {settings.ASYNC_VIEW_THREADS} async view threads, '
+          f'{options.query_latency:g}ms per query')
+    for server, (description, async_views) in SERVERS.items():
+        results = run_child(server, async_views, options, settings.BASE_DIR)
+        print(f'{description}: {results["rate"]:.0f} requests/s, latency p50 {results["p50"]:.1f}ms, '
+              f'p99 {results["p99"]:.1f}ms, max {results["max"]:.1f}ms, {results["errors"]} errors')
+
+
+def run_child(server, async_views, options, base_dir):
+    command = [sys.executable, '-m', __spec__.name, options.username,
+               '--server', server, '--requests', str(options.requests),
+               '--concurrency', str(options.concurrency), '--wsgi-threads', str(options.wsgi_threads),
+               '--query-latency', str(options.query_latency)]
+    for path in options.paths or []:
+        command += ['--path', path]
+    env = dict(os.environ, DJANGO_ASYNC_VIEWS='1' if async_views else '0')
+    output = subprocess.run(command, cwd=base_dir, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def load(server, key, paths, options):
+    if options.query_latency:
+        _add_query_latency(options.query_latency / 1000)
+    requests = [paths[i % len(paths)] for i in range(options.requests)]
+    headers = {'HTTP_AUTHORIZATION': f'Token {key}', 'HTTP_HOST': 'localhost'}
+    # One request first, so startup isn't timed
+    if server == 'wsgi':
+        latencies, statuses = _load_wsgi(requests[:1], headers, 1, 1)
+        start = time.perf_counter()
+        latencies, statuses = _load_wsgi(requests, headers, options.concurrency, options.wsgi_threads)
+    else:
+        latencies, statuses = asyncio.run(_load_asgi(requests[:1], headers, 1))
+        start = time.perf_counter()
+        latencies, statuses = asyncio.run(_load_asgi(requests, headers, options.concurrency))
+    seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {'rate': len(requests) / seconds, 'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99)), 'max': float(latencies.max()),
+            'errors': sum(status >= 400 for status in statuses)}
+
+
+def _add_query_latency(seconds):
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def add(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(add, weak=False)
+
+
+_wsgi_application = None
+
+
+def _load_wsgi(paths, headers, concurrency, threads):
+    """Every request from `concurrency` clients, queued for `threads` threads like a threaded WSGI server."""
+    global _wsgi_application
+    if _wsgi_application is None:
+        from django.core.wsgi import get_wsgi_application
+        _wsgi_application = get_wsgi_application()
+    latencies, statuses = [], []
+
+    def respond(path):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+                   'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': BytesIO(),
+                   'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr, 'wsgi.multithread': True, **headers}
+        status = []
+        b''.join(_wsgi_application(environ, lambda line, response_headers: status.append(line)))
+        return int(status[0].split()[0])
+
+    with ThreadPoolExecutor(max_workers=threads) as server:
+        def request(path):
+            start = time.perf_counter()
+            statuses.append(server.submit(respond, path).result())
+            latencies.append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            list(clients.map(request, paths))
+    return latencies, statuses
+
+
+async def _load_asgi(paths, headers, concurrency):
+    """Every request from `concurrency` clients, answered by the ASGI application on this event loop."""
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+    scope_headers = [(b'authorization', headers['HTTP_AUTHORIZATION'].encode()), (b'host', b'localhost')]
+    latencies, statuses = [], []
+    queue = list(reversed(paths))
+
+    async def client():
+        while queue:
+            path = queue.pop()
+            start = time.perf_counter()
+            scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                     'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                     'root_path': '', 'headers': scope_headers, 'client': ('127.0.0.1', 0),
+                     'server': ('localhost', 80)}
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await application(scope, receive, send)
+            latencies.append(time.perf_counter() - start)
+            statuses.append(next(message['status'] for message in messages if message['type'] == 'http.response.start'))
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 from dotenv import load_dotenv
@@ -74,6 +75,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'parallel_peaks_back.urls'
 
+# Serve the views with AsyncViewMixin from a pool of ASYNC_VIEW_THREADS threads, asgi.py turns it on
+ASYNC_VIEWS = os.getenv('DJANGO_ASYNC_VIEWS') == '1'
+ASYNC_VIEW_THREADS = 16
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -100,9 +105,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than SQLite's in-memory database, where threads writing at once fail with "table is locked"
+        # instead of waiting their turn (the notification dispatch tests send from several threads)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Where the matching engine keeps the TF-IDF vectors of the entries' texts (see matching.engine.text_index)
+# and the MinHash signatures of their tags (see matching.engine.minhash)
+MATCHING_TEXT_INDEX_PATH = BASE_DIR / 'matching_text_index.npz'
+MATCHING_MINHASH_INDEX_PATH = BASE_DIR / 'matching_minhash_index.npz'
+
+# Last.fm API access for the album enrichment worker (manage.py enrich_lastfm)
+LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
+LASTFM_API_URL = os.getenv("LASTFM_API_URL", "https://ws.audioscrobbler.com/2.0/")
+
 AUTHENTICATION_BACKENDS = [
     # `allauth` specific authentication methods, such as login by e-mail
     'allauth.account.auth_backends.AuthenticationBackend',
@@ -161,16 +178,29 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication'
+        'authstuff.authentication.CachedTokenAuthentication'
     ]
 }
 
+# Tokens are cached for AUTH_TOKEN_CACHE_TTL seconds, in this process or in AUTH_TOKEN_SHARED_CACHE if set
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_SHARED_CACHE = None
+# Users' permission snapshots, see authstuff.permissions. They are cached for AUTH_PERMISSION_CACHE_TTL seconds, in
+# this process or in AUTH_PERMISSION_SHARED_CACHE if set. Without a shared cache a permission change only reaches the
+# process it was made in at once, the others see it when their snapshot expires
+AUTH_PERMISSION_CACHE_SIZE = 10000
+AUTH_PERMISSION_CACHE_TTL = 300
+AUTH_PERMISSION_SHARED_CACHE = None
+
 # Rest Auth
 
 REST_AUTH_SERIALIZERS = {
     'TOKEN_SERIALIZER': 'authstuff.serializers.LoginResponseSerializer',
     'REGISTER_SERIALIZER': 'authstuff.serializers.RegisterSerializer',
-    'LOGIN_SERIALIZER': 'authstuff.serializers.LoginSerializer'
+    'LOGIN_SERIALIZER': 'authstuff.serializers.LoginSerializer',
+    'PASSWORD_CHANGE_SERIALIZER': 'authstuff.serializers.PasswordChangeSerializer',
+    'PASSWORD_RESET_CONFIRM_SERIALIZER': 'authstuff.serializers.PasswordResetConfirmSerializer',
 }
 
 REST_SESSION_LOGIN = False
@@ -186,7 +216,13 @@ ACCOUNT_AUTHENTICATION_METHOD = 'username'
 ACCOUNT_EMAIL_REQUIRED = True
 ACCOUNT_EMAIL_VERIFICATION = 'mandatory'
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# E-mails are queued in the outbox (see authstuff.mail) and sent with OUTBOX_EMAIL_BACKEND by the send_outbox command
+EMAIL_BACKEND = 'authstuff.mail.OutboxEmailBackend'
+OUTBOX_EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+OUTBOX_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubling after each
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_DEDUPE_WINDOW = timedelta(minutes=3)
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/